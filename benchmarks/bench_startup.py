@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+#
+# Measures interpreter start-up and import time of differannotate in fresh
+# processes, and which heavy back-ends get imported along the way.
+#
+# python benchmarks/bench_startup.py [-n 10]
+###############################################################################
+
+import argparse, json, os, subprocess, sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('matplotlib', 'matplotlib_venn', 'pysam')
+
+SNIPPETS = {
+	'python':"pass",
+	'import':"import differannotate",
+	'help':"import sys; sys.argv=['differannotate','--help']\n"+\
+		"import differannotate\ntry: differannotate.main()\nexcept SystemExit: pass",
+}
+PROBE = "\nimport sys, json, time\nsys.stderr.write(json.dumps([time.time()-T0]+[m in sys.modules for m in %s])+'\\n')"%(repr(HEAVY))
+
+def time_snippet(name, repeat=10):
+	'''
+	Runs a snippet in fresh interpreters
+
+	# Returns
+	float: median seconds from interpreter start to the end of the snippet
+	list: heavy modules imported by the snippet
+	'''
+	code = "import time; T0=time.time()\n"+SNIPPETS[name]+PROBE
+	times, imported = [], set()
+	env = dict(os.environ, PYTHONPATH=REPO)
+	for i in range(repeat):
+		p = subprocess.Popen([sys.executable, '-c', code], env=env, \
+			stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		out, err = p.communicate()
+		ret = json.loads(err.decode('utf-8').strip().split('\n')[-1])
+		times.append(ret[0])
+		imported |= set([m for m, loaded in zip(HEAVY, ret[1:]) if loaded])
+	return sorted(times)[len(times)//2], sorted(imported)
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark differannotate start-up")
+	parser.add_argument('-n', metavar='INT', help='Repetitions [%(default)s]', type=int, default=10)
+	args = parser.parse_args()
+	template = "{:<8} {:>10} {}"
+	print(template.format("Snippet", "Seconds", "Heavy imports"))
+	for name in ('python', 'import', 'help'):
+		seconds, imported = time_snippet(name, args.n)
+		print(template.format(name, "%.4f"%(seconds), ','.join(imported) if imported else '-'))
+
+if __name__ == "__main__":
+	main()
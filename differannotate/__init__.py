@@ -39,10 +39,17 @@ import argparse, sys, logging, os
 from differannotate.constants import FORMAT
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format=FORMAT)
-from differannotate.argValidators import fileCheck, argChecker
-from differannotate import reader, summaries
+from differannotate.argValidators import fileCheck, argChecker, sizeCheck
+from differannotate import reader, comparisons, summaries, allvsall, transcripts, planner, store, export, sampling, windows, bootstrap
+from differannotate.api import compare
 
 def main():
+	if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+		from differannotate import server
+		return server.main(sys.argv[2:])
+	if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+		from differannotate import batch
+		return batch.main(sys.argv[2:])
 	fCheck = fileCheck() #class for checking parameters
 	parser = argparse.ArgumentParser(description="A tool for comparing GFF3 annotations")
 	parser.add_argument('-C', '--control', metavar='GFF3', help='Control GFF3. All comparisons are relative to this annotation.', required=True, type=fCheck.gff3)
@@ -57,12 +64,55 @@ def main():
 		type=str, required=True, nargs='+')
 	parser.add_argument('-p', '--percent', metavar='INT', \
 		help='Reciprocal percent overlap threshold [%(default)s]', type=int, default=90)
+	parser.add_argument('--tolerance', metavar='INT', type=int, \
+		help='Match features whose starts and ends are within this many bases')
+	parser.add_argument('--criterion', metavar='STR', \
+		help='Region matching criterion (percent|tolerance|both) [tolerance with --tolerance, otherwise percent]', \
+		type=argChecker(comparisons.match_criterion.CRITERIA, 'matching criterion').check)
+	parser.add_argument('--matching', metavar='STR', default='greedy', \
+		help='Pair matching region features greedily or with the most pairs (greedy|optimal|optimal-overlap) [%(default)s]', \
+		type=argChecker(comparisons.match_criterion.MATCHINGS, 'matching').check)
 	parser.add_argument('--plot', action="store_true", help="Plot venn diagrams of results")
 	parser.add_argument('-e', '--ext', metavar='EXT', \
 		help='Figure extension [%(default)s]', default='png', \
 		type=argChecker(('pdf','png','eps'),'figure extension').check)
 	parser.add_argument('-v', '--verbose', action="store_true", help='Enable verbose logging')
 	parser.add_argument('--temd', action="store_true", help='Analyze TE metadata')
+	parser.add_argument('--all-vs-all', action="store_true", \
+		help='Compare every pair of annotations instead of comparing against the control')
+	parser.add_argument('--sample-bases', metavar='INT', type=int, \
+		help='Preview base pair metrics with confidence intervals from this many sampled positions')
+	parser.add_argument('--seed', metavar='INT', type=int, help='Random seed for sampling and bootstrap replicates')
+	parser.add_argument('--bootstrap', metavar='INT', type=int, \
+		help='Print genome-wide region metrics with confidence intervals from this many bootstrap replicates')
+	parser.add_argument('--bootstrap-block', metavar='BLOCK', type=bootstrap.block_type, \
+		help='Resample features, whole chromosomes (chrom), or blocks of this many bases [feature]')
+	parser.add_argument('--window', metavar='SIZE', type=int, \
+		help='Write sliding-window agreement tracks of this size instead of tables')
+	parser.add_argument('--step', metavar='STEP', type=int, help='Distance between windows [SIZE]')
+	parser.add_argument('--export-dir', metavar='DIR', \
+		help='Write TP, FP, and FN region features of every treatment to this directory')
+	parser.add_argument('--export-format', metavar='FMT', help='Format of exported features [%(default)s]', \
+		default='bed', type=argChecker(export.FORMATS, 'export format').check)
+	parser.add_argument('--features', metavar='STR', nargs='+', \
+		help='Only index these feature types (e.g. transposable_element gene)')
+	parser.add_argument('--exclude-features', metavar='STR', nargs='+', \
+		help='Skip these feature types (e.g. exon cds protein)')
+	parser.add_argument('--chroms', metavar='STR', nargs='+', help='Only analyze these chromosomes')
+	parser.add_argument('--transcripts', action="store_true", \
+		help='Compare transcript exon, intron, and CDS chains built from Parent attributes')
+	parser.add_argument('--chain-tolerance', metavar='INT', \
+		help='Maximum boundary difference for fuzzy transcript chain matches [%(default)s]', type=int, default=0)
+	parser.add_argument('--procs', metavar='INT', help='Worker processes for parsing and comparisons [%(default)s]', type=int, default=1)
+	parser.add_argument('--max-memory', metavar='SIZE', \
+		help='Memory budget (e.g. 8G) used to pick dense, tiled, or interval base pair strategies and workers', \
+		type=sizeCheck().check)
+	parser.add_argument('--store', metavar='DIR', \
+		help='Store per-chromosome results and only recompute chromosomes whose content changed')
+	parser.add_argument('--checkpoint', metavar='DIR', \
+		help='Record every finished chromosome and feature category in this directory')
+	parser.add_argument('--resume', action="store_true", \
+		help='Skip the units already recorded in --checkpoint')
 	args = parser.parse_args()
 	################################
 	# Configure logging
@@ -78,21 +128,79 @@ def main():
 	if len(args.names) != len(args.treat):
 		logger.error("treat(%i) != names(%i)"%(len(args.treat), len(args.names)))
 		raise ValueError
+	if args.resume and not args.checkpoint:
+		logger.error("--resume requires --checkpoint")
+		raise ValueError
+	if args.criterion in ('tolerance', 'both') and args.tolerance is None:
+		logger.error("--criterion %s requires --tolerance"%(args.criterion))
+		raise ValueError
+	match = comparisons.match_criterion(args.percent, args.tolerance, args.criterion, args.matching)
 	################################
 	# Create GFF3 intervals
 	################################
-	GI = reader.gff3_interval(args.control, name=args.cname, fasta=args.reference)
-	for f, n in zip(args.treat, args.names):
-		GI.add_gff3(f, n)
+	monitor = planner.stage_monitor()
+	with monitor.stage('parse'):
+		GI = reader.gff3_interval(args.control, name=args.cname, fasta=args.reference, \
+			chains=args.transcripts, digests=bool(args.store or args.checkpoint), features=args.features, \
+			exclude_features=args.exclude_features, chroms=args.chroms, offsets=bool(args.export_dir), \
+			treatments=zip(args.treat, args.names), procs=args.procs)
+	if not GI.element_dict or not GI.get_chrom_set():
+		filters = ['--%s %s'%(opt.replace('_', '-'), ' '.join(getattr(args, opt))) \
+			for opt in ('features', 'exclude_features', 'chroms') if getattr(args, opt)]
+		if filters:
+			logger.error("No features shared by every annotation pass %s"%(' and '.join(filters)))
+		else:
+			logger.error("No features are shared by every annotation")
+		raise ValueError
+	fig_ext = args.ext if args.plot else False
+	rstore = store.result_store(args.store, GI) if args.store else None
+	checkpoint = store.checkpoint(args.checkpoint, GI, args.resume, fig_ext=fig_ext) if args.checkpoint else None
+	exporter = export.feature_exporter(args.export_dir, GI, args.export_format) if args.export_dir else None
 	################################
 	# Generate results
 	################################
-	fig_ext = args.ext if args.plot else False
-	if args.reference:
-		logger.info("Basepair resolution results")
-		summaries.tabular(GI, fig_ext=fig_ext, temd=args.temd)
-	logger.info("Interval results")
-	summaries.tabular_region(GI, p=args.percent, fig_ext=fig_ext, temd=args.temd)
+	if args.all_vs_all:
+		plan = planner.plan(GI, args.max_memory, args.procs, rows=2)
+		logger.info("All-vs-all results")
+		with monitor.stage('all-vs-all', plan.strategy):
+			allvsall.tabular(GI, p=match, fig_ext=fig_ext, temd=args.temd, plan=plan)
+	elif args.window:
+		logger.info("Sliding-window tracks")
+		with monitor.stage('windows'):
+			files = windows.tracks(GI, args.window, args.step, temd=args.temd)
+		logger.info("Wrote %i track files"%(len(files)))
+	elif args.sample_bases:
+		if not args.reference:
+			logger.warn("Chromosome lengths are estimated from the annotations without a reference")
+		logger.info("Sampled basepair estimates")
+		with monitor.stage('sample'):
+			sampling.tabular(GI, args.sample_bases, seed=args.seed, temd=args.temd)
+	else:
+		if args.reference:
+			plan = planner.plan(GI, args.max_memory, args.procs)
+			logger.info("Basepair resolution results")
+			with monitor.stage('base', plan.strategy):
+				summaries.tabular(GI, fig_ext=fig_ext, temd=args.temd, plan=plan, store=rstore, checkpoint=checkpoint)
+		logger.info("Interval results")
+		with monitor.stage('region'):
+			summaries.tabular_region(GI, p=match, fig_ext=fig_ext, temd=args.temd, store=rstore, exporter=exporter, checkpoint=checkpoint)
+		if exporter:
+			exporter.close()
+			logger.info("Exported features to %s"%(args.export_dir))
+		if rstore:
+			rstore.summary()
+		if checkpoint:
+			checkpoint.summary()
+		if args.bootstrap:
+			logger.info("Bootstrap region results")
+			with monitor.stage('bootstrap'):
+				bootstrap.tabular(GI, args.bootstrap, p=match, temd=args.temd, block=args.bootstrap_block, \
+					seed=args.seed, procs=args.procs)
+		if args.transcripts:
+			logger.info("Transcript results")
+			with monitor.stage('transcripts'):
+				transcripts.tabular(GI, tol=args.chain_tolerance, p=args.percent)
+	monitor.report(logging.INFO if args.max_memory else logging.DEBUG)
 	logger.info("Done")
 
 if __name__ == "__main__":
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+import logging
+import numpy as np
+from time import time
+from differannotate.constants import FORMAT
+from differannotate import comparisons, summaries, results
+from differannotate.lazy import plt, mp
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+LEVELS = ('region', 'base')
+METRICS = ('jaccard', 'f1', 'sensitivity', 'precision')
+
+class pairwise_result(object):
+	'''
+	Pairwise agreement between every pair of annotations
+
+	# Attributes
+	names (list): Annotation names
+	counts (dict): {(level, strand, category, feature): np.ndarray (N, N, 3)}
+		of (Ab, aB, AB) counts, where row i is the reference and column j
+		is compared against it
+	'''
+	def __init__(self, names):
+		self.names = list(names)
+		self.counts = {}
+	def _get(self, key):
+		C = self.counts[tuple(key)].astype(np.float64)
+		return C[:,:,0], C[:,:,1], C[:,:,2]
+	def _div(self, num, den):
+		with np.errstate(divide='ignore', invalid='ignore'):
+			return num/den
+	def jaccard(self, key):
+		Ab, aB, AB = self._get(key)
+		return self._div(AB, Ab+aB+AB)
+	def f1(self, key):
+		Ab, aB, AB = self._get(key)
+		return self._div(2*AB, 2*AB+Ab+aB)
+	def sensitivity(self, key):
+		'''
+		[i,j] fraction of reference i recovered by j
+		'''
+		Ab, aB, AB = self._get(key)
+		return self._div(AB, AB+Ab)
+	def precision(self, key):
+		'''
+		[i,j] fraction of j that agrees with reference i
+		'''
+		Ab, aB, AB = self._get(key)
+		return self._div(AB, AB+aB)
+	def keys(self, level=None):
+		return sorted([k for k in self.counts if level is None or k[0] == level])
+
+# Shared with forked workers
+_STATE = {}
+
+def _pair_worker(pair):
+	i, j = pair
+	GI, p, temd, base, plan = _STATE['GI'], _STATE['p'], _STATE['temd'], _STATE['base'], _STATE['plan']
+	ni, nj = GI.gff3_names[i], GI.gff3_names[j]
+	chroms = sorted(set(GI.gff3_trees[ni]) & set(GI.gff3_trees[nj]))
+	ret = {}
+	def _add(key, vals):
+		if key in ret:
+			ret[key] = [a+b for a, b in zip(ret[key], vals)]
+		else:
+			ret[key] = list(vals)
+	for chrom in chroms:
+		for col, elem_list in summaries._category_list(GI, temd):
+			category = results.CATEGORIES[col]
+			for elem in elem_list:
+				eid = elem_list[elem]
+				for sstr, sval in summaries.STRANDS:
+					if i == j:
+						n_feat = len(GI.gff3_trees[ni][chrom].to_index().to_set(eid, col, sval))
+						counts = (0, 0, n_feat)
+					else:
+						counts = GI.calc_intersect_2(chrom, ni, nj, eid, col, p, strand=sval)
+					_add(('region', sstr, category, elem), counts)
+	if base:
+		view = GI.view(sorted(set([ni, nj]), key=[ni, nj].index))
+		n = len(view.gff3_names)
+		for chrom in chroms:
+			for col, elem_list in summaries._category_list(GI, temd):
+				category = results.CATEGORIES[col]
+				for elem in elem_list:
+					histograms = summaries.base_histograms(view, chrom, elem, col, plan)
+					for (sstr, sval), (codes, counts) in zip(summaries.STRANDS, histograms):
+						tp, fp, tn, fn = comparisons.histogram_stats(codes, counts, n)
+						counts = (0, 0, tp[0]) if n == 1 else (fn[1], fp[1], tp[1])
+						_add(('base', sstr, category, elem), counts)
+	return i, j, ret
+
+def pairwise(GI, p=90, temd=False, base=None, procs=1, plan=None):
+	'''
+	Compares every pair of annotations in a gff3_interval. Each annotation
+	is only parsed once, and the N*(N-1)/2 pairs are scheduled over a pool
+	of forked workers.
+
+	# Parameters
+	GI (gff3_interval): Annotations to compare
+	p (int): Reciprocal percent overlap threshold or comparisons.match_criterion
+	temd (bool): Include TE order and superfamily categories
+	base (bool): Include base pair comparisons [True when a reference is loaded]
+	procs (int): Worker processes
+	plan (planner.execution_plan): Base pair strategy and workers, which
+		replace procs
+
+	# Returns
+	pairwise_result
+	'''
+	start = time()
+	base = bool(GI.chrom_lens) if base is None else base
+	procs = plan.workers if plan else procs
+	n = len(GI.gff3_names)
+	pairs = [(i, j) for i in range(n) for j in range(i, n)]
+	_STATE.update({'GI':GI, 'p':p, 'temd':temd, 'base':base, 'plan':plan})
+	try:
+		if procs > 1 and len(pairs) > 1:
+			pool = mp.Pool(min(procs, len(pairs)))
+			try:
+				out = pool.map(_pair_worker, pairs, chunksize=1)
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			out = list(map(_pair_worker, pairs))
+	finally:
+		_STATE.clear()
+	ret = pairwise_result(GI.gff3_names)
+	for i, j, counts in out:
+		for key, (Ab, aB, AB) in counts.items():
+			if key not in ret.counts:
+				ret.counts[key] = np.zeros((n, n, 3), dtype=np.int64)
+			ret.counts[key][i,j] = (Ab, aB, AB)
+			ret.counts[key][j,i] = (aB, Ab, AB)
+	logger.debug("Compared %i pairs in %.3f seconds"%(len(pairs), time()-start))
+	return ret
+
+def cluster_order(D):
+	'''
+	Orders items by average linkage clustering of a distance matrix
+
+	>>> cluster_order(np.array([[0,.9,.1],[.9,0,.8],[.1,.8,0]]))
+	[1, 0, 2]
+	'''
+	D = np.where(np.isnan(D), 1.0, D).astype(np.float64)
+	clusters = dict([(i, [i]) for i in range(len(D))])
+	dist = dict([((a, b), D[a,b]) for a in clusters for b in clusters if a < b])
+	next_id = len(D)
+	while len(clusters) > 1:
+		a, b = min(dist, key=lambda k: (dist[k], k))
+		ma, mb = clusters.pop(a), clusters.pop(b)
+		for c in clusters:
+			dac = dist.pop((min(a,c), max(a,c)))
+			dbc = dist.pop((min(b,c), max(b,c)))
+			dist[(c, next_id)] = (dac*len(ma)+dbc*len(mb))/(len(ma)+len(mb))
+		del dist[(a, b)]
+		clusters[next_id] = ma+mb
+		next_id += 1
+	return list(clusters.values())[0] if clusters else []
+
+def plot_heatmap(result, key, fig_ext='png', metric='jaccard'):
+	'''
+	Plots a clustered heatmap of a pairwise metric
+
+	# Returns
+	str: figure name
+	'''
+	level, sstr, category, elem = key
+	M = getattr(result, metric)(key)
+	order = cluster_order(1.0-M)
+	names = [result.names[i] for i in order]
+	M = M[np.ix_(order, order)]
+	fig_name = "allvsall_%s_%s_%s_%s.%s"%(level, summaries._sstrand(sstr), elem, metric, fig_ext)
+	size = max(4, 0.5*len(names)+2)
+	plt.figure(figsize=(size, size), dpi=200)
+	plt.imshow(np.ma.masked_invalid(M), vmin=0, vmax=1, cmap='viridis')
+	plt.colorbar(label=metric)
+	plt.xticks(np.arange(len(names)), names, rotation=90)
+	plt.yticks(np.arange(len(names)), names)
+	plt.title("%s %s %s %s"%(level, sstr, elem, metric))
+	plt.tight_layout()
+	plt.savefig(fig_name)
+	plt.close()
+	return fig_name
+
+def write_tsv(result, out_file):
+	'''
+	Writes every pairwise comparison as a tab-separated table
+	'''
+	header = ('level', 'strand', 'category', 'feature', 'reference', 'query', \
+		'Ab', 'aB', 'AB')+METRICS
+	with open(out_file, 'w') as OF:
+		OF.write('\t'.join(header)+'\n')
+		for key in result.keys():
+			mats = [getattr(result, m)(key) for m in METRICS]
+			C = result.counts[key]
+			for i, ni in enumerate(result.names):
+				for j, nj in enumerate(result.names):
+					vals = list(key)+[ni, nj]+list(map(str, C[i,j]))+ \
+						['nan' if np.isnan(M[i,j]) else '%.4f'%(M[i,j]) for M in mats]
+					OF.write('\t'.join(vals)+'\n')
+
+def tabular(GI, p=90, fig_ext='png', temd=False, procs=1, out_prefix='all_vs_all', plan=None):
+	'''
+	Prints unstranded pairwise matrices, writes every comparison to
+	[out_prefix].tsv, and optionally plots clustered heatmaps
+	'''
+	result = pairwise(GI, p, temd, procs=procs, plan=plan)
+	mnl = max(map(len, result.names)+[len("Reference")])
+	for level in LEVELS:
+		for key in result.keys(level):
+			if key[1] != '+/-' or not result.counts[key][:,:,2].any(): continue
+			for metric in ('jaccard', 'f1'):
+				M = np.round(getattr(result, metric)(key), summaries.sd)
+				print("%s %s %s %s"%(level, key[2], key[3], metric))
+				template = "{:<{mn}} "+' '.join(["{:>{mn}}"]*len(result.names))
+				print(template.format("Reference", *result.names, mn=mnl))
+				for i, name in enumerate(result.names):
+					print(template.format(name, *M[i], mn=mnl))
+				print("")
+			if fig_ext:
+				plot_heatmap(result, key, fig_ext)
+	write_tsv(result, out_prefix+'.tsv')
+	logger.info("Wrote %s.tsv"%(out_prefix))
+	return result
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+import logging, os
+from differannotate.constants import FORMAT
+from differannotate import reader, comparisons, summaries, results
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+def compare(control, treatments=(), names=None, cname='control', reference=None, p=90, \
+		temd=False, base=None, lengths=True, proportions=False, match_sets=False, \
+		chroms=None, plot=False, fig_ext='png', tolerance=None, criterion=None, matching='greedy'):
+	'''
+	Compares treatment annotations against a control without printing
+
+	# Parameters
+	control (str or gff3_interval): Control GFF3 or an existing gff3_interval
+	treatments (list): Treatment GFF3 files
+	names (list): Treatment names [file basenames]
+	cname (str): Name of the control when a path is given
+	reference (str): Control reference FASTA (enables base metrics)
+	p (int): Reciprocal percent overlap threshold
+	temd (bool): Include TE order and superfamily categories
+	base (bool): Compute base pair metrics [True when a reference is loaded]
+	lengths (bool): Store feature length sketches
+	proportions (bool): Store nucleotide proportion arrays (requires reference)
+	match_sets (bool): Store per-feature (Ab, aB, AB) interval sets
+	chroms (list): Chromosomes to analyze [all shared]
+	plot (bool): Generate figures in the current directory
+	fig_ext (str): Figure extension
+	tolerance (int): Match features whose starts and ends are within this many bases
+	criterion (str): Matching criterion, see comparisons.match_criterion
+	matching (str): Pairing of matching features, see comparisons.match_criterion
+
+	# Returns
+	results.comparison
+	'''
+	treatments = list(treatments)
+	if names is None:
+		names = [os.path.splitext(os.path.basename(f))[0] for f in treatments]
+	names = list(names)
+	if len(names) != len(treatments):
+		raise ValueError("treat(%i) != names(%i)"%(len(treatments), len(names)))
+	if isinstance(control, reader.gff3_interval):
+		GI = control.view()
+	else:
+		GI = reader.gff3_interval(control, name=cname, fasta=reference)
+	for f, n in zip(treatments, names):
+		if n in GI.gff3_names:
+			raise ValueError("%s is not a unique name"%(n))
+		GI.add_gff3(f, n)
+	if base is None:
+		base = bool(GI.chrom_lens)
+	if tolerance is not None or criterion is not None or matching != 'greedy':
+		p = comparisons.match_criterion(p, tolerance, criterion, matching)
+	ret = results.comparison(GI.gff3_names)
+	ret.region = summaries.region_metrics(GI, p, temd, lengths=lengths or plot, \
+		proportions=proportions or plot, match_sets=match_sets, chroms=chroms)
+	if base:
+		ret.base = summaries.base_metrics(GI, temd, chroms=chroms)
+	if plot:
+		ret.figures += summaries.plot_region(GI, ret.region, p, fig_ext)
+		if ret.base is not None:
+			ret.figures += summaries.plot_base(ret.base, fig_ext)
+	return ret
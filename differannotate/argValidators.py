@@ -35,7 +35,7 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 ###############################################################################
 
-import argparse, os
+import argparse, os, re
 
 class argChecker:
 	'''
@@ -64,6 +64,26 @@ class argChecker:
 			return x
 		else:
 			raise argparse.ArgumentTypeError("%s not a valid %s"%(x, self.av))
+class sizeCheck:
+	'''
+	Converts a memory size with an optional K, M, G, or T suffix to bytes
+
+	Returns
+	-----------
+	int -- bytes
+
+	Usage
+	-----------
+	parser.add_argument('--max-memory', metavar='SIZE', help='Memory budget', type=sizeCheck().check)
+	'''
+	units = {'':1, 'K':2**10, 'M':2**20, 'G':2**30, 'T':2**40}
+	size_re = re.compile('^(?P<value>[0-9]*\.?[0-9]+)(?P<unit>[KMGT]?)I?B?$')
+	def check(self, x):
+		match = self.size_re.match(x.strip().upper())
+		ret = int(float(match.group('value'))*self.units[match.group('unit')]) if match else 0
+		if ret <= 0:
+			raise argparse.ArgumentTypeError("%s not a valid memory size"%(x))
+		return ret
 class fileCheck:
 	'''
 	Checks to make sure a file given as an argument is of the correct type
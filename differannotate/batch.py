@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+
+import argparse, json, logging, os
+import numpy as np
+from time import time
+from differannotate.constants import FORMAT
+from differannotate import reader, api
+from collections import defaultdict as dd
+from differannotate.datastructures import dict_index, iterit
+from differannotate.lazy import mp, yaml
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+# Job options and their defaults, named like the command line options
+DEFAULTS = {'cname':'control', 'names':None, 'percent':90, 'tolerance':None, 'criterion':None, 'matching':'greedy', 'temd':False, 'base':None, \
+	'plot':False, 'ext':'png', 'features':None, 'exclude_features':None, 'chroms':None, 'output':None}
+
+def load_jobs(path):
+	'''
+	Reads a JSON or YAML (with PyYAML) job file. The file is either a list
+	of jobs or an object with a "jobs" list, an optional "reference", and
+	optional "defaults" for every job.
+
+	# Returns
+	str: Reference FASTA or None
+	list: Jobs with every option filled in
+	'''
+	with open(path) as IF:
+		if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+			try:
+				spec = yaml.safe_load(IF)
+			except ImportError:
+				raise ValueError("Reading %s requires PyYAML"%(path))
+		else:
+			spec = json.load(IF)
+	if isinstance(spec, list):
+		spec = {'jobs':spec}
+	defaults = dict(DEFAULTS, **spec.get('defaults', {}))
+	jobs = []
+	for i, job in enumerate(spec['jobs']):
+		unknown = set(job) - set(DEFAULTS) - set(['name', 'control', 'treat'])
+		if unknown:
+			raise ValueError("Unknown options in job %i: %s"%(i, ', '.join(sorted(unknown))))
+		job = dict(defaults, **job)
+		job['name'] = str(job.get('name', 'job%i'%(i+1)))
+		job['treat'] = list(job['treat'])
+		if job['names'] is None:
+			job['names'] = [os.path.splitext(os.path.basename(f))[0] for f in job['treat']]
+		names = [job['cname']]+list(job['names'])
+		if len(job['names']) != len(job['treat']) or len(set(names)) != len(names):
+			raise ValueError("Job %s needs a unique name for the control and every treatment"%(job['name']))
+		if job['output'] is None:
+			job['output'] = job['name']
+		jobs.append(job)
+	if len(set([job['output'] for job in jobs])) != len(jobs):
+		raise ValueError("Every job needs its own output directory")
+	return spec.get('reference', None), jobs
+
+def plan_annotations(jobs):
+	'''
+	Finds every annotation needed by a list of jobs and the loosest
+	filters that still cover every job
+
+	# Returns
+	list: Unique GFF3 files in order of first use
+	dict: gff3_interval keyword arguments of the filters
+	'''
+	files = []
+	for job in jobs:
+		for f in [job['control']]+job['treat']:
+			if f not in files:
+				files.append(f)
+	filters = {'features':None, 'exclude_features':None, 'chroms':None}
+	if all([job['features'] for job in jobs]):
+		filters['features'] = sorted(set([f for job in jobs for f in job['features']]))
+	if all([job['exclude_features'] for job in jobs]):
+		excluded = [set([f.lower() for f in job['exclude_features']]) for job in jobs]
+		filters['exclude_features'] = sorted(set.intersection(*excluded)) or None
+	if all([job['chroms'] for job in jobs]):
+		filters['chroms'] = sorted(set([c for job in jobs for c in job['chroms']]))
+	return files, filters
+
+def _subset(index, ids):
+	ret = dict_index()
+	for name, i in index.items():
+		if i in ids:
+			dict.__setitem__(ret, name, i)
+	ret.cur = index.cur
+	return ret
+
+def job_view(GI, job):
+	'''
+	Creates a view of the parsed annotations of a job, renamed to the
+	names of the job. When the job filters features, its trees only keep
+	the matching intervals and TE orders and superfamilies, like a parse
+	with the same filters.
+
+	# Returns
+	gff3_interval
+	'''
+	keys = [job['control']]+job['treat']
+	names = [job['cname']]+list(job['names'])
+	view = GI.view(keys)
+	for attr in ('gff3_trees', 'gff3_chains', 'gff3_digests', 'gff3_offsets', 'gff3_files'):
+		D = getattr(GI, attr)
+		setattr(view, attr, dict([(n, D[k]) for k, n in zip(keys, names) if k in D]))
+	view.gff3_names = names
+	if job['features'] or job['exclude_features']:
+		features = set([f.lower() for f in job['features']]) if job['features'] else None
+		excluded = set([f.lower() for f in job['exclude_features'] or []])
+		eids = set([eid for elem, eid in GI.element_dict.items() \
+			if elem not in excluded and (features is None or elem in features)])
+		oids, sids = set(), set()
+		trees = {}
+		for name in names:
+			trees[name] = dd(iterit)
+			for chrom, tree in view.gff3_trees[name].items():
+				for interval in tree.iterintervals():
+					D = interval.data
+					if D[1] in eids:
+						trees[name][chrom].add(interval.start, interval.end, D)
+						if len(D) > 2:
+							oids.add(D[2])
+							sids.add(D[3])
+		view.gff3_trees = trees
+		view.element_dict = _subset(GI.element_dict, eids)
+		view.order_dict = _subset(GI.order_dict, oids)
+		view.sufam_dict = _subset(GI.sufam_dict, sids)
+	return view
+
+def write_table(result, out_file):
+	'''
+	Writes every row and sample of a metric_table as a tab-separated table
+	'''
+	header = ['chrom', 'strand', 'category', 'feature', 'sample']+list(result.count_names)+list(result.stat_names)
+	stats = [getattr(result, n) for n in result.stat_names]
+	with open(out_file, 'w') as OF:
+		OF.write('\t'.join(header)+'\n')
+		for i, key in enumerate(result.rows):
+			for j, sample in enumerate(result.samples):
+				vals = list(key)+[sample]+[str(result[n][i,j]) for n in result.count_names]+ \
+					['nan' if np.isnan(A[i,j]) else '%.4f'%(A[i,j]) for A in stats]
+				OF.write('\t'.join(vals)+'\n')
+
+def run_job(GI, job):
+	'''
+	Runs one job and writes region.tsv, base.tsv (with a reference), and
+	figures (with plot) to its output directory
+
+	# Returns
+	str: Job name
+	list: Written files
+	'''
+	start = time()
+	out = job['output']
+	if not os.path.exists(out):
+		os.makedirs(out)
+	cwd = os.getcwd()
+	os.chdir(out)
+	try:
+		ret = api.compare(job_view(GI, job), p=job['percent'], temd=job['temd'], base=job['base'], \
+			chroms=job['chroms'], plot=job['plot'], fig_ext=job['ext'], tolerance=job['tolerance'], \
+			criterion=job['criterion'], matching=job['matching'])
+		write_table(ret.region, 'region.tsv')
+		files = ['region.tsv']
+		if ret.base is not None:
+			write_table(ret.base, 'base.tsv')
+			files.append('base.tsv')
+		files += ret.figures
+	finally:
+		os.chdir(cwd)
+	logger.info("Finished %s in %.3f seconds"%(job['name'], time()-start))
+	return job['name'], [os.path.join(out, f) for f in files]
+
+# Shared with forked workers
+_STATE = {}
+
+def _job_worker(i):
+	return run_job(_STATE['GI'], _STATE['jobs'][i])
+
+def run(jobs, reference=None, procs=1):
+	'''
+	Parses every annotation needed by a list of jobs once, and then runs
+	the jobs over a pool of forked workers that share the parsed
+	annotations
+
+	# Parameters
+	jobs (list): Jobs from load_jobs
+	reference (str): Reference FASTA (enables base pair metrics)
+	procs (int): Worker processes
+
+	# Returns
+	list: (job name, written files) of every job
+	'''
+	files, filters = plan_annotations(jobs)
+	logger.info("Parsing %i annotations for %i jobs"%(len(files), len(jobs)))
+	GI = reader.gff3_interval(files[0], name=files[0], fasta=reference, \
+		treatments=[(f, f) for f in files[1:]], procs=procs, **filters)
+	_STATE.update({'GI':GI, 'jobs':jobs})
+	try:
+		if procs > 1 and len(jobs) > 1:
+			pool = mp.Pool(min(procs, len(jobs)))
+			try:
+				ret = pool.map(_job_worker, range(len(jobs)), chunksize=1)
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			ret = list(map(_job_worker, range(len(jobs))))
+	finally:
+		_STATE.clear()
+	return ret
+
+def main(argv=None):
+	from differannotate.argValidators import fileCheck
+	fCheck = fileCheck()
+	parser = argparse.ArgumentParser(prog="differannotate batch", \
+		description="Runs many comparisons that share parsed annotations")
+	parser.add_argument('jobs', metavar='JOBS', help='JSON or YAML file of comparison jobs')
+	parser.add_argument('-R', '--reference', metavar='FASTA', \
+		help='Reference for base pair metrics [reference of the job file]', type=fCheck.fasta)
+	parser.add_argument('--procs', metavar='INT', help='Worker processes [%(default)s]', type=int, default=1)
+	parser.add_argument('-v', '--verbose', action="store_true", help='Enable verbose logging')
+	args = parser.parse_args(argv)
+	logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+	reference, jobs = load_jobs(args.jobs)
+	for name, files in run(jobs, args.reference or reference, args.procs):
+		logger.info("%s: %s"%(name, ' '.join(files)))
+	logger.info("Done")
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
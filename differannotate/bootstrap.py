@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+
+import argparse, logging
+import numpy as np
+from time import time
+from differannotate.constants import FORMAT
+from differannotate import results, summaries
+from differannotate.lazy import mp
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+# Replicates drawn by each task, which only depends on the data so every
+# number of workers draws the same replicates
+CHUNK = 1000
+# Largest (replicates, blocks) weight matrix of a block resampling task
+MAX_WEIGHTS = 2**22
+
+def block_type(x):
+	'''
+	Parses --bootstrap-block
+
+	>>> block_type('feature'), block_type('chrom'), block_type('100000')
+	(None, 'chrom', 100000)
+	'''
+	if x in ('feature', 'chrom'):
+		return None if x == 'feature' else x
+	try:
+		ret = int(x)
+	except ValueError:
+		ret = 0
+	if ret <= 0:
+		raise argparse.ArgumentTypeError("%s is not feature, chrom, or a block size in bases"%(x))
+	return ret
+
+def match_counts(GI, p=90, temd=False, block=None, chroms=None):
+	'''
+	Matches the features of every treatment against the control, and
+	counts the TP, FN, and FP features of every resampling block. TP and
+	FN features are placed by their control feature and FP features by
+	their treatment feature. At the feature level, every control feature
+	and unmatched treatment feature is its own block, so a matched pair
+	shares the weight of its control feature in every treatment.
+
+	# Parameters
+	GI (gff3_interval): Control and treatment annotations
+	p (int): Reciprocal percent overlap threshold or comparisons.match_criterion
+	temd (bool): Include TE order and superfamily categories
+	block (int or str): Block size in bases, 'chrom', or None for features
+	chroms (list): Chromosomes to analyze [all shared]
+
+	# Returns
+	list: ('All', strand, category, feature) rows
+	list: (block ids, np.ndarray (blocks, samples, 3) of TP, FN, and FP) of every row
+	'''
+	chroms = chroms if chroms else sorted(GI.get_chrom_set())
+	cname, n = GI.gff3_names[0], len(GI.gff3_names)
+	rows, parts = [], {}
+	offset = 0
+	units = {}
+	for c, chrom in enumerate(chroms):
+		for col, elem_list in summaries._category_list(GI, temd):
+			category = results.CATEGORIES[col]
+			for elem in elem_list:
+				eid = elem_list[elem]
+				for sstr, sval in summaries.STRANDS:
+					key = ('All', sstr, category, elem)
+					if key not in parts:
+						rows.append(key)
+						parts[key] = []
+					for i, name in enumerate(GI.gff3_names):
+						sets = GI.calc_intersect_2(chrom, cname, name, eid, col, p, strand=sval, ret_set=True)
+						# (Ab, aB, AB) to (TP, FN, FP)
+						for kind, tuples in ((0, sets[2]), (1, sets[0]), (2, sets[1])):
+							if not tuples: continue
+							if block is None:
+								# Control features are shared by every treatment
+								owner = (chrom,) if kind < 2 else (chrom, i)
+								ids = np.array([units.setdefault(owner+t, len(units)) for t in sorted(tuples)], dtype=np.int64)
+								counts = np.ones(len(ids), dtype=np.int64)
+							elif block == 'chrom':
+								ids = np.array([c], dtype=np.int64)
+								counts = np.array([len(tuples)], dtype=np.int64)
+							else:
+								starts = np.fromiter((t[0] for t in tuples), dtype=np.int64, count=len(tuples))
+								ids, counts = np.unique(offset+starts//block, return_counts=True)
+							parts[key].append((ids, i, kind, counts))
+		if block not in (None, 'chrom'):
+			offset += GI._get_max(chrom)//block+1
+	ret = []
+	for key in rows:
+		all_ids = np.unique(np.concatenate([P[0] for P in parts[key]])) if parts[key] else np.zeros(0, dtype=np.int64)
+		counts = np.zeros((len(all_ids), n, 3), dtype=np.int64)
+		for ids, i, kind, C in parts[key]:
+			counts[np.searchsorted(all_ids, ids), i, kind] += C
+		ret.append((all_ids, counts))
+	return rows, ret
+
+def collapse_units(parts):
+	'''
+	Groups the blocks that have the same counts in every row and sample.
+	The sum of the Poisson(1) weights of m identical blocks is Poisson(m),
+	so a group only needs one weight per replicate. Every feature-level
+	block has a count of one in a few rows, so millions of features
+	collapse into a few groups.
+
+	# Parameters
+	parts (list): (block ids, np.ndarray (blocks, samples, 3)) of every row
+
+	# Returns
+	list: (group ids, np.ndarray (groups, samples, 3) of total counts) of every row
+	np.ndarray: Number of blocks in each group
+
+	>>> parts = [(np.array([0, 1, 2]), np.array([[[1, 0, 0]], [[1, 0, 0]], [[0, 1, 0]]]))]
+	>>> groups, sizes = collapse_units(parts)
+	>>> groups[0][1][:,0].tolist(), sizes.tolist()
+	([[2, 0, 0], [0, 1, 0]], [2, 1])
+	'''
+	if not parts:
+		return parts, np.zeros(0, dtype=np.int64)
+	n = parts[0][1].shape[1]
+	base = max([C.max() for ids, C in parts if len(ids)]+[0])+1
+	units, codes = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+	for r, (ids, C) in enumerate(parts):
+		u, i, kind = np.nonzero(C)
+		units.append(ids[u])
+		# Counts are part of the code, so groups are exact
+		codes.append((((r*n+i)*3+kind)*base+C[u, i, kind]).astype(np.int64))
+	units, codes = np.concatenate(units), np.concatenate(codes)
+	all_units, units = np.unique(units, return_inverse=True)
+	order = np.lexsort((codes, units))
+	units, codes = units[order], codes[order]
+	# One row of sorted codes per block, padded with -1
+	first = np.searchsorted(units, np.arange(len(all_units)))
+	pos = np.arange(len(units))-first[units]
+	M = np.full((len(all_units), pos.max()+1 if len(pos) else 1), -1, dtype=np.int64)
+	M[units, pos] = codes
+	order = np.lexsort(M.T[::-1])
+	new = np.ones(len(order), dtype=bool)
+	new[1:] = np.any(M[order[1:]] != M[order[:-1]], axis=1)
+	group = np.zeros(len(all_units), dtype=np.int64)
+	group[order] = np.cumsum(new)-1
+	sizes = np.bincount(group)
+	ret = []
+	for ids, C in parts:
+		gids, inverse = np.unique(group[np.searchsorted(all_units, ids)], return_inverse=True)
+		counts = np.zeros((len(gids),)+C.shape[1:], dtype=np.int64)
+		np.add.at(counts, inverse, C)
+		ret.append((gids, counts))
+	return ret, sizes
+
+# Shared with forked workers
+_STATE = {}
+
+def _ratios(counts):
+	# counts (..., 3) of TP, FN, and FP
+	tp = counts[...,0].astype(np.float64)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		sen = tp/(tp+counts[...,1])
+		pre = tp/(tp+counts[...,2])
+	return sen.astype(np.float32), pre.astype(np.float32)
+
+def _replicate_worker(task):
+	'''
+	Draws a chunk of Poisson bootstrap replicates of every row
+
+	# Returns
+	np.ndarray: Sensitivity (rows, samples, replicates)
+	np.ndarray: Precision (rows, samples, replicates)
+	'''
+	seed, reps = task
+	parts, blocks, sizes = _STATE['parts'], _STATE['blocks'], _STATE['sizes']
+	rng = np.random.RandomState(seed)
+	n = _STATE['samples']
+	# One weight per block applies to its TP, FN, and FP counts together,
+	# and groups of identical blocks have Poisson(size)/size weights
+	sums = np.zeros((len(parts), reps, n, 3), dtype=np.float64)
+	W = rng.poisson(sizes, size=(reps, len(blocks)))/sizes
+	for r, (ids, C) in enumerate(parts):
+		if not len(ids): continue
+		cols = np.searchsorted(blocks, ids)
+		sums[r] = W[:,cols].dot(C.reshape(len(ids), -1)).reshape(reps, n, 3)
+	sen, pre = _ratios(sums)
+	return sen.transpose(0, 2, 1), pre.transpose(0, 2, 1)
+
+def region_intervals(GI, replicates, p=90, temd=False, block=None, seed=None, procs=1, level=0.95, chroms=None):
+	'''
+	Computes genome-wide region metrics with bootstrap confidence
+	intervals. Features, or blocks of features, are resampled with Poisson
+	bootstrap weights, so chunks of replicates are drawn independently over
+	a pool of workers and only occupied blocks need weights.
+
+	# Parameters
+	GI (gff3_interval): Control and treatment annotations
+	replicates (int): Number of bootstrap replicates
+	p (int): Reciprocal percent overlap threshold or comparisons.match_criterion
+	temd (bool): Include TE order and superfamily categories
+	block (int or str): Resample blocks of this many bases, whole chromosomes
+		('chrom'), or features (None)
+	seed (int): Random seed for reproducible replicates
+	procs (int): Worker processes
+	level (float): Confidence level
+	chroms (list): Chromosomes to analyze [all shared]
+
+	# Returns
+	results.region_bootstrap: Rows use 'All' as the chromosome
+	'''
+	start = time()
+	rows, parts = match_counts(GI, p, temd, block, chroms)
+	ret = results.region_bootstrap(GI.gff3_names, level)
+	for key, (ids, C) in zip(rows, parts):
+		tp, fn, fp = C.sum(axis=0).T
+		ret.add(key, tp=tp, fp=fp, fn=fn)
+	sen, pre = draw_replicates(parts, replicates, len(GI.gff3_names), seed, procs, collapse=block is None)
+	ret.replicates['sensitivity'], ret.replicates['precision'] = sen, pre
+	logger.debug("Drew %i bootstrap replicates of %i rows in %.3f seconds"%(replicates, len(rows), time()-start))
+	return ret
+
+def draw_replicates(parts, replicates, samples, seed=None, procs=1, collapse=False):
+	'''
+	Draws Poisson bootstrap replicates of the counts of every row
+
+	# Parameters
+	parts (list): (block ids, np.ndarray (blocks, samples, 3)) of every row
+	replicates (int): Number of bootstrap replicates
+	samples (int): Number of samples
+	seed (int): Random seed for reproducible replicates
+	procs (int): Worker processes
+	collapse (bool): Group identical blocks with collapse_units
+
+	# Returns
+	np.ndarray: Sensitivity (rows, samples, replicates)
+	np.ndarray: Precision (rows, samples, replicates)
+	'''
+	if collapse:
+		parts, sizes = collapse_units(parts)
+	blocks = np.unique(np.concatenate([P[0] for P in parts])) if parts else np.zeros(0, dtype=np.int64)
+	sizes = sizes[blocks].astype(np.float64) if collapse else np.ones(len(blocks))
+	chunk = max(1, min(CHUNK, MAX_WEIGHTS//max(len(blocks), 1)))
+	reps = [min(chunk, replicates-i) for i in range(0, replicates, chunk)]
+	seeds = np.random.RandomState(seed).randint(2**31-1, size=len(reps))
+	tasks = list(zip(seeds.tolist(), reps))
+	_STATE.update({'parts':parts, 'blocks':blocks, 'sizes':sizes, 'samples':samples})
+	try:
+		if procs > 1 and len(tasks) > 1:
+			pool = mp.Pool(min(procs, len(tasks)))
+			try:
+				out = pool.map(_replicate_worker, tasks, chunksize=1)
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			out = list(map(_replicate_worker, tasks))
+	finally:
+		_STATE.clear()
+	ret = []
+	for i in range(2):
+		chunks = [o[i] for o in out]
+		ret.append(np.concatenate(chunks, axis=2) if chunks else \
+			np.zeros((len(parts), samples, 0), dtype=np.float32))
+	return tuple(ret)
+
+def tabular(GI, replicates, p=90, temd=False, block=None, seed=None, procs=1, level=0.95):
+	'''
+	Prints genome-wide region metrics with bootstrap confidence intervals
+	'''
+	ret = region_intervals(GI, replicates, p, temd, block, seed, procs, level)
+	mel = max(map(len, list(GI.element_dict)+list(GI.order_dict)+list(GI.sufam_dict)+list(results.CATEGORIES)))
+	mnl = max(map(len, list(GI.gff3_names)+["Sample"]))
+	header = ("S", "Feature", "Sample", "TP", "FP", "FN", "SENS", "SENS_CI", "PREC", "PREC_CI")
+	template = "{:^3} {:<{mel}} {:<{mn}} "+' '.join(["{:>8}"]*3+["{:>6} {:>13}"]*2)
+	print(template.format(*header, mel=mel, mn=mnl))
+	stats = []
+	for stat in ('sensitivity', 'precision'):
+		lo, hi = ret.interval(stat)
+		stats.append((np.round(getattr(ret, stat), summaries.sd), np.round(lo, summaries.sd), np.round(hi, summaries.sd)))
+	for r, (chrom, sstr, category, elem) in enumerate(ret.rows):
+		for i, name in enumerate(ret.samples):
+			vals = [ret[c][r,i] for c in ('tp', 'fp', 'fn')]
+			for est, lo, hi in stats:
+				vals += [est[r,i], "%s-%s"%(lo[r,i], hi[r,i])]
+			print(template.format(sstr if not i else '', elem if not i else '', name, *vals, mel=mel, mn=mnl))
+	print("")
+	return ret
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
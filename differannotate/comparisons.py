@@ -44,7 +44,7 @@ from .constants import FORMAT
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.WARN, format=FORMAT)
 
-from differannotate.datastructures import interval2tuple
+from differannotate.datastructures import interval2tuple, interval_index
 
 def _super(array, control_row=0, control_target=1, treat_target=1):
 	start = time()
@@ -76,6 +76,167 @@ def precision(array, control_row=0):
 	tpv, fpv, tnv, fnv = _all(array, control_row)
 	return tpv/(tpv+fpv).astype(np.float)
 
+def _code_dtype(n):
+	for dt in (np.uint8, np.uint16, np.uint32, np.uint64):
+		if n <= np.iinfo(dt).bits:
+			return dt
+	raise ValueError("Membership codes support at most 64 rows, not %i"%(n))
+def membership_codes(array):
+	'''
+	Packs the membership of every column across all rows into an integer
+	code, where bit i is set when row i is true.
+
+	>>> membership_codes(np.array([[1,1,0,0],[0,1,1,0]]))
+	array([1, 3, 2, 0], dtype=uint8)
+	'''
+	n = array.shape[0]
+	dt = _code_dtype(n)
+	codes = np.zeros(array.shape[1], dtype=dt)
+	for i in range(n):
+		codes |= array[i].astype(dt) << dt(i)
+	return codes
+def membership_histogram(array):
+	'''
+	Counts every joint membership code in a single pass
+
+	# Parameters
+	array (np.ndarray): (rows, bases) binary membership with at most 64 rows
+
+	# Returns
+	np.ndarray: Non-empty membership codes (uint64)
+	np.ndarray: Number of bases with each code
+
+	>>> codes, counts = membership_histogram(np.array([[1,1,0,0],[0,1,1,0]]))
+	>>> list(codes), list(counts)
+	([0, 1, 2, 3], [1, 1, 1, 1])
+	'''
+	start = time()
+	n = array.shape[0]
+	codes = membership_codes(array)
+	if n <= 16:
+		counts = np.bincount(codes, minlength=2**n)
+		ret_codes = np.nonzero(counts)[0]
+		ret = (ret_codes.astype(np.uint64), counts[ret_codes].astype(np.int64))
+	else:
+		ret_codes, counts = np.unique(codes, return_counts=True)
+		ret = (ret_codes.astype(np.uint64), counts.astype(np.int64))
+	logger.debug("%.4f seconds"%(time()-start))
+	return ret
+def merge_histograms(histograms):
+	'''
+	Sums membership histograms, like the ones from consecutive tiles of a
+	chromosome
+
+	>>> merge_histograms([(np.array([0,3], dtype=np.uint64), np.array([2,1])), (np.array([3], dtype=np.uint64), np.array([4]))])
+	(array([0, 3], dtype=uint64), array([2, 5]))
+	'''
+	codes = np.concatenate([h[0] for h in histograms]).astype(np.uint64)
+	counts = np.concatenate([h[1] for h in histograms]).astype(np.int64)
+	ret_codes, inverse = np.unique(codes, return_inverse=True)
+	ret_counts = np.zeros(len(ret_codes), dtype=np.int64)
+	np.add.at(ret_counts, inverse, counts)
+	return ret_codes, ret_counts
+def _union(starts, ends):
+	keep = starts < ends
+	starts, ends = starts[keep], ends[keep]
+	if not len(starts):
+		return starts, ends
+	order = np.lexsort((ends, starts))
+	starts, ends = starts[order], ends[order]
+	run_end = np.maximum.accumulate(ends)
+	first = np.nonzero(np.r_[True, starts[1:] > run_end[:-1]])[0]
+	last = np.r_[first[1:]-1, len(starts)-1]
+	return starts[first], run_end[last]
+def interval_segments(rows, length):
+	'''
+	Splits [0, length) into segments with a constant joint membership code.
+	The union of each row is turned into +bit/-bit events at its boundaries,
+	so the code of every segment between events is a cumulative sum.
+
+	# Parameters
+	rows (list): (starts, ends) arrays of each row, with at most 64 rows
+	length (int): Number of bases
+
+	# Returns
+	np.ndarray: Segment boundaries (segments+1), starting at 0 and ending at length
+	np.ndarray: Membership code of every segment (uint64)
+
+	>>> bounds, codes = interval_segments([(np.array([0]), np.array([2])), (np.array([1]), np.array([3]))], 4)
+	>>> list(bounds), list(codes)
+	([0, 1, 2, 3, 4], [1, 3, 2, 0])
+	'''
+	_code_dtype(len(rows))
+	positions, deltas = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.uint64)]
+	for i, (starts, ends) in enumerate(rows):
+		starts = np.clip(np.asarray(starts, dtype=np.int64), 0, length)
+		ends = np.clip(np.asarray(ends, dtype=np.int64), 0, length)
+		starts, ends = _union(starts, ends)
+		bit = np.uint64(1) << np.uint64(i)
+		positions += [starts, ends]
+		# Two's complement so the uint64 cumulative sum wraps back to the code
+		deltas += [np.full(len(starts), bit, dtype=np.uint64), np.full(len(ends), ~bit+np.uint64(1), dtype=np.uint64)]
+	positions = np.concatenate(positions)
+	deltas = np.concatenate(deltas)
+	order = np.argsort(positions, kind='mergesort')
+	positions = positions[order]
+	running = np.cumsum(deltas[order], dtype=np.uint64)
+	last = np.r_[positions[1:] != positions[:-1], True] if len(positions) else np.zeros(0, dtype=bool)
+	bounds = np.r_[0, positions[last], length].astype(np.int64)
+	codes = np.r_[np.zeros(1, dtype=np.uint64), running[last]]
+	keep = np.diff(bounds) > 0
+	return np.r_[bounds[:-1][keep], length].astype(np.int64), codes[keep]
+def interval_histogram(rows, length):
+	'''
+	Counts every joint membership code directly from intervals, so memory
+	scales with the number of intervals instead of the number of bases
+
+	# Parameters
+	rows (list): (starts, ends) arrays of each row, with at most 64 rows
+	length (int): Number of bases
+
+	# Returns
+	np.ndarray: Non-empty membership codes (uint64)
+	np.ndarray: Number of bases with each code
+
+	>>> rows = [(np.array([0]), np.array([2])), (np.array([1]), np.array([3]))]
+	>>> codes, counts = interval_histogram(rows, 4)
+	>>> list(codes), list(counts)
+	([0, 1, 2, 3], [1, 1, 1, 1])
+	'''
+	bounds, codes = interval_segments(rows, length)
+	return merge_histograms([(codes, np.diff(bounds))])
+def _code_bits(codes, n):
+	shifts = np.arange(n, dtype=np.uint64)
+	return ((codes.astype(np.uint64)[:,None] >> shifts) & np.uint64(1)).astype(bool)
+def histogram_stats(codes, counts, n, control_row=0):
+	'''
+	Derives per-row (tp, fp, tn, fn) relative to the control row from a
+	membership histogram
+
+	>>> A = np.array([[1,1,0,0],[1,1,1,1],[0,1,1,0]])
+	>>> [list(v) for v in histogram_stats(*membership_histogram(A), n=3)]
+	[[2, 2, 1], [0, 2, 1], [2, 0, 1], [0, 0, 1]]
+	'''
+	bits = _code_bits(codes, n)
+	c = bits[:,control_row]
+	tpv = counts[c].dot(bits[c])
+	fnv = counts[c].dot(~bits[c])
+	fpv = counts[~c].dot(bits[~c])
+	tnv = counts[~c].dot(~bits[~c])
+	return tpv, fpv, tnv, fnv
+def venn_subsets(codes, counts, n):
+	'''
+	Orders a membership histogram into venn/UpSet subsets. For 2 rows this is
+	(Ab, aB, AB) and for 3 rows (Abc, aBc, ABc, abC, AbC, aBC, ABC).
+
+	>>> venn_subsets(np.array([1,3], dtype=np.uint64), np.array([5,2]), 2)
+	(5, 0, 2)
+	'''
+	if n > 16:
+		raise ValueError("Too many subsets for %i rows"%(n))
+	cells = dict(zip(codes.tolist(), counts.tolist()))
+	return tuple([int(cells.get(code, 0)) for code in range(1, 2**n)])
+
 def _overlap_b(A, B):
 	'''
 	Calculates overlap in bases of A and B. Not inclusive
@@ -133,7 +294,8 @@ def overlap(A, B, overlap_p=95):
 	dA, dB = map(_decode, [A,B])
 	return _overlap_p(dA, dB) >= overlap_p
 def _overlap_tup(A, B, overlap_p=95):
-	return _overlap_p_tup(A, B) >= overlap_p
+	bases_overlap = max(0, min(A[1], B[1]) - max(A[0], B[0]))
+	return bases_overlap*100 >= overlap_p*(A[1] - A[0])
 	
 def overlap_r(A, B, overlap_p=95):
 	'''
@@ -157,11 +319,192 @@ def _overlap_r_tup(A, B, overlap_p=95):
 	if not bases_overlap: return False
 	size_A = A[1] - A[0]
 	size_B = B[1] - B[0]
-	oab = float(bases_overlap)/float(size_A)*100.0 >= overlap_p
-	oba = float(bases_overlap)/float(size_B)*100.0 >= overlap_p
-	#oab = _overlap_tup(A, B, overlap_p)
-	#oba = _overlap_tup(B, A, overlap_p)
+	# Integer comparisons avoid rounding at the threshold
+	oab = bases_overlap*100 >= overlap_p*size_A
+	oba = bases_overlap*100 >= overlap_p*size_B
 	return oab and oba
+
+def _as_int64(*arrays):
+	return [np.asarray(a, dtype=np.int64) for a in arrays]
+def _threshold(overlap_p):
+	return int(overlap_p) if float(overlap_p).is_integer() else float(overlap_p)
+def overlap_bases(a_starts, a_ends, b_starts, b_ends):
+	'''
+	Calculates overlap in bases of every A and B pair. Not inclusive
+
+	>>> overlap_bases([0, 0], [10, 10], [5, 10], [15, 15])
+	array([5, 0])
+	'''
+	a_starts, a_ends, b_starts, b_ends = _as_int64(a_starts, a_ends, b_starts, b_ends)
+	return np.maximum(0, np.minimum(a_ends, b_ends) - np.maximum(a_starts, b_starts))
+def overlap_percent(a_starts, a_ends, b_starts, b_ends):
+	'''
+	Calculates the overlap percentage of every A by its B
+
+	>>> overlap_percent([0, 0], [10, 10], [5, 10], [15, 15])
+	array([50.,  0.])
+	'''
+	a_starts, a_ends = _as_int64(a_starts, a_ends)
+	bases = overlap_bases(a_starts, a_ends, b_starts, b_ends)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		return bases*100.0/(a_ends-a_starts)
+def overlap_mask(a_starts, a_ends, b_starts, b_ends, overlap_p=95):
+	'''
+	>= overlap_p percent of every A is covered by its B. Thresholds are
+	compared as integers (bases*100 >= p*size), so pairs exactly at the
+	threshold always pass.
+
+	>>> overlap_mask([0, 0], [100, 100], [43, 44], [200, 200], 57)
+	array([ True, False])
+	'''
+	a_starts, a_ends = _as_int64(a_starts, a_ends)
+	bases = overlap_bases(a_starts, a_ends, b_starts, b_ends)
+	return (bases > 0) & (bases*100 >= _threshold(overlap_p)*(a_ends-a_starts))
+def overlap_r_mask(a_starts, a_ends, b_starts, b_ends, overlap_p=95):
+	'''
+	>= overlap_p percent reciprocal overlap between every A and B pair
+
+	>>> overlap_r_mask([0, 0], [10, 10], [1, 0], [10, 20], 90)
+	array([ True, False])
+	'''
+	a_starts, a_ends, b_starts, b_ends = _as_int64(a_starts, a_ends, b_starts, b_ends)
+	bases = overlap_bases(a_starts, a_ends, b_starts, b_ends)
+	p = _threshold(overlap_p)
+	return (bases > 0) & (bases*100 >= p*(a_ends-a_starts)) & (bases*100 >= p*(b_ends-b_starts))
+def boundary_mask(a_starts, a_ends, b_starts, b_ends, tolerance=0):
+	'''
+	Starts and ends of every A and B pair are within tolerance bases
+
+	>>> boundary_mask([0, 0], [40, 40], [5, 11], [45, 40], 10)
+	array([ True, False])
+	'''
+	a_starts, a_ends, b_starts, b_ends = _as_int64(a_starts, a_ends, b_starts, b_ends)
+	return (np.abs(a_starts-b_starts) <= tolerance) & (np.abs(a_ends-b_ends) <= tolerance)
+
+class match_criterion(object):
+	'''
+	Decides when two features match: by reciprocal percent overlap, by
+	start and end boundaries within a tolerance, or by both. Anything that
+	takes a percent threshold also accepts a match_criterion.
+
+	Matching features are paired one-to-one greedily, in order of position,
+	or optimally, with the most pairs (and then the most overlapping bases
+	with 'optimal-overlap').
+
+	# Parameters
+	percent (int): Reciprocal percent overlap threshold
+	tolerance (int): Maximum distance in bases between starts and ends
+	criterion (str): One of CRITERIA [tolerance when given, else percent]
+	matching (str): One of MATCHINGS [greedy]
+
+	# Usage
+	>>> MC = match_criterion(90, 10)
+	>>> MC.mask([0, 0], [40, 40], [5, 11], [45, 40])
+	array([ True, False])
+	>>> str(MC), str(match_criterion(90, 10, 'both')), match_criterion(90).key()
+	('10 bp boundaries', '90% overlap and 10 bp boundaries', 90)
+	'''
+	CRITERIA = ('percent', 'tolerance', 'both')
+	MATCHINGS = ('greedy', 'optimal', 'optimal-overlap')
+	def __init__(self, percent=90, tolerance=None, criterion=None, matching='greedy'):
+		if criterion is None:
+			criterion = 'percent' if tolerance is None else 'tolerance'
+		if criterion not in self.CRITERIA:
+			raise ValueError("Unknown matching criterion: %s"%(criterion))
+		if criterion != 'percent' and (tolerance is None or tolerance < 0):
+			raise ValueError("The %s criterion needs a tolerance >= 0"%(criterion))
+		if matching not in self.MATCHINGS:
+			raise ValueError("Unknown matching: %s"%(matching))
+		self.percent = percent
+		self.tolerance = tolerance
+		self.criterion = criterion
+		self.matching = matching
+	def key(self):
+		'''
+		# Returns
+		JSON serializable description (the percent when only it is used)
+		'''
+		if self.criterion == 'percent' and self.matching == 'greedy':
+			return self.percent
+		ret = [self.percent, self.tolerance, self.criterion]
+		return ret+[self.matching] if self.matching != 'greedy' else ret
+	def __str__(self):
+		labels = {'percent':'%s%% overlap'%(self.percent), 'tolerance':'%s bp boundaries'%(self.tolerance)}
+		if self.criterion == 'both':
+			return '%s and %s'%(labels['percent'], labels['tolerance'])
+		return labels[self.criterion]
+	def mask(self, a_starts, a_ends, b_starts, b_ends):
+		'''
+		# Returns
+		np.ndarray: Whether every A and B pair matches
+		'''
+		if self.criterion == 'tolerance':
+			return boundary_mask(a_starts, a_ends, b_starts, b_ends, self.tolerance)
+		ret = overlap_r_mask(a_starts, a_ends, b_starts, b_ends, self.percent)
+		if self.criterion == 'both':
+			ret &= boundary_mask(a_starts, a_ends, b_starts, b_ends, self.tolerance)
+		return ret
+	def candidates(self, qstarts, qends, index):
+		'''
+		Finds the intervals of an index that could match each query:
+		overlapping intervals for percent thresholds, or intervals with
+		nearby boundaries for tolerance alone
+
+		# Parameters
+		qstarts (array): Query starts
+		qends (array): Exclusive query ends
+		index (interval_index): Intervals to search
+
+		# Returns
+		np.ndarray: Query indices
+		np.ndarray: Indices of candidate intervals, ordered by start for each query
+		'''
+		if self.criterion == 'tolerance':
+			return index.query_boundaries(qstarts, qends, self.tolerance)
+		return index.query(qstarts, qends)
+	def pairs(self, qstarts, qends, index):
+		'''
+		# Returns
+		np.ndarray: Query indices
+		np.ndarray: Indices of matching intervals, ordered by start for each query
+		'''
+		qstarts, qends = _as_int64(qstarts, qends)
+		qidx, hidx = self.candidates(qstarts, qends, index)
+		mask = self.mask(qstarts[qidx], qends[qidx], index.starts[hidx], index.ends[hidx])
+		return qidx[mask], hidx[mask]
+
+def as_criterion(p):
+	'''
+	# Returns
+	match_criterion: p itself, or a percent threshold of p
+	'''
+	return p if isinstance(p, match_criterion) else match_criterion(p)
+
+def overlap_r_pairs(A, B, overlap_p=95):
+	'''
+	Finds every pair of A and B interval tuples with reciprocal overlap
+	(or another match_criterion). Candidates come from one batched index
+	query and are checked with a single mask call.
+
+	# Parameters
+	A (list): (start, end, ...) tuples
+	B (list): (start, end, ...) tuples
+	overlap_p (int): Reciprocal percent overlap threshold or match_criterion
+
+	# Returns
+	np.ndarray: Indices into A
+	np.ndarray: Indices into B, ordered by start for each A
+
+	>>> overlap_r_pairs([(0, 10), (50, 60)], [(55, 60), (1, 10), (0, 11)], 90)
+	(array([0, 0]), array([2, 1]))
+	'''
+	if not len(A) or not len(B):
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+	a = np.array([t[:2] for t in A], dtype=np.int64)
+	b = np.array([t[:2] for t in B], dtype=np.int64)
+	index = interval_index(b[:,0], b[:,1], np.zeros(len(b)), np.arange(len(b)))
+	qidx, hidx = as_criterion(overlap_p).pairs(a[:,0], a[:,1], index)
+	return qidx, index.element[hidx].astype(np.int64)
 def _decode(obj):
 	if isinstance(obj, tuple):
 		return obj
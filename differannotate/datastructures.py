@@ -37,6 +37,7 @@
 
 from quicksect import IntervalTree
 import logging
+import numpy as np
 from differannotate.constants import FORMAT
 
 logger = logging.getLogger(__name__)
@@ -70,6 +71,9 @@ class dict_index(dict):
 	Traceback (most recent call last):
 	...
 	TypeError: dog
+	>>> DC = DI.copy()
+	>>> DC['fish'], len(DI)
+	(2, 2)
 	'''
 	def __init__(self):
 		super(dict_index,self).__init__()
@@ -83,6 +87,15 @@ class dict_index(dict):
 			return super(dict_index,self).__getitem__(key)
 	def __setitem__(self, key, value):
 		pass
+	def copy(self):
+		'''
+		# Returns
+		dict_index: independent copy that continues from the same id
+		'''
+		ret = dict_index()
+		dict.update(ret, self)
+		ret.cur = self.cur
+		return ret
 	def getkey(self, val):
 		'''
 		# Parameters
@@ -105,7 +118,7 @@ class iterit(IntervalTree):
 		super(iterit,self).__init__()
 		self.min = None
 		self.max = None
-		self.set_cache = {}
+		self._index = None
 	def add(self, start, end, other=None):
 		if self.min == None:
 			self.min = start
@@ -116,6 +129,15 @@ class iterit(IntervalTree):
 			if end > self.max:
 				self.max = end
 		super(iterit,self).add(start, end, other)
+		self._index = None
+	def to_index(self):
+		'''
+		# Returns
+		interval_index: cached static index of all intervals
+		'''
+		if self._index is None:
+			self._index = interval_index.from_iterit(self)
+		return self._index
 	def iterintervals(self):
 		return super(iterit,self).search(self.min, self.max)
 	def iifilter(self, eid, col, strand=False):
@@ -145,15 +167,288 @@ class iterit(IntervalTree):
 		else:
 			return list(filter(lambda x: len(x.data) > col and x.data[col] == eid, super(iterit,self).search(start, end)))
 	def to_set(self,eid=False, col=False, strand=False):
-		cache_name = (eid, col, strand)
-		if cache_name in self.set_cache:
-			return self.set_cache[cache_name].copy()
 		if eid or col or strand:
-			ret = set(map(interval2tuple, self.iifilter(eid, col, strand)))
-		else:
-			ret = set(map(interval2tuple, self.iterintervals()))
-		self.set_cache[cache_name] = ret
-		return ret.copy()
+			return self.to_index().to_set(eid, col, strand)
+		return set(map(interval2tuple, self.iterintervals()))
+
+class interval_index(object):
+	'''
+	Static, array-backed interval index. Intervals are sorted by start
+	and split into bins of similar lengths, so a batch of queries finds
+	its candidates in each bin with two binary searches. A long interval,
+	like a chromosome-spanning region, only widens the search of its own
+	bin. The index is built in one vectorized pass from arrays, like the
+	columns of a parse, and answers whole batches of queries with flat
+	arrays of (query, hit) pairs.
+
+	Missing TE orders and superfamilies are stored as -1.
+
+	# Usage
+	>>> II = interval_index([0, 5, 10], [10, 15, 20], [0, 1, 1], [0, 1, 2])
+	>>> qidx, hidx = II.query([6, 0], [7, 1])
+	>>> list(qidx), list(hidx)
+	([0, 0, 1], [0, 1, 0])
+	'''
+	def __init__(self, starts, ends, strand, element, order=None, sufam=None):
+		starts = np.asarray(starts, dtype=np.int64)
+		ends = np.asarray(ends, dtype=np.int64)
+		n = len(starts)
+		order = np.full(n, -1, dtype=np.int32) if order is None else np.asarray(order, dtype=np.int32)
+		sufam = np.full(n, -1, dtype=np.int32) if sufam is None else np.asarray(sufam, dtype=np.int32)
+		sort_idx = np.lexsort((ends, starts))
+		self.starts = starts[sort_idx]
+		self.ends = ends[sort_idx]
+		self.strand = np.asarray(strand, dtype=np.int8)[sort_idx]
+		self.element = np.asarray(element, dtype=np.int32)[sort_idx]
+		self.order = order[sort_idx]
+		self.sufam = sufam[sort_idx]
+		self.min = int(self.starts[0]) if n else None
+		self.max = int(self.ends.max()) if n else None
+		# Bin by the bit length of each interval length
+		lengths = np.maximum(self.ends-self.starts, 1)
+		bins = np.ceil(np.log2(lengths)).astype(np.int64)
+		self._bins = []
+		for b in np.unique(bins):
+			rows = np.where(bins == b)[0]
+			self._bins.append((rows, self.starts[rows], int(lengths[rows].max())))
+	@classmethod
+	def from_iterit(cls, tree):
+		'''
+		Builds an index from the intervals of an iterit
+		'''
+		intervals = list(tree.iterintervals()) if tree.min is not None else []
+		cols = [[], [], [], [], [], []]
+		for interval in intervals:
+			D = interval.data if interval.data else (-1, -1)
+			cols[0].append(interval.start)
+			cols[1].append(interval.end)
+			cols[2].append(D[0])
+			cols[3].append(D[1])
+			cols[4].append(D[2] if len(D) > 2 else -1)
+			cols[5].append(D[3] if len(D) > 3 else -1)
+		return cls(*cols)
+	def __len__(self):
+		return len(self.starts)
+	def select(self, eid, col, strand=False):
+		'''
+		Finds the intervals of a feature
+
+		# Parameters
+		eid (int): Feature id
+		col (int): Can target {1:element, 2:te_order, 3:te_sufam}
+		strand (int): Only keep {0:'+', 1:'-'} intervals [False: both]
+
+		# Returns
+		np.ndarray: Sorted indices of the matching intervals
+
+		>>> II = interval_index([0, 5, 10], [10, 15, 20], [0, 1, 1], [0, 1, 1])
+		>>> list(II.select(1, 1)), list(II.select(1, 1, '+'))
+		([1, 2], [])
+		'''
+		assert(col >= 1)
+		mask = (None, self.element, self.order, self.sufam)[col] == eid
+		if _strand(strand):
+			mask &= self.strand == _get_strand(strand)
+		return np.where(mask)[0]
+	def tuples(self, idx):
+		'''
+		Converts intervals to the tuples of interval2tuple
+
+		# Parameters
+		idx (array): Indices of intervals
+
+		# Returns
+		list: (start, end, strand, element[, order, sufam]) tuples
+		'''
+		cols = [A[idx].tolist() for A in (self.starts, self.ends, self.strand, self.element, self.order, self.sufam)]
+		return [t[:4]+tuple([v for v in t[4:] if v >= 0]) for t in zip(*cols)]
+	def to_set(self, eid, col, strand=False):
+		'''
+		# Returns
+		set: Unique interval tuples of a feature
+		'''
+		return set(self.tuples(self.select(eid, col, strand)))
+	def query(self, qstarts, qends):
+		'''
+		Finds all intervals that overlap each [qstart, qend) query
+
+		# Parameters
+		qstarts (array): Query starts
+		qends (array): Exclusive query ends
+
+		# Returns
+		np.ndarray: Query indices
+		np.ndarray: Indices of overlapping intervals in this index,
+			sorted by query and then by position
+
+		Candidates in a bin start less than its longest length before the
+		query, so the ones that end before the query all cover one point
+		and are bounded by the depth of that bin.
+
+		>>> II = interval_index([0, 100, 200, 300], [10, 110, 210, 10**9], [0]*4, [0]*4)
+		>>> qidx, hidx = II.query([205, 500], [306, 501])
+		>>> list(qidx), list(hidx)
+		([0, 0, 1], [2, 3, 3])
+		'''
+		qstarts = np.asarray(qstarts, dtype=np.int64)
+		qends = np.asarray(qends, dtype=np.int64)
+		qidx, hidx = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+		for rows, bstarts, max_len in self._bins:
+			lo = np.searchsorted(bstarts, qstarts-max_len, 'right')
+			hi = np.searchsorted(bstarts, qends, 'left')
+			counts = np.maximum(hi-lo, 0)
+			q = np.repeat(np.arange(len(qstarts)), counts)
+			first = np.cumsum(counts)-counts
+			h = rows[lo[q]+np.arange(len(q))-first[q]]
+			mask = self.ends[h] > qstarts[q]
+			qidx.append(q[mask])
+			hidx.append(h[mask])
+		qidx, hidx = np.concatenate(qidx), np.concatenate(hidx)
+		order = np.lexsort((hidx, qidx))
+		return qidx[order], hidx[order]
+	def query_boundaries(self, qstarts, qends, tolerance):
+		'''
+		Finds all intervals whose start and end are both within tolerance
+		bases of the start and end of each query. Candidates come from a
+		binary search of the sorted starts, so intervals do not need to
+		overlap their queries.
+
+		# Parameters
+		qstarts (array): Query starts
+		qends (array): Exclusive query ends
+		tolerance (int): Maximum distance between boundaries
+
+		# Returns
+		np.ndarray: Query indices
+		np.ndarray: Indices of matching intervals in this index
+
+		>>> II = interval_index([0, 5, 10], [10, 15, 20], [0, 1, 1], [0, 1, 2])
+		>>> qidx, hidx = II.query_boundaries([3, 40], [12, 50], 5)
+		>>> list(qidx), list(hidx)
+		([0, 0], [0, 1])
+		'''
+		qstarts = np.asarray(qstarts, dtype=np.int64)
+		qends = np.asarray(qends, dtype=np.int64)
+		lo = np.searchsorted(self.starts, qstarts-tolerance, 'left')
+		hi = np.searchsorted(self.starts, qstarts+tolerance, 'right')
+		counts = hi-lo
+		qidx = np.repeat(np.arange(len(qstarts)), counts)
+		first = np.cumsum(counts)-counts
+		hidx = lo[qidx]+np.arange(len(qidx))-first[qidx]
+		mask = np.abs(self.ends[hidx]-qends[qidx]) <= tolerance
+		return qidx[mask], hidx[mask]
+
+class length_sketch(object):
+	'''
+	Mergeable streaming summary of feature lengths. Exact counts, sums,
+	and extremes are kept alongside a log-bucketed histogram that answers
+	quantile queries within a relative error of alpha.
+
+	# Usage
+	>>> LS = length_sketch()
+	>>> LS.add([100, 200, 300])
+	>>> LS.count, LS.min, LS.max
+	(3, 100, 300)
+	>>> abs(LS.quantile(0.5) - 200) <= 200*LS.alpha
+	True
+	>>> LS2 = length_sketch()
+	>>> LS2.add([400])
+	>>> LS.merge(LS2).count
+	4
+	'''
+	n_bins = 2048
+	def __init__(self, alpha=0.01):
+		self.alpha = alpha
+		self.gamma = (1.0+alpha)/(1.0-alpha)
+		self._lg = np.log(self.gamma)
+		self.bins = np.zeros(self.n_bins, dtype=np.int64)
+		self.count = 0
+		self.sum = 0
+		self.min = None
+		self.max = None
+	def add(self, lengths):
+		'''
+		# Parameters
+		lengths (iterable): Positive feature lengths
+		'''
+		A = np.fromiter(lengths, dtype=np.int64) if not isinstance(lengths, np.ndarray) else lengths.astype(np.int64)
+		if not len(A): return
+		assert(A.min() > 0)
+		idx = np.minimum(np.ceil(np.log(A)/self._lg).astype(np.int64), self.n_bins-1)
+		self.bins += np.bincount(idx, minlength=self.n_bins)
+		self.count += len(A)
+		self.sum += int(A.sum())
+		amin, amax = int(A.min()), int(A.max())
+		self.min = amin if self.min is None else min(self.min, amin)
+		self.max = amax if self.max is None else max(self.max, amax)
+	def merge(self, other):
+		'''
+		Adds the contents of another sketch with the same alpha
+
+		# Returns
+		length_sketch: self
+		'''
+		assert(self.alpha == other.alpha)
+		if not other.count: return self
+		self.bins += other.bins
+		self.count += other.count
+		self.sum += other.sum
+		self.min = other.min if self.min is None else min(self.min, other.min)
+		self.max = other.max if self.max is None else max(self.max, other.max)
+		return self
+	def __len__(self):
+		return self.count
+	def _value(self, idx):
+		return 2.0*self.gamma**idx/(self.gamma+1.0)
+	def quantile(self, q):
+		'''
+		# Returns
+		float: Approximate q quantile (nan when empty)
+		'''
+		if not self.count: return np.nan
+		if q <= 0: return float(self.min)
+		if q >= 1: return float(self.max)
+		rank = q*(self.count-1)
+		idx = np.searchsorted(np.cumsum(self.bins), rank, 'right')
+		return float(min(max(self._value(idx), self.min), self.max))
+	@property
+	def mean(self):
+		return float(self.sum)/self.count if self.count else np.nan
+	def histogram(self):
+		'''
+		# Returns
+		np.ndarray: Lower bin edges of non-empty bins
+		np.ndarray: Upper bin edges of non-empty bins
+		np.ndarray: Counts of non-empty bins
+		'''
+		idx = np.nonzero(self.bins)[0]
+		return self.gamma**(idx-1), self.gamma**idx, self.bins[idx]
+	def summary(self):
+		'''
+		# Returns
+		tuple: (count, min, q1, median, q3, max)
+		'''
+		if not self.count:
+			return (0, np.nan, np.nan, np.nan, np.nan, np.nan)
+		return (self.count, self.min, self.quantile(0.25), self.quantile(0.5), self.quantile(0.75), self.max)
+	def boxplot_stats(self, transform=None, whis=1.5):
+		'''
+		Creates box statistics for matplotlib's Axes.bxp. Whiskers extend
+		to the most extreme quantile within whis*IQR and the extremes are
+		shown as fliers when they fall outside of the whiskers.
+
+		# Parameters
+		transform (function): Applied to every statistic (e.g. np.sqrt)
+		'''
+		f = transform if transform else (lambda x: x)
+		if not self.count:
+			return {'med':np.nan, 'q1':np.nan, 'q3':np.nan, 'whislo':np.nan, 'whishi':np.nan, 'fliers':[]}
+		q1, med, q3 = [f(self.quantile(q)) for q in (0.25, 0.5, 0.75)]
+		lo, hi = f(float(self.min)), f(float(self.max))
+		iqr = q3 - q1
+		whislo, whishi = max(lo, q1-whis*iqr), min(hi, q3+whis*iqr)
+		fliers = [v for v in (lo, hi) if v < whislo or v > whishi]
+		return {'med':med, 'q1':q1, 'q3':q3, 'whislo':whislo, 'whishi':whishi, 'fliers':fliers}
 
 def _strand(strand):
 	return not isinstance(strand, bool)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+
+import logging, os, re
+from differannotate.constants import FORMAT
+from differannotate import results, summaries
+from differannotate.windows import TRACK_CATEGORIES, track_name
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+FORMATS = ('bed', 'gff3')
+CLASSES = ('tp', 'fp', 'fn')
+_id_re = re.compile('(?:^|;)\s*ID=(?P<id>[^;]+)')
+
+class feature_exporter(object):
+	'''
+	Streams the TP, FP, and FN features of every treatment to sorted BED
+	or GFF3 files with their original attributes. Files are written as
+	[directory]/[sample]/[category]_[feature]_[strand]_[class].[ext], where
+	the category is element, order, or sufam, and records are
+	appended as each chromosome finishes, so matches are never held for
+	the whole genome.
+
+	BED files are BED12+1: twelve standard columns describing each
+	feature as a single block, followed by the GFF3 attributes, so BED12
+	readers ignore the extra column.
+
+	TP features are the treatment features that matched the control, FP
+	features are unmatched treatment features, and FN features are the
+	control features missed by the treatment.
+
+	# Parameters
+	directory (str): Output directory
+	GI (gff3_interval): Annotations parsed with offsets=True
+	fmt (str): 'bed' or 'gff3'
+	'''
+	def __init__(self, directory, GI, fmt='bed'):
+		if fmt not in FORMATS:
+			raise ValueError("%s is not one of %s"%(fmt, ', '.join(FORMATS)))
+		if not GI.gff3_offsets:
+			raise ValueError("Annotations need to be parsed with offsets=True")
+		self.directory = directory
+		self.GI = GI
+		self.fmt = fmt
+		self.files = {}
+		self.written = set()
+		self._handles = {}
+	def _handle(self, name):
+		if name not in self._handles:
+			self._handles[name] = open(self.GI.gff3_files[name], 'r')
+		return self._handles[name]
+	def close(self):
+		for IF in self._handles.values():
+			IF.close()
+		self._handles = {}
+	def lines(self, name, chrom, tuples):
+		'''
+		Reads the original GFF3 lines of interval tuples in sorted order
+
+		# Parameters
+		name (str): Annotation name
+		chrom (str): Chromosome
+		tuples (set): Interval tuples from calc_intersect_2
+
+		# Returns
+		list: GFF3 lines
+		'''
+		offsets = self.GI.gff3_offsets[name][chrom]
+		IF = self._handle(name)
+		ret = []
+		for tup in sorted(tuples):
+			for offset in offsets[tup]:
+				IF.seek(offset)
+				ret.append(IF.readline())
+		return ret
+	def _format(self, line):
+		if self.fmt == 'gff3':
+			return line if line.endswith('\n') else line+'\n'
+		tmp = line.rstrip('\n').split('\t')
+		match = _id_re.search(tmp[8])
+		name = match.group('id') if match else '.'
+		start, end = int(tmp[3])-1, int(tmp[4])
+		score = tmp[5] if tmp[5].isdigit() else '0'
+		# thickStart, thickEnd, itemRgb, and one block spanning the feature
+		bed = [tmp[0], start, end, name, score, tmp[6], start, end, '0', 1, '%i,'%(end-start), '0,']
+		return '\t'.join(map(str, bed+[tmp[8]]))+'\n'
+	def path(self, sample, col, elem, sstrand, cls):
+		name = "%s_%s_%s_%s.%s"%(TRACK_CATEGORIES[col], track_name(elem), sstrand, cls, self.fmt)
+		return os.path.join(self.directory, track_name(sample), name)
+	def write(self, sample, col, elem, sstrand, cls, lines):
+		'''
+		Appends formatted lines to a feature file, truncating it the first
+		time it is written in this run
+		'''
+		path = self.path(sample, col, elem, sstrand, cls)
+		if path not in self.written:
+			if not os.path.exists(os.path.dirname(path)):
+				os.makedirs(os.path.dirname(path))
+			mode = 'w'
+			self.written.add(path)
+		else:
+			mode = 'a'
+		with open(path, mode) as OF:
+			if mode == 'w' and self.fmt == 'gff3':
+				OF.write('##gff-version 3\n')
+			OF.writelines(map(self._format, lines))
+	def export_unit(self, unit, p=95):
+		'''
+		Writes the features of every row in a region_result. Match sets
+		are reused from the unit when it was created with match_sets=True
+		and are computed otherwise.
+		'''
+		GI = self.GI
+		cname = GI.gff3_names[0]
+		strands = dict(summaries.STRANDS)
+		elem_lists = dict(summaries._category_list(GI, True))
+		for chrom, sstr, category, elem in unit.rows:
+			key = (chrom, sstr, category, elem)
+			col = results.CATEGORIES.index(category)
+			eid = elem_lists[col][elem]
+			for name in GI.gff3_names[1:]:
+				if (key, name) in unit.matches:
+					Ab, aB, AB = unit.matches[(key, name)]
+				else:
+					Ab, aB, AB = GI.calc_intersect_2(chrom, cname, name, eid, col, p, strand=strands[sstr], ret_set=True)
+				tp = GI.gff3_trees[name][chrom].to_index().to_set(eid, col, strands[sstr]) - aB
+				for cls, source, tuples in (('tp', name, tp), ('fp', name, aB), ('fn', cname, Ab)):
+					self.write(name, col, elem, summaries._sstrand(sstr), cls, self.lines(source, chrom, tuples))
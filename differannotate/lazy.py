@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+import importlib, threading
+
+class lazy_module(object):
+	'''
+	Defers importing a module until one of its attributes is accessed.
+	This keeps heavy optional back-ends (matplotlib, pysam) out of
+	start-up when they are not needed.
+
+	# Parameters
+	name (str): Module to import
+	setup (function): Called once before the first import
+
+	# Usage
+	>>> json = lazy_module('json')
+	>>> json.loaded
+	False
+	>>> json.dumps([1])
+	'[1]'
+	>>> json.loaded
+	True
+	'''
+	def __init__(self, name, setup=None):
+		self.__dict__['_name'] = name
+		self.__dict__['_setup'] = setup
+		self.__dict__['_module'] = None
+		self.__dict__['_lock'] = threading.Lock()
+	@property
+	def loaded(self):
+		return self._module is not None
+	def load(self):
+		if self._module is None:
+			with self._lock:
+				if self._module is None:
+					if self._setup:
+						self._setup()
+					self.__dict__['_module'] = importlib.import_module(self._name)
+		return self._module
+	def __getattr__(self, attr):
+		return getattr(self.load(), attr)
+	def __setattr__(self, attr, value):
+		setattr(self.load(), attr, value)
+	def __repr__(self):
+		return "<lazy_module %s%s>"%(self._name, '' if self.loaded else ' (not loaded)')
+
+def _use_agg():
+	import matplotlib
+	matplotlib.use('Agg')
+
+# Plotting back-ends
+plt = lazy_module('matplotlib.pyplot', setup=_use_agg)
+matplotlib_venn = lazy_module('matplotlib_venn', setup=_use_agg)
+# FASTA and process pool back-ends
+pysam = lazy_module('pysam')
+mp = lazy_module('multiprocessing')
+# Optional job file format
+yaml = lazy_module('yaml')
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
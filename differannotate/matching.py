@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+
+import logging
+import numpy as np
+from collections import defaultdict as dd
+from differannotate.constants import FORMAT
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+def components(left, right):
+	'''
+	Labels the connected component of every edge of a bipartite graph
+
+	# Parameters
+	left (array): Left node of every edge
+	right (array): Right node of every edge
+
+	# Returns
+	np.ndarray: Component label of every edge
+
+	>>> list(components([0, 1, 2, 2], [0, 0, 1, 2]))
+	[0, 0, 2, 2]
+	'''
+	left = np.asarray(left, dtype=np.int64)
+	right = np.asarray(right, dtype=np.int64)
+	n_left = int(left.max())+1 if len(left) else 0
+	parent = list(range(n_left+(int(right.max())+1 if len(right) else 0)))
+	def find(x):
+		root = x
+		while parent[root] != root:
+			root = parent[root]
+		while parent[x] != root:
+			parent[x], x = root, parent[x]
+		return root
+	for a, b in zip(left.tolist(), (right+n_left).tolist()):
+		ra, rb = find(a), find(b)
+		if ra != rb:
+			parent[max(ra, rb)] = min(ra, rb)
+	return np.array([find(a) for a in left.tolist()], dtype=np.int64)
+
+def _cardinality(left, right):
+	'''
+	Maximum-cardinality matching of one component. A greedy matching is
+	grown with breadth-first augmenting paths.
+	'''
+	adj = dd(list)
+	for a, b in zip(left, right):
+		adj[a].append(b)
+	match_l, match_r = {}, {}
+	for a in sorted(adj):
+		for b in adj[a]:
+			if b not in match_r:
+				match_l[a], match_r[b] = b, a
+				break
+	for root in sorted(adj):
+		if root in match_l: continue
+		prev, queue, found = {}, [root], None
+		for a in queue:
+			for b in adj[a]:
+				if b in prev: continue
+				prev[b] = a
+				if b not in match_r:
+					found = b
+					break
+				queue.append(match_r[b])
+			if found is not None: break
+		while found is not None:
+			a = prev[found]
+			nxt = match_l.get(a)
+			match_l[a], match_r[found] = found, a
+			found = nxt
+	return sorted(match_l.items())
+
+def assignment(W):
+	'''
+	Maximum-weight assignment of every row of W to a different column
+	with the shortest augmenting path form of the Hungarian algorithm
+
+	# Parameters
+	W (np.ndarray): (rows, cols) weights with rows <= cols
+
+	# Returns
+	np.ndarray: Column of every row
+
+	>>> list(assignment(np.array([[3, 2, 0], [2, 0, 0]])))
+	[1, 0]
+	'''
+	cost = -np.asarray(W, dtype=np.float64)
+	n, m = cost.shape
+	assert(n <= m)
+	u, v = np.zeros(n+1), np.zeros(m+1)
+	p, way = np.zeros(m+1, dtype=np.int64), np.zeros(m+1, dtype=np.int64)
+	for i in range(1, n+1):
+		p[0], j0 = i, 0
+		minv = np.full(m+1, np.inf)
+		used = np.zeros(m+1, dtype=bool)
+		while True:
+			used[j0] = True
+			i0 = p[j0]
+			free = ~used[1:]
+			cur = cost[i0-1]-u[i0]-v[1:]
+			better = free & (cur < minv[1:])
+			minv[1:][better] = cur[better]
+			way[1:][better] = j0
+			j1 = int(np.argmin(np.where(free, minv[1:], np.inf)))+1
+			delta = minv[j1]
+			u[p[used]] += delta
+			v[used] -= delta
+			minv[1:][free] -= delta
+			j0 = j1
+			if p[j0] == 0: break
+		while j0:
+			j1 = way[j0]
+			p[j0] = p[j1]
+			j0 = j1
+	ret = np.zeros(n, dtype=np.int64)
+	ret[p[1:][p[1:] > 0]-1] = np.where(p[1:] > 0)[0]
+	return ret
+
+def _weighted(left, right, weights):
+	'''
+	Maximum-cardinality matching of one component that also maximizes the
+	total weight. Every edge is worth more than all weights combined, so
+	the number of matches always comes first.
+	'''
+	L, li = np.unique(left, return_inverse=True)
+	R, ri = np.unique(right, return_inverse=True)
+	bonus = float(np.sum(weights))+1
+	W = np.zeros((len(L), len(R)))
+	W[li, ri] = np.asarray(weights, dtype=np.float64)+bonus
+	if len(L) <= len(R):
+		rows, cols = np.arange(len(L)), assignment(W)
+	else:
+		rows, cols = assignment(W.T), np.arange(len(R))
+	keep = W[rows, cols] > 0
+	return list(zip(L[rows[keep]].tolist(), R[cols[keep]].tolist()))
+
+def maximum_matching(left, right, weights=None):
+	'''
+	Finds a maximum-cardinality one-to-one matching of a sparse bipartite
+	graph, solving every connected component on its own. Components with
+	a single edge, which are most of them, are matched without a solver.
+
+	# Parameters
+	left (array): Left node of every edge
+	right (array): Right node of every edge
+	weights (array): Also maximize the total weight of the matches, like
+		overlapping bases [None]
+
+	# Returns
+	np.ndarray: Matched left nodes
+	np.ndarray: Matched right nodes, in the order of the left nodes
+
+	>>> L, R = maximum_matching([0, 0, 1], [0, 1, 0])
+	>>> list(L), list(R)
+	([0, 1], [1, 0])
+	'''
+	left = np.asarray(left, dtype=np.int64)
+	right = np.asarray(right, dtype=np.int64)
+	if not len(left):
+		return left, right
+	weights = np.asarray(weights, dtype=np.float64) if weights is not None else None
+	# Edges between two nodes without other edges are their own component
+	single = (np.bincount(left)[left] == 1) & (np.bincount(right)[right] == 1)
+	pairs = list(zip(left[single].tolist(), right[single].tolist()))
+	rest = np.flatnonzero(~single)
+	labels = components(left[rest], right[rest])
+	order = rest[np.argsort(labels, kind='mergesort')]
+	bounds = np.flatnonzero(np.diff(np.sort(labels, kind='mergesort')))+1
+	for idx in (np.split(order, bounds) if len(rest) else []):
+		if weights is None:
+			pairs += _cardinality(left[idx].tolist(), right[idx].tolist())
+		else:
+			pairs += _weighted(left[idx], right[idx], weights[idx])
+	pairs.sort()
+	ret = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+	return ret[:,0], ret[:,1]
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+
+import logging, sys, resource
+import numpy as np
+from time import time
+from contextlib import contextmanager
+from differannotate.constants import FORMAT
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+STRATEGIES = ('dense', 'tiled', 'intervals')
+MIN_TILE = 1000000
+# Bytes of index, event, and sort arrays for every interval
+INTERVAL_BYTES = 128
+
+def _mb(nbytes):
+	return nbytes/2.0**20
+
+def dense_bytes(length, rows):
+	'''
+	Peak bytes of a dense base stage. Both-strand, forward, and reverse
+	boolean arrays are alive at once, along with the membership codes and
+	their temporaries.
+
+	>>> dense_bytes(100, 2)
+	3000
+	'''
+	return length*(3*rows+3*8)
+
+def interval_bytes(n_intervals):
+	'''
+	Peak bytes of interval arithmetic for a number of intervals
+	'''
+	return INTERVAL_BYTES*n_intervals
+
+def current_rss():
+	'''
+	# Returns
+	int: Resident set size of this process in bytes
+	'''
+	try:
+		with open('/proc/self/statm') as IF:
+			return int(IF.read().split()[1])*resource.getpagesize()
+	except (IOError, OSError):
+		return peak_rss()
+
+def peak_rss(children=False):
+	'''
+	# Returns
+	int: Peak resident set size of this process (or its finished
+		workers) in bytes
+	'''
+	who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+	maxrss = resource.getrusage(who).ru_maxrss
+	# Linux reports kilobytes and macOS reports bytes
+	return maxrss if sys.platform == 'darwin' else maxrss*1024
+
+def reset_peak_rss():
+	'''
+	Resets the peak RSS of this process when the kernel allows it
+
+	# Returns
+	bool: Peak was reset
+	'''
+	try:
+		with open('/proc/self/clear_refs', 'w') as OF:
+			OF.write('5')
+		return True
+	except (IOError, OSError):
+		return False
+
+class execution_plan(object):
+	'''
+	Strategy for the base pair stage and the number of workers
+
+	# Attributes
+	strategy (str): 'dense' arrays of whole chromosomes, 'tiled' arrays of
+		at most tile bases, or 'intervals' arithmetic without base arrays
+	tile (int): Tile width of the tiled strategy
+	workers (int): Worker processes
+	budget (int): Memory budget in bytes
+	estimate (int): Estimated peak bytes of one base stage unit
+	'''
+	def __init__(self, strategy='dense', tile=None, workers=1, budget=None, estimate=None):
+		assert(strategy in STRATEGIES)
+		self.strategy = strategy
+		self.tile = tile
+		self.workers = workers
+		self.budget = budget
+		self.estimate = estimate
+	def __repr__(self):
+		tile = ' tile=%i'%(self.tile) if self.strategy == 'tiled' else ''
+		return "execution_plan(%s%s workers=%i)"%(self.strategy, tile, self.workers)
+
+def plan(GI, max_memory=None, procs=1, rows=None, chroms=None, min_tile=MIN_TILE):
+	'''
+	Estimates the footprint of a base stage unit from chromosome lengths,
+	interval counts, and the number of annotations, and picks the cheapest
+	strategy that stays within the memory left after parsing. Dense arrays
+	are kept whenever they fit, tiles are used while they are at least
+	min_tile bases wide, and interval arithmetic is the fallback.
+
+	# Parameters
+	GI (gff3_interval): Parsed annotations
+	max_memory (int): Memory budget in bytes [unlimited]
+	procs (int): Requested worker processes
+	rows (int): Annotations held in each array [all]
+	chroms (list): Chromosomes to analyze [all shared]
+	min_tile (int): Smallest tile width
+
+	# Returns
+	execution_plan
+	'''
+	rows = len(GI.gff3_names) if rows is None else rows
+	chroms = chroms if chroms else sorted(GI.get_chrom_set())
+	if not max_memory or not chroms:
+		return execution_plan('dense', workers=procs)
+	length = max([GI._get_max(c) for c in chroms])
+	n_intervals = max([sum([len(GI.gff3_trees[n][c].to_index()) for n in GI.gff3_names]) for c in chroms])
+	available = max_memory-current_rss()
+	logger.debug("%.1f MB available for %i rows of at most %i bases and %i intervals"%(_mb(available), rows, length, n_intervals))
+	dense = dense_bytes(length, rows)
+	tile = int(available//max(dense_bytes(1, rows), 1))
+	if dense <= available:
+		strategy, tile, estimate = 'dense', None, dense
+	elif tile >= min_tile:
+		strategy, estimate = 'tiled', dense_bytes(tile, rows)
+	else:
+		strategy, tile, estimate = 'intervals', None, interval_bytes(n_intervals)
+		if estimate > available:
+			logger.warn("Interval arithmetic needs about %.1f MB, which exceeds the %.1f MB left in the budget"%(_mb(estimate), _mb(available)))
+	# Forked workers share the parsed annotations, so only units are added
+	workers = int(max(1, min(procs, available//max(estimate, 1))))
+	if workers < procs:
+		logger.info("Reduced workers from %i to %i to stay within the memory budget"%(procs, workers))
+	ret = execution_plan(strategy, tile, workers, max_memory, estimate)
+	logger.info("Planned %s"%(ret))
+	return ret
+
+class stage_monitor(object):
+	'''
+	Records the runtime and peak RSS of every stage in a run
+
+	# Usage
+	>>> SM = stage_monitor()
+	>>> with SM.stage('parse'):
+	...     pass
+	>>> SM.stages[0][0]
+	'parse'
+	'''
+	def __init__(self):
+		self.stages = []
+	@contextmanager
+	def stage(self, name, strategy=''):
+		reset = reset_peak_rss()
+		start = time()
+		try:
+			yield
+		finally:
+			self.stages.append((name, strategy, time()-start, peak_rss(), peak_rss(children=True), reset))
+	def report(self, level=logging.INFO):
+		'''
+		Logs a table of every recorded stage
+		'''
+		template = "{:<12} {:<10} {:>9} {:>13} {:>13}"
+		logger.log(level, template.format("Stage", "Strategy", "Seconds", "Peak RSS (MB)", "Workers (MB)"))
+		for name, strategy, seconds, rss, children, reset in self.stages:
+			# Without a reset, the peak includes every earlier stage
+			rss = "%.1f"%(_mb(rss)) if reset else "<=%.1f"%(_mb(rss))
+			logger.log(level, template.format(name, strategy, "%.2f"%(seconds), rss, "%.1f"%(_mb(children))))
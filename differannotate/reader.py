@@ -35,27 +35,27 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 ###############################################################################
 
-import logging, re, os, sys
+import logging, re, os, sys, copy, hashlib
 import numpy as np
-import multiprocessing as mp
 from functools import partial
-from pysam import FastaFile
 from collections import Counter
 from collections import defaultdict as dd
 from differannotate.constants import FORMAT, BaseIndex
+from differannotate.lazy import pysam, mp
+from differannotate import refstore, transcripts, matching
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.WARN, format=FORMAT)
 
 from differannotate.datastructures import *
-from differannotate.comparisons import overlap_r, _overlap_r_tup
+from differannotate.comparisons import overlap_r, _overlap_r_tup, overlap_r_mask, overlap_r_pairs, overlap_bases, as_criterion
 
 class gff3_interval:
 	def __init__(self, gff3, name='control', fasta=None, include_chrom=False, force=False, \
 			chrom_names=['chromosome','contig','supercontig'], \
-			te_names=['transposable_element', 'transposable_element_gene', 'transposon_fragment']):
-		self._order_re = re.compile('[Oo]rder=(?P<order>[^;/]+)')
-		self._sufam_re = re.compile('[Ss]uperfamily=(?P<sufam>[^;]+)')
+			te_names=['transposable_element', 'transposable_element_gene', 'transposon_fragment'], \
+			chains=False, digests=False, features=None, exclude_features=None, chroms=None, \
+			offsets=False, treatments=(), procs=1):
 		self.element_dict = dict_index()
 		self.order_dict = dict_index()
 		self.sufam_dict = dict_index()
@@ -63,16 +63,38 @@ class gff3_interval:
 		self.chrom_names = set(chrom_names)
 		self.te_names = set(te_names)
 		self.include_chrom = include_chrom
+		# Pushdown filters applied while each GFF3 is streamed
+		self.features = set([f.lower() for f in features]) if features else None
+		self.exclude_features = set([f.lower() for f in exclude_features]) if exclude_features else set()
+		self.chroms = set(chroms) if chroms else None
+		# Exon and CDS chains of each transcript are only collected on request
+		self.chains = chains
+		self.gff3_chains = {}
+		# Per-chromosome content digests of each input for delta runs
+		self.digests = digests
+		self.gff3_digests = {}
+		# File offsets of every indexed line for exporting original records
+		self.offsets = offsets
+		self.gff3_offsets = {}
+		self.gff3_files = {}
 		self.chrom_lens = None
 		self.FA = False
 		self.pool = False
-		if fasta and os.path.exists(fasta+'.fai'):
-			self.FA = FastaFile(fasta)
-			self.chrom_lens = self._parse_fai(fasta+'.fai')
-			self.pool = mp.Pool(4, worker_init, (fasta,))
+		if fasta:
+			try:
+				# Memory-mapped and shared by every process through the page cache
+				self.FA = refstore.open_reference(fasta)
+				self.chrom_lens = dict(self.FA.lengths)
+			except (IOError, OSError) as e:
+				logger.warn("Unable to use a packed reference (%s), falling back to pysam"%(e))
+				if os.path.exists(fasta+'.fai'):
+					self.FA = pysam.FastaFile(fasta)
+					self.chrom_lens = self._parse_fai(fasta+'.fai')
+					self.pool = mp.Pool(4, worker_init, (fasta,))
 		# create the initial interval tree
-		self.gff3_trees = {name:self._2tree(gff3)}
-		self.gff3_names = [name]
+		self.gff3_trees = {}
+		self.gff3_names = []
+		self.add_gff3s([(gff3, name)]+list(treatments), procs)
 	def __del__(self):
 		if self.pool:
 			self.pool.close()
@@ -90,42 +112,129 @@ class gff3_interval:
 		with open(fai_file,'r') as FAI:
 			return dict(map(lambda y: (y[0], int(y[1])), map(lambda y: y.split('\t'), FAI.readlines())))
 	def add_gff3(self, gff3, name):
-		self.gff3_trees[name] = self._2tree(gff3)
-		self.gff3_names.append(name)
-	def _2tree(self, gff3):
-		#Chr1    TAIR10  transposable_element_gene       433031  433819  .       -       .       ID=AT1G02228;Note=transposable_element_gene;Name=AT1G02228;Derives_from=AT1TE01405
+		self.add_gff3s([(gff3, name)])
+	def add_gff3s(self, files, procs=1):
+		'''
+		Parses several GFF3 files concurrently. Every file is split into
+		byte ranges aligned to lines, and each worker returns the columns
+		of one range with its own feature ids. The ranges of a file are
+		concatenated in order and the ids are reconciled in file order,
+		so every dictionary and tree matches the one of a sequential parse.
+
+		# Parameters
+		files (list): (gff3, name) pairs
+		procs (int): Worker processes
+		'''
+		files = list(files)
+		parsed = self._parse([gff3 for gff3, name in files], self._parse_settings(), procs)
+		for (gff3, name), cols in zip(files, parsed):
+			self._add_columns(gff3, name, cols)
+	def _parse(self, gff3s, settings, procs=1):
+		'''
+		# Returns
+		list: gff3_columns of each file
+		'''
+		ranges = [byte_ranges(gff3) for gff3 in gff3s]
+		tasks = [(gff3, settings, start, end) for gff3, R in zip(gff3s, ranges) for start, end in R]
+		if procs > 1 and len(tasks) > 1:
+			pool = mp.Pool(min(procs, len(tasks)))
+			try:
+				chunks = pool.map(_parse_worker, tasks, chunksize=1)
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			chunks = map(_parse_worker, tasks)
+		ret = []
+		for R in ranges:
+			ret.append(merge_columns(chunks[:len(R)]))
+			chunks = chunks[len(R):]
+		return ret
+	def _parse_settings(self):
 		exclude = set(self.chrom_names) if self.include_chrom else set([])
+		return {'exclude':exclude | self.exclude_features, 'features':self.features, \
+			'chroms':self.chroms, 'te_names':self.te_names, 'chains':self.chains, \
+			'digests':self.digests, 'offsets':self.offsets}
+	def _add_columns(self, gff3, name, cols):
+		interval_tree, offsets = self._columns2tree(cols)
+		self.gff3_trees[name] = interval_tree
+		self.gff3_files[name] = gff3
+		if offsets is not None:
+			self.gff3_offsets[name] = offsets
+		if cols.builder is not None:
+			self.gff3_chains[name] = cols.builder.build()
+		if cols.digests is not None:
+			self.gff3_digests[name] = cols.digests
+		self.gff3_names.append(name)
+	def _columns2tree(self, cols):
+		'''
+		Builds the interval trees of parsed columns after mapping their
+		local feature ids to the shared dictionaries. Intervals are added
+		in file order, so the trees match the ones of a sequential parse,
+		and the static index of every tree is built from the columns.
+
+		# Returns
+		dict: {chrom: iterit}
+		dict: {chrom: {interval tuple: [line offsets]}} or None
+		'''
+		eids = [self.element_dict[e] for e in cols.elements]
+		oids = [self.order_dict[o] for o in cols.orders]
+		sids = [self.sufam_dict[f] for f in cols.sufams]
 		interval_tree = dd(iterit)
-		with open(gff3,'r') as IF:
-			for line in filter(lambda x: x[0] != "#", IF):
-				tmp = line.rstrip('\n').split('\t')
-				try:
-					chrom, strand, element, attributes = tmp[0], tmp[6], tmp[2].lower(), tmp[8]
-				except:
-					print(tmp)
-					sys.exit(1)
-				if element not in exclude:
-					element_id = self.element_dict[element]
-					strand_id = self.strand_dict[strand]
-					start, end = map(int, tmp[3:5])
-					if element in self.te_names:
-						te_order, te_sufam = self._extract_order_sufam(attributes)
-						try:
-							te_order_id = self.order_dict[te_order]
-							te_sufam_id = self.sufam_dict[te_sufam]
-						except:
-							te_order_id, te_sufam_id = 0,0
-						# Interval tree is not inclusive on the upper limit
-						interval_tree[chrom].add(start-1, end, (strand_id, element_id, te_order_id, te_sufam_id))
-					else:
-						interval_tree[chrom].add(start-1, end, (strand_id, element_id))
-		return interval_tree
-	def _extract_order_sufam(self, attribute_string):
-		order_match = self._order_re.search(attribute_string)
-		sufam_match = self._sufam_re.search(attribute_string)
-		order_str = order_match.group('order') if order_match else ''
-		sufam_str = sufam_match.group('sufam') if sufam_match else ''
-		return (order_str, sufam_str)
+		trees = [interval_tree[c] for c in cols.chroms]
+		C = cols.columns
+		rows = zip(*[C[k].tolist() for k in COLUMNS[:-1]])
+		offsets = dd(dict) if 'offsets' in C else None
+		line_offsets = C['offsets'].tolist() if offsets is not None else None
+		for i, (chrom, start, end, strand_id, element, order, sufam) in enumerate(rows):
+			if order < 0:
+				data = (strand_id, eids[element])
+			else:
+				data = (strand_id, eids[element], oids[order], sids[sufam])
+			trees[chrom].add(start, end, data)
+			if offsets is not None:
+				offsets[cols.chroms[chrom]].setdefault((start, end)+data, []).append(line_offsets[i])
+		# Static indexes are built from the columns instead of the trees
+		if len(C['chrom']):
+			ids = [np.array(l, dtype=np.int32) for l in (eids, oids or [-1], sids or [-1])]
+			order, sufam = C['order'], C['sufam']
+			order = np.where(order < 0, -1, ids[1][np.maximum(order, 0)])
+			sufam = np.where(sufam < 0, -1, ids[2][np.maximum(sufam, 0)])
+			for c in np.unique(C['chrom']):
+				rows = C['chrom'] == c
+				trees[c]._index = interval_index(C['starts'][rows], C['ends'][rows], C['strand'][rows], \
+					ids[0][C['element'][rows]], order[rows], sufam[rows])
+		return interval_tree, offsets
+	def view(self, names=None):
+		'''
+		Creates a shallow copy that shares the parsed interval trees, but
+		keeps its own list of annotations and copies of the feature
+		dictionaries. This lets a resident control be compared against new
+		treatments without re-parsing it or modifying the original object.
+
+		# Parameters
+		names (list): Annotations to keep in the view [all]
+
+		# Returns
+		gff3_interval: view of the current object
+		'''
+		names = list(names) if names else list(self.gff3_names)
+		new_gi = copy.copy(self)
+		new_gi.gff3_trees = dict([(n, self.gff3_trees[n]) for n in names])
+		new_gi.gff3_names = names
+		new_gi.gff3_files = dict([(n, self.gff3_files[n]) for n in names if n in self.gff3_files])
+		new_gi.element_dict = self.element_dict.copy()
+		new_gi.order_dict = self.order_dict.copy()
+		new_gi.sufam_dict = self.sufam_dict.copy()
+		new_gi.gff3_chains = dict([(n, self.gff3_chains[n]) for n in names if n in self.gff3_chains])
+		new_gi.gff3_digests = dict([(n, self.gff3_digests[n]) for n in names if n in self.gff3_digests])
+		new_gi.gff3_offsets = dict([(n, self.gff3_offsets[n]) for n in names if n in self.gff3_offsets])
+		# The worker pool is owned by the original object
+		new_gi.pool = False
+		return new_gi
+	def _2tree(self, gff3):
+		settings = dict(self._parse_settings(), chains=False, digests=False, offsets=False)
+		return self._columns2tree(self._parse([gff3], settings)[0])[0]
 	def _get_max(self, chrom):
 		if self.chrom_lens:
 			return self.chrom_lens[chrom]
@@ -135,7 +244,7 @@ class gff3_interval:
 		for n in self.gff3_names[1:]:
 			ret_set &= set(self.gff3_trees[n])
 		return ret_set
-	def elem_array(self, chrom, eid, col=1, strand=True):
+	def elem_array(self, chrom, eid, col=1, strand=True, start=0, end=None, out=None):
 		'''
 		Creates a binary numpy array to represent the presence of
 		a specific element id
@@ -145,23 +254,30 @@ class gff3_interval:
 		eid (int): Element id
 		col (int): Can target {1:element, 2:te_order, 3:te_sufam}
 		strand (bool): Return stranded results
+		start (int): First base of the window [0]
+		end (int): Exclusive end of the window [chromosome length]
+		out (tuple): Zeroed (forward, reverse) arrays to fill, like
+			shared memory segments, instead of new ones
 
 		# Returns
 		np.ndarray: Forward (or both strands)
 		np.ndarray: Reverse strand
 		'''
-		max_size = self._get_max(chrom)
+		end = self._get_max(chrom) if end is None else end
+		max_size = end-start
 		num_rows = len(self.gff3_names)
-		p_array = np.zeros((num_rows, max_size), dtype=np.bool)
-		n_array = np.zeros((num_rows, max_size), dtype=np.bool)
+		if out is None:
+			p_array = np.zeros((num_rows, max_size), dtype=np.bool)
+			n_array = np.zeros((num_rows, max_size), dtype=np.bool)
+		else:
+			p_array, n_array = out[0], (out[1] if strand else [])
 		for i,name in enumerate(self.gff3_names):
-			iit = self.gff3_trees[name][chrom]
-			for interval in iit.search(0,max_size):
-				D = interval.data
-				if len(D) < col+1 or D[col] != eid:
-					continue
-				strand_id = D[0]
-				s,e = interval.start, interval.end
+			index = self.gff3_trees[name][chrom].to_index()
+			hits = index.query([start], [end])[1]
+			hits = hits[(None, index.element, index.order, index.sufam)[col][hits] == eid]
+			S = np.maximum(index.starts[hits], start)-start
+			E = np.minimum(index.ends[hits], end)-start
+			for strand_id, s, e in zip(index.strand[hits].tolist(), S.tolist(), E.tolist()):
 				if strand_id == 0 or not strand:
 					p_array[i, s:e] = 1
 				elif strand_id == 1 and strand:
@@ -170,28 +286,72 @@ class gff3_interval:
 			return p_array, n_array
 		else:
 			return p_array, []
+	def elem_intervals(self, chrom, eid, col=1, strand=None):
+		'''
+		Selects the intervals of a specific element id from every annotation
+		without creating base pair arrays
+
+		# Parameters
+		chrom (str): Target chromosome
+		eid (int): Element id
+		col (int): Can target {1:element, 2:te_order, 3:te_sufam}
+		strand (int): Only keep {0:'+', 1:'-'} intervals [both]
+
+		# Returns
+		list: (starts, ends) arrays for each annotation
+		'''
+		ret = []
+		for name in self.gff3_names:
+			index = self.gff3_trees[name][chrom].to_index()
+			values = (None, index.element, index.order, index.sufam)[col]
+			mask = values == eid
+			if strand is not None:
+				mask &= index.strand == strand
+			ret.append((index.starts[mask], index.ends[mask]))
+		return ret
 	def calc_intersect_2(self, chrom, name1, name2, elem, col, p=95, strand=False, ret_set=False):
 		eid = self._get_eid(elem)
 		# (Ab, aB, AB)
 		for n in (name1, name2): assert(chrom in self.gff3_trees[n])
-		n1_tree = self.gff3_trees[name1][chrom]
-		n2_tree = self.gff3_trees[name2][chrom]
+		n1_index = self.gff3_trees[name1][chrom].to_index()
+		n2_index = self.gff3_trees[name2][chrom].to_index()
+		n1_rows = n1_index.select(eid, col, strand)
+		n2_rows = n2_index.select(eid, col, strand)
+		queries, n2_tuples = n1_index.tuples(n1_rows), n2_index.tuples(n2_rows)
 		# Leftover
-		n1_set = n1_tree.to_set(eid, col, strand)	#Ab
-		n2_set = n2_tree.to_set(eid, col, strand)	#aB
+		n1_set = set(queries)	#Ab
+		n2_set = set(n2_tuples)	#aB
 		# Used
 		n1_int_set, n2_int_set = set(), set()	#AB
-		for interval_tup in map(interval2tuple, n1_tree.iifilter(eid, col, strand)):
-			if interval_tup in n1_int_set:
-				continue
-			n1_s, n1_e = interval_tup[0], interval_tup[1]
-			for n2int_tup in map(interval2tuple, n2_tree.searchfilter(n1_s, n1_e, eid, col, strand)):
-				if n2int_tup in n2_set and _overlap_r_tup(interval_tup, n2int_tup, p):
-					n1_int_set.add(interval_tup)
-					n1_set.remove(interval_tup)
-					n2_int_set.add(n2int_tup)
-					n2_set.remove(n2int_tup)
-					break
+		# Candidate pairs come from one batched query and are checked with
+		# a single mask call, in the order of queries and then hits
+		n2_pos = np.full(len(n2_index), -1, dtype=np.int64)
+		n2_pos[n2_rows] = np.arange(len(n2_rows))
+		criterion = as_criterion(p)
+		qstarts, qends = n1_index.starts[n1_rows], n1_index.ends[n1_rows]
+		qidx, hidx = criterion.candidates(qstarts, qends, n2_index)
+		hidx = n2_pos[hidx]
+		keep = hidx >= 0
+		qidx, hidx = qidx[keep], hidx[keep]
+		hstarts, hends = n2_index.starts[n2_rows], n2_index.ends[n2_rows]
+		passed = criterion.mask(qstarts[qidx], qends[qidx], hstarts[hidx], hends[hidx])
+		qidx, hidx = qidx[passed], hidx[passed]
+		if criterion.matching != 'greedy':
+			# Identical tuples are a single feature
+			qidx, hidx = _first_rows(queries)[qidx], _first_rows(n2_tuples)[hidx]
+			edges = np.unique(qidx*len(n2_tuples)+hidx)
+			qidx, hidx = edges//len(n2_tuples), edges%len(n2_tuples)
+			weights = None
+			if criterion.matching == 'optimal-overlap':
+				weights = overlap_bases(qstarts[qidx], qends[qidx], hstarts[hidx], hends[hidx])
+			qidx, hidx = matching.maximum_matching(qidx, hidx, weights)
+		for q, h in zip(qidx.tolist(), hidx.tolist()):
+			interval_tup, n2int_tup = queries[q], n2_tuples[h]
+			if interval_tup not in n1_int_set and n2int_tup in n2_set:
+				n1_int_set.add(interval_tup)
+				n1_set.remove(interval_tup)
+				n2_int_set.add(n2int_tup)
+				n2_set.remove(n2int_tup)
 		assert len(n1_int_set) == len(n2_int_set)
 		if ret_set:
 			return n1_set, n2_set, n1_int_set
@@ -200,7 +360,7 @@ class gff3_interval:
 		# (Abc, aBc, ABc, abC, AbC, aBC, ABC)
 		eid = self._get_eid(elem)
 		for n in (name1, name2, name3): assert(chrom in self.gff3_trees[n])
-		n1_set = self.gff3_trees[name1][chrom].to_set(eid, col, strand)
+		n1_set = self.gff3_trees[name1][chrom].to_index().to_set(eid, col, strand)
 		func = self.calc_intersect_2
 		Ab12, aB12, AB12 = func(chrom, name1, name2, elem, col, p, strand, ret_set=True)
 		#print "Calc3",elem,col,p
@@ -223,20 +383,96 @@ class gff3_interval:
 		return tuple(map(len, ret))
 	def get_length_array(self, chrom, name, elem, col, strand=False):
 		eid = self._get_eid(elem)
-		return map(_tuple_size, self.gff3_trees[name][chrom].to_set(eid, col, strand))
+		return map(_tuple_size, self.gff3_trees[name][chrom].to_index().to_set(eid, col, strand))
+	def get_length_sketch(self, chrom, name, elem, col, strand=False, sketch=None):
+		'''
+		Summarizes feature lengths without creating a list of lengths
+
+		# Parameters
+		sketch (length_sketch): Existing sketch to add lengths to
+
+		# Returns
+		length_sketch
+		'''
+		eid = self._get_eid(elem)
+		sketch = sketch if sketch is not None else length_sketch()
+		sketch.add(t[1]-t[0] for t in self.gff3_trees[name][chrom].to_index().to_set(eid, col, strand))
+		return sketch
 	def region_analysis(self, p=95):
 		pass
 		# TODO
-	def fetch(self, chrom, start, end):
-		outA = np.zeros((end-start, len(gff3_f2i)+2), dtype=np.uint8)
-		for interval in self.interval_tree[chrom].search(start,end):
-			s = max(interval.start, start)-start
-			e = min(interval.end, end)-start
-			element_id, te_order_id, te_sufam_id = interval.data
-			outA[s:e,element_id] = 1
-			outA[s:e,-2] = te_order_id
-			outA[s:e,-1] = te_sufam_id
-		return outA
+	def channel_names(self):
+		'''
+		Names of the feature channels returned by fetch and fetch_batch:
+		one channel per element, followed by TE orders and superfamilies
+
+		# Returns
+		list: ['element:gene', ..., 'order:LTR', ..., 'superfamily:Copia', ...]
+		'''
+		ret = []
+		for prefix, D in (('element', self.element_dict), ('order', self.order_dict), ('superfamily', self.sufam_dict)):
+			ret += ['%s:%s'%(prefix, k) for k, v in sorted(D.items(), key=lambda x: x[1])]
+		return ret
+	def fetch(self, chrom, start, end, name=None):
+		'''
+		Creates a feature-by-base matrix of a single window
+
+		# Parameters
+		chrom (str): Chromosome
+		start (int): 0-based window start
+		end (int): Exclusive window end
+		name (str): Annotation [control]
+
+		# Returns
+		np.ndarray: (end-start, len(channel_names())) uint8
+		'''
+		name = name if name else self.gff3_names[0]
+		return self.fetch_batch([(chrom, start, end)], [name])[name][0]
+	def fetch_batch(self, windows, names=None, sparse=False):
+		'''
+		Creates feature-by-base matrices for many windows at once. Each
+		chromosome is queried with a single batched binary search.
+
+		# Parameters
+		windows (list): [(chrom, start, end), ...] 0-based, end exclusive
+		names (list): Annotations to query [all]
+		sparse (bool): Return runs instead of dense matrices
+
+		# Returns
+		dict: {name: np.ndarray (windows, width, channels)} when all windows
+			have the same width, otherwise {name: [np.ndarray (width, channels), ...]}.
+			With sparse, {name: (window, channel, start, end)} arrays of
+			covered runs relative to the window start.
+		'''
+		names = names if names else self.gff3_names
+		chroms = np.array([w[0] for w in windows])
+		starts = np.array([w[1] for w in windows], dtype=np.int64)
+		ends = np.array([w[2] for w in windows], dtype=np.int64)
+		n_el, n_or = len(self.element_dict), len(self.order_dict)
+		n_ch = n_el+n_or+len(self.sufam_dict)
+		ret = {}
+		for name in names:
+			tree = self.gff3_trees[name]
+			runs = [[], [], [], []]
+			for chrom in np.unique(chroms):
+				if chrom not in tree: continue
+				index = tree[chrom].to_index()
+				wi = np.where(chroms == chrom)[0]
+				qi, hi = index.query(starts[wi], ends[wi])
+				w = wi[qi]
+				s = np.maximum(index.starts[hi], starts[w])-starts[w]
+				e = np.minimum(index.ends[hi], ends[w])-starts[w]
+				for ch, mask in ((index.element[hi], index.element[hi] >= 0), \
+						(n_el+index.order[hi], index.order[hi] >= 0), \
+						(n_el+n_or+index.sufam[hi], index.sufam[hi] >= 0)):
+					for r, v in zip(runs, (w, ch, s, e)):
+						r.append(v[mask])
+			runs = [np.concatenate(r).astype(np.int64) if r else np.zeros(0, dtype=np.int64) for r in runs]
+			if sparse:
+				ret[name] = tuple(runs)
+			else:
+				ret[name] = _runs2dense(runs, ends-starts, n_ch)
+		return ret
 	def _get_eid(self, elem):
 		try:
 			eid = int(elem)
@@ -245,9 +481,14 @@ class gff3_interval:
 		return eid
 	def get_proportion_arrays(self, chrom, name, elem, col, strand=False):
 		eid = self._get_eid(elem)
-		interval_set = self.gff3_trees[name][chrom].to_set(eid, col, strand)
+		interval_set = self.gff3_trees[name][chrom].to_index().to_set(eid, col, strand)
 		if not interval_set: return [[],[],[],[]]
-		if self.pool:
+		if isinstance(self.FA, refstore.packed_reference):
+			interval_list = list(interval_set)
+			starts = [t[0] for t in interval_list]
+			ends = [t[1] for t in interval_list]
+			proportion_arrays = list(self.FA.proportions(chrom, starts, ends))
+		elif self.pool:
 			partial_wtp = partial(worker_tuple_proportion, chrom=chrom)
 			proportion_arrays = zip(*self.pool.imap(partial_wtp, interval_set, chunksize=10))
 		else:
@@ -266,9 +507,205 @@ class gff3_interval:
 	#30	10	11	26		0.38961	0.12987	0.14285	0.33766	1
 	#0.3440	0.17204	0.17204	0.31182	1	0.25730	0.25243	0.22767	0.26258	1 Proportion Calculation
 
+_order_re = re.compile('[Oo]rder=(?P<order>[^;/]+)')
+_sufam_re = re.compile('[Ss]uperfamily=(?P<sufam>[^;]+)')
+# Ranges of huge files that are parsed in parallel
+RANGE_BYTES = 2**28
+COLUMNS = ('chrom', 'starts', 'ends', 'strand', 'element', 'order', 'sufam', 'offsets')
+DTYPES = (np.int32, np.int64, np.int64, np.int8, np.int32, np.int32, np.int32, np.int64)
+
+class gff3_columns(object):
+	'''
+	Compact columnar intervals of a parsed GFF3 in file order. Chromosome,
+	feature, order, and superfamily ids index the names of this file
+	only, and orders and superfamilies of features that are not TEs are -1.
+
+	# Attributes
+	columns (dict): {column: np.ndarray} of COLUMNS
+	chroms (list): Chromosome names of local ids
+	elements (list): Feature names of local ids
+	orders (list): TE order names of local ids
+	sufams (list): TE superfamily names of local ids
+	builder (transcripts.chain_builder): Exon and CDS records or None
+	digests (dict): {chrom: sha1 hex digest} or None
+	'''
+	def __init__(self, columns, chroms, elements, orders, sufams, builder=None, digests=None):
+		self.columns = columns
+		self.chroms = chroms
+		self.elements = elements
+		self.orders = orders
+		self.sufams = sufams
+		self.builder = builder
+		self.digests = digests
+	def __len__(self):
+		return len(self.columns['starts'])
+
+def _extract_order_sufam(attribute_string):
+	order_match = _order_re.search(attribute_string)
+	sufam_match = _sufam_re.search(attribute_string)
+	order_str = order_match.group('order') if order_match else ''
+	sufam_str = sufam_match.group('sufam') if sufam_match else ''
+	return (order_str, sufam_str)
+
+def _local_ids(index):
+	names = [None]*len(index)
+	for name, i in index.items():
+		names[i] = name
+	return names
+
+def byte_ranges(gff3, size=None):
+	'''
+	Splits a file into consecutive byte ranges of about size bytes that
+	start at the beginning of a line. Ranges only depend on the file and
+	the size, so every run splits a file the same way.
+
+	# Parameters
+	gff3 (str): File to split
+	size (int): Approximate range size [RANGE_BYTES]
+
+	# Returns
+	list: (start, end) byte offsets
+	'''
+	size = RANGE_BYTES if size is None else size
+	total = os.path.getsize(gff3)
+	bounds = [0]
+	with open(gff3, 'rb') as IF:
+		while bounds[-1]+size < total:
+			IF.seek(bounds[-1]+size)
+			IF.readline()
+			if IF.tell() >= total:
+				break
+			bounds.append(IF.tell())
+	bounds.append(total)
+	return zip(bounds[:-1], bounds[1:])
+
+def parse_gff3(gff3, settings, range_start=0, range_end=None):
+	'''
+	Parses a GFF3, or the lines of a GFF3 that start within a byte range,
+	into columns with feature ids local to the range
+
+	# Parameters
+	gff3 (str): GFF3 file
+	settings (dict): Filters and collectors from gff3_interval._parse_settings
+	range_start (int): Offset of the first line
+	range_end (int): Offset after the last line [end of file]
+
+	# Returns
+	gff3_columns
+
+	# Raises
+	ValueError: if a line does not have 9 columns and integer coordinates
+	'''
+	#Chr1    TAIR10  transposable_element_gene       433031  433819  .       -       .       ID=AT1G02228;Note=transposable_element_gene;Name=AT1G02228;Derives_from=AT1TE01405
+	exclude, features, chroms = settings['exclude'], settings['features'], settings['chroms']
+	te_names = settings['te_names']
+	builder = transcripts.chain_builder() if settings['chains'] else None
+	hashers = dd(hashlib.sha1) if settings['digests'] else None
+	chrom_dict, element_dict, order_dict, sufam_dict = dict_index(), dict_index(), dict_index(), dict_index()
+	strand_dict = {'+':0, '-':1}
+	C = tuple([[] for c in COLUMNS])
+	with open(gff3,'r') as IF:
+		IF.seek(range_start)
+		offset = range_start
+		for line in IF:
+			if range_end is not None and offset >= range_end:
+				break
+			line_offset, offset = offset, offset+len(line)
+			if line[0] == "#":
+				continue
+			# Only the leading columns are split until a line passes the filters
+			head = line.split('\t', 3)
+			if chroms is not None and head[0] not in chroms:
+				continue
+			element = head[2].lower() if len(head) > 2 else ''
+			index = element not in exclude and (features is None or element in features)
+			if not index and (builder is None or not builder.wants(element)):
+				continue
+			tmp = line.rstrip('\n').split('\t')
+			try:
+				chrom, strand, element, attributes = tmp[0], tmp[6], tmp[2].lower(), tmp[8]
+				start, end = map(int, tmp[3:5])
+			except (IndexError, ValueError):
+				# Raised instead of exiting, so pool workers report it to the parent
+				raise ValueError("Malformed line in %s at byte %i: %r"%(gff3, line_offset, line.rstrip('\n')))
+			if hashers is not None:
+				hashers[chrom].update(line)
+			if index:
+				C[0].append(chrom_dict[chrom])
+				# Interval tree is not inclusive on the upper limit
+				C[1].append(start-1)
+				C[2].append(end)
+				C[3].append(strand_dict[strand])
+				C[4].append(element_dict[element])
+				if element in te_names:
+					te_order, te_sufam = _extract_order_sufam(attributes)
+					C[5].append(order_dict[te_order])
+					C[6].append(sufam_dict[te_sufam])
+				else:
+					C[5].append(-1)
+					C[6].append(-1)
+				C[7].append(line_offset)
+			if builder is not None:
+				builder.add(chrom, element, start-1, end, strand, attributes)
+	keep = [k != 'offsets' or settings['offsets'] for k in COLUMNS]
+	columns = dict([(k, np.array(v, dtype=d)) for k, v, d, use in zip(COLUMNS, C, DTYPES, keep) if use])
+	digests = dict([(c, h.hexdigest()) for c, h in hashers.items()]) if hashers is not None else None
+	return gff3_columns(columns, _local_ids(chrom_dict), _local_ids(element_dict), _local_ids(order_dict), \
+		_local_ids(sufam_dict), builder, digests)
+
+def _remap(values, mapping):
+	ret = values.copy()
+	mask = values >= 0
+	ret[mask] = mapping[values[mask]]
+	return ret
+
+def merge_columns(chunks):
+	'''
+	Concatenates the columns of consecutive byte ranges of a file. Local
+	ids are renumbered in order of first appearance, which matches the
+	ids of a sequential parse, and the digests of chromosomes that span
+	several ranges are chained.
+
+	# Parameters
+	chunks (list): gff3_columns of consecutive ranges
+
+	# Returns
+	gff3_columns
+	'''
+	if len(chunks) == 1:
+		return chunks[0]
+	names = {}
+	mappings = {}
+	for attr, col in (('chroms', 'chrom'), ('elements', 'element'), ('orders', 'order'), ('sufams', 'sufam')):
+		index = dict_index()
+		mappings[col] = [np.array([index[n] for n in getattr(c, attr)], dtype=np.int32) for c in chunks]
+		names[attr] = _local_ids(index)
+	columns = {}
+	for k in chunks[0].columns:
+		if k in mappings:
+			columns[k] = np.concatenate([_remap(c.columns[k], m) for c, m in zip(chunks, mappings[k])])
+		else:
+			columns[k] = np.concatenate([c.columns[k] for c in chunks])
+		columns[k] = columns[k].astype(chunks[0].columns[k].dtype)
+	builder = chunks[0].builder
+	if builder is not None:
+		for c in chunks[1:]:
+			builder.merge(c.builder)
+	digests = None
+	if chunks[0].digests is not None:
+		parts = dd(list)
+		for c in chunks:
+			for chrom in sorted(c.digests):
+				parts[chrom].append(c.digests[chrom])
+		digests = dict([(c, p[0] if len(p) == 1 else hashlib.sha1(''.join(p)).hexdigest()) for c, p in parts.items()])
+	return gff3_columns(columns, names['chroms'], names['elements'], names['orders'], names['sufams'], builder, digests)
+
+def _parse_worker(task):
+	return parse_gff3(*task)
+
 def worker_init(fasta):
 	global FA
-	FA = FastaFile(fasta)
+	FA = pysam.FastaFile(fasta)
 def worker_tuple_proportion(interval_tuple, chrom):
 	start, end = interval_tuple[0], interval_tuple[1]
 	seq = FA.fetch(chrom, start, end).upper()
@@ -277,6 +714,30 @@ def worker_tuple_proportion(interval_tuple, chrom):
 	total = sum(count_dict.values())
 	return tuple((float(count_dict[base])/total for base in ('A','T','G','C')))
 
+def _runs2dense(runs, widths, n_ch):
+	w, ch, s, e = runs
+	if len(widths) and np.all(widths == widths[0]):
+		width = int(widths[0])
+		out = np.zeros((len(widths), width+1, n_ch), dtype=np.int32)
+		np.add.at(out, (w, s, ch), 1)
+		np.add.at(out, (w, e, ch), -1)
+		return (np.cumsum(out, axis=1)[:,:width,:] > 0).astype(np.uint8)
+	ret = []
+	for i, width in enumerate(widths):
+		out = np.zeros((width, n_ch), dtype=np.uint8)
+		for j in np.where(w == i)[0]:
+			out[s[j]:e[j], ch[j]] = 1
+		ret.append(out)
+	return ret
+
+def _first_rows(tuples):
+	'''
+	>>> list(_first_rows([(0, 5), (1, 5), (0, 5)]))
+	[0, 1, 0]
+	'''
+	first = {}
+	return np.array([first.setdefault(t, i) for i, t in enumerate(tuples)], dtype=np.int64)
+
 def _tuple_size(interval_tuple):
         return interval_tuple[1] - interval_tuple[0]
 
@@ -285,24 +746,24 @@ def _map_size(interval_set):
 
 def _set_int(prior, second, p=95):
 	base = prior & second
-	outBase = prior & second
-	for tupP in prior - base:
-		for tupS in second - outBase:
-			if _overlap_r_tup(tupP, tupS, p):
-				outBase.add(tupP)
-				break
-	return outBase
+	rest_p, rest_s = list(prior - base), list(second - base)
+	pi, si = overlap_r_pairs(rest_p, rest_s, p)
+	return base | set([rest_p[i] for i in set(pi.tolist())])
 def _set_mutate(prior, second, p=95):
 	base = prior & second
 	outBase = prior & second
-	for tupS in second - base:
-		added = False
-		for tupP in prior - outBase:
-			if _overlap_r_tup(tupP, tupS, p):
-				outBase.add(tupP)
-				added = True
+	rest_p, rest_s = list(prior - base), list(second - base)
+	matches = dd(list)
+	for i, j in zip(*overlap_r_pairs(rest_p, rest_s, p)):
+		matches[j].append(i)
+	used = set()
+	for j, tupS in enumerate(rest_s):
+		for i in matches[j]:
+			if i not in used:
+				used.add(i)
+				outBase.add(rest_p[i])
 				break
-		if not added:
+		else:
 			outBase.add(tupS)
 	return outBase
 
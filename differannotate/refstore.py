@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+import json, logging, os, struct
+import numpy as np
+from differannotate.constants import FORMAT, BaseIndex
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+MAGIC = b'DA2B'
+VERSION = 1
+EXT = '.2bp'
+N_CODE = 4
+# Byte value -> 2-bit code (A,T,G,C follow BaseIndex), anything else is N
+_ENCODE = np.full(256, N_CODE, dtype=np.uint8)
+for _b in 'ATGC':
+	_ENCODE[ord(_b)] = BaseIndex[_b]
+	_ENCODE[ord(_b.lower())] = BaseIndex[_b]
+# Packed byte -> 4 codes (first base in the high bits)
+_UNPACK = np.array([[(v >> s) & 3 for s in (6, 4, 2, 0)] for v in range(256)], dtype=np.uint8)
+_DECODE = np.array([ord(BaseIndex[i]) for i in range(4)]+[ord('N')], dtype=np.uint8)
+
+def _pack(codes):
+	'''
+	Packs 2-bit codes into bytes. len(codes) must be a multiple of 4.
+	'''
+	c = (codes & 3).reshape(-1, 4)
+	return (c[:,0] << 6) | (c[:,1] << 4) | (c[:,2] << 2) | c[:,3]
+
+def _runs(mask, offset=0):
+	'''
+	Returns (start, end) arrays of True runs in a boolean mask
+
+	>>> s, e = _runs(np.array([0,1,1,0,1], dtype=bool), 10)
+	>>> list(s), list(e)
+	([11, 14], [13, 15])
+	'''
+	if not len(mask):
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+	d = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+	return np.where(d == 1)[0]+offset, np.where(d == -1)[0]+offset
+
+def _source_stamp(fasta):
+	st = os.stat(fasta)
+	return [st.st_size, int(st.st_mtime)]
+
+class _chrom_writer:
+	def __init__(self, OF):
+		self.OF = OF
+		self.carry = np.zeros(0, dtype=np.uint8)
+		self.length = 0
+		self.run_starts, self.run_ends = [], []
+		self.offset = OF.tell()
+	def write(self, seq):
+		codes = _ENCODE[np.frombuffer(seq, dtype=np.uint8)]
+		starts, ends = _runs(codes == N_CODE, self.length)
+		if len(starts):
+			if self.run_ends and self.run_ends[-1][-1] == starts[0]:
+				# Merge with the run that ended at the previous chunk boundary
+				self.run_ends[-1][-1] = ends[0]
+				starts, ends = starts[1:], ends[1:]
+			self.run_starts.append(starts)
+			self.run_ends.append(ends)
+		self.length += len(codes)
+		codes = np.concatenate((self.carry, codes))
+		n = len(codes) - len(codes) % 4
+		self.OF.write(_pack(codes[:n]).tobytes())
+		self.carry = codes[n:]
+	def close(self):
+		if len(self.carry):
+			pad = np.zeros(4-len(self.carry), dtype=np.uint8)
+			self.OF.write(_pack(np.concatenate((self.carry, pad))).tobytes())
+		runs = np.zeros((0,2), dtype=np.int64)
+		if self.run_starts:
+			runs = np.vstack((np.concatenate(self.run_starts), np.concatenate(self.run_ends))).T.astype(np.int64)
+		return self.offset, self.length, runs
+
+def build(fasta, out=None, chunk_size=1 << 22):
+	'''
+	Converts a FASTA file into a 2-bit packed reference with N runs
+
+	# Parameters
+	fasta (str): Input FASTA
+	out (str): Output path [fasta+'.2bp']
+	chunk_size (int): Bases encoded at once
+
+	# Returns
+	str: output path
+	'''
+	out = out if out else fasta+EXT
+	tmp = out+'.tmp%i'%(os.getpid())
+	chroms, runs = [], []
+	try:
+		with open(fasta, 'rb') as IF, open(tmp, 'wb') as OF:
+			writer, buf, buf_len = None, [], 0
+			for line in IF:
+				if line[:1] == b'>':
+					if writer:
+						writer.write(b''.join(buf))
+						chroms.append([name]+list(writer.close()))
+					name = line[1:].split()[0].decode('utf-8')
+					writer, buf, buf_len = _chrom_writer(OF), [], 0
+					continue
+				line = line.rstrip()
+				buf.append(line)
+				buf_len += len(line)
+				if buf_len >= chunk_size:
+					writer.write(b''.join(buf))
+					buf, buf_len = [], 0
+			if writer:
+				writer.write(b''.join(buf))
+				chroms.append([name]+list(writer.close()))
+			# N runs follow the packed sequences
+			index = []
+			for name, offset, length, chrom_runs in chroms:
+				OF.write(b'\0'*(-OF.tell() % 8))
+				index.append([name, length, offset, OF.tell(), len(chrom_runs)])
+				OF.write(chrom_runs.tobytes())
+			header = json.dumps({'version':VERSION, 'source':_source_stamp(fasta), 'chroms':index}).encode('utf-8')
+			OF.write(header)
+			OF.write(struct.pack('<Q', len(header)))
+			OF.write(MAGIC)
+		os.rename(tmp, out)
+	finally:
+		if os.path.exists(tmp):
+			os.remove(tmp)
+	logger.info("Packed %s into %s"%(fasta, out))
+	return out
+
+class packed_reference:
+	'''
+	Memory-mapped 2-bit packed reference. All processes that open the
+	same file share its pages through the page cache.
+
+	# Parameters
+	path (str): Packed reference created by build()
+	'''
+	def __init__(self, path):
+		self.path = path
+		size = os.path.getsize(path)
+		with open(path, 'rb') as IF:
+			IF.seek(size-12)
+			header_len = struct.unpack('<Q', IF.read(8))[0]
+			if IF.read(4) != MAGIC:
+				raise IOError("%s is not a packed reference"%(path))
+			IF.seek(size-12-header_len)
+			self.header = json.loads(IF.read(header_len).decode('utf-8'))
+		if self.header['version'] != VERSION:
+			raise IOError("%s has version %s != %i"%(path, self.header['version'], VERSION))
+		self.data = np.memmap(path, dtype=np.uint8, mode='r')
+		self.chroms = {}
+		self.lengths = {}
+		for name, length, offset, run_offset, n_runs in self.header['chroms']:
+			runs = np.ndarray((n_runs, 2), dtype=np.int64, buffer=self.data, offset=run_offset) \
+				if n_runs else np.zeros((0,2), dtype=np.int64)
+			self.chroms[name] = (offset, runs[:,0], runs[:,1])
+			self.lengths[name] = length
+	def references(self):
+		return [c[0] for c in self.header['chroms']]
+	def codes(self, chrom, start, end):
+		'''
+		Returns base codes (A,T,G,C,N = 0,1,2,3,4) for [start, end)
+		'''
+		offset, run_starts, run_ends = self.chroms[chrom]
+		start, end = max(0, start), min(end, self.lengths[chrom])
+		if end <= start:
+			return np.zeros(0, dtype=np.uint8)
+		packed = self.data[offset+start//4:offset+(end+3)//4]
+		ret = _UNPACK[packed].ravel()[start%4:start%4+end-start]
+		lo = np.searchsorted(run_ends, start, 'right')
+		hi = np.searchsorted(run_starts, end, 'left')
+		for rs, re in zip(run_starts[lo:hi], run_ends[lo:hi]):
+			ret[max(rs,start)-start:min(re,end)-start] = N_CODE
+		return ret
+	def fetch(self, chrom, start, end):
+		'''
+		Returns the upper-case sequence of [start, end) like pysam.FastaFile.fetch
+		'''
+		return _DECODE[self.codes(chrom, start, end)].tobytes().decode('ascii')
+	def base_counts(self, chrom, starts, ends):
+		'''
+		Counts A,T,G,C,N in a batch of intervals
+
+		# Parameters
+		chrom (str): Chromosome
+		starts (array): 0-based interval starts
+		ends (array): Exclusive interval ends
+
+		# Returns
+		np.ndarray: (len(starts), 5) counts
+		'''
+		ret = np.zeros((len(starts), 5), dtype=np.int64)
+		for i, (s, e) in enumerate(zip(starts, ends)):
+			ret[i] = np.bincount(self.codes(chrom, int(s), int(e)), minlength=5)
+		return ret
+	def proportions(self, chrom, starts, ends):
+		'''
+		Proportions of A,T,G,C in a batch of intervals
+
+		# Returns
+		np.ndarray: (4, len(starts)) proportions
+		'''
+		starts, ends = np.asarray(starts), np.asarray(ends)
+		counts = self.base_counts(chrom, starts, ends)
+		return (counts[:,:4].astype(np.float64)/(ends-starts)[:,None]).T
+
+def open_reference(fasta, build_missing=True):
+	'''
+	Opens the packed reference next to a FASTA, building it when it is
+	missing or older than the FASTA
+
+	# Returns
+	packed_reference
+	'''
+	path = fasta+EXT
+	if os.path.exists(path):
+		try:
+			ref = packed_reference(path)
+			if ref.header['source'] == _source_stamp(fasta):
+				return ref
+			logger.info("%s is out of date"%(path))
+		except (IOError, ValueError) as e:
+			logger.warn("Ignoring %s: %s"%(path, e))
+	if not build_missing:
+		raise IOError("%s does not exist"%(path))
+	return packed_reference(build(fasta, path))
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
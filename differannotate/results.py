@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+import logging, warnings
+import numpy as np
+from differannotate.constants import FORMAT
+from differannotate.datastructures import length_sketch
+from differannotate import comparisons
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+CATEGORIES = ("", "Element", "TE_Order", "TE_Superfamily")
+
+class metric_table(object):
+	'''
+	Per-sample counts for (chrom, strand, category, feature) rows. Counts
+	are exposed as numpy arrays of shape (rows, samples).
+
+	# Usage
+	>>> MT = metric_table(['control','treat'], ('tp','fp'))
+	>>> MT.add(('Chr1','+/-','Element','gene'), tp=[2,1], fp=[0,1])
+	>>> MT['tp']
+	array([[2, 1]])
+	>>> MT.get(('Chr1','+/-','Element','gene'), 'treat', 'fp')
+	1
+	'''
+	count_names = ()
+	stat_names = ()
+	def __init__(self, samples, count_names=None):
+		self.samples = list(samples)
+		if count_names is not None:
+			self.count_names = tuple(count_names)
+		self.rows = []
+		self._index = {}
+		self._counts = dict([(n, []) for n in self.count_names])
+		self._arrays = {}
+	def __len__(self):
+		return len(self.rows)
+	def __contains__(self, key):
+		return tuple(key) in self._index
+	def __getitem__(self, name):
+		if name not in self._counts:
+			raise KeyError(name)
+		if name not in self._arrays:
+			if self._counts[name]:
+				self._arrays[name] = np.array(self._counts[name], dtype=np.int64)
+			else:
+				self._arrays[name] = np.zeros((0, len(self.samples)), dtype=np.int64)
+		return self._arrays[name]
+	def add(self, key, **counts):
+		'''
+		Appends a row of per-sample counts
+
+		# Parameters
+		key (tuple): (chrom, strand, category, feature)
+		counts (list): One value per sample for every name in count_names
+		'''
+		key = tuple(key)
+		if key in self._index:
+			raise KeyError("%s already exists"%(str(key)))
+		for n in self.count_names:
+			assert(len(counts[n]) == len(self.samples))
+			self._counts[n].append(list(map(int, counts[n])))
+		self._index[key] = len(self.rows)
+		self.rows.append(key)
+		self._arrays = {}
+	def extend(self, other, keys=None):
+		'''
+		Appends rows from another table with the same samples
+
+		# Parameters
+		other (metric_table): Table to copy from
+		keys (list): Rows to copy, in order [all]
+		'''
+		assert(self.samples == other.samples and self.count_names == other.count_names)
+		keys = other.rows if keys is None else keys
+		for key in keys:
+			i = other.row(key)
+			self.add(key, **dict([(n, other._counts[n][i]) for n in self.count_names]))
+	def row(self, key):
+		return self._index[tuple(key)]
+	def get(self, key, sample, name):
+		return self[name][self.row(key), self.samples.index(sample)]
+	def _ratio(self, num, other):
+		num = self[num].astype(np.float64)
+		den = num + self[other]
+		with np.errstate(divide='ignore', invalid='ignore'):
+			return num/den
+	def to_records(self):
+		'''
+		# Returns
+		list: [{'chrom', 'strand', 'category', 'feature', 'sample', counts..., stats...}, ...]
+		'''
+		stats = [(n, getattr(self, n)) for n in self.stat_names]
+		records = []
+		for i, (chrom, strand, category, feature) in enumerate(self.rows):
+			for j, sample in enumerate(self.samples):
+				rec = {'chrom':chrom, 'strand':strand, 'category':category, \
+					'feature':feature, 'sample':sample}
+				for n in self.count_names:
+					rec[n] = int(self[n][i,j])
+				for n, A in stats:
+					rec[n] = None if np.isnan(A[i,j]) else float(A[i,j])
+				records.append(rec)
+		return records
+
+class region_result(metric_table):
+	'''
+	Region metrics relative to the first sample
+
+	# Attributes
+	lengths (dict): {(row_key, sample): length_sketch of feature lengths}
+	proportions (dict): {(row_key, sample): np.ndarray (4, features) of A,T,G,C proportions}
+	matches (dict): {(row_key, sample): (Ab, aB, AB) sets of interval tuples}
+	'''
+	count_names = ('tp', 'fp', 'fn')
+	stat_names = ('sensitivity', 'precision')
+	def __init__(self, samples):
+		super(region_result, self).__init__(samples)
+		self.lengths = {}
+		self.proportions = {}
+		self.matches = {}
+	def extend(self, other, keys=None):
+		super(region_result, self).extend(other, keys)
+		for attr in ('lengths', 'proportions', 'matches'):
+			getattr(self, attr).update(getattr(other, attr))
+	@property
+	def sensitivity(self):
+		return self._ratio('tp', 'fn')
+	@property
+	def precision(self):
+		return self._ratio('tp', 'fp')
+	def merged_lengths(self, strand, category, feature, sample):
+		'''
+		Merges the length sketches of a feature across all chromosomes
+
+		# Returns
+		length_sketch
+		'''
+		ret = length_sketch()
+		for chrom, s, c, f in self.rows:
+			if (s, c, f) == (strand, category, feature) and ((chrom, s, c, f), sample) in self.lengths:
+				ret.merge(self.lengths[((chrom, s, c, f), sample)])
+		return ret
+	def to_records(self):
+		records = super(region_result, self).to_records()
+		for rec in records:
+			key = (rec['chrom'], rec['strand'], rec['category'], rec['feature'])
+			if (key, rec['sample']) in self.lengths:
+				summary = self.lengths[(key, rec['sample'])].summary()
+				rec['length'] = dict(zip(('count','min','q1','median','q3','max'), \
+					[None if np.isnan(v) else v for v in summary]))
+		return records
+
+class base_result(metric_table):
+	'''
+	Base pair metrics relative to the first sample
+
+	# Attributes
+	membership (dict): {row_key: (codes, counts)} joint membership histogram,
+		where bit i of a code is set when sample i covers the base
+	'''
+	count_names = ('tp', 'fp', 'tn', 'fn')
+	stat_names = ('sensitivity', 'specificity', 'precision')
+	def __init__(self, samples):
+		super(base_result, self).__init__(samples)
+		self.membership = {}
+	def extend(self, other, keys=None):
+		super(base_result, self).extend(other, keys)
+		self.membership.update(other.membership)
+	def venn_subsets(self, key):
+		'''
+		# Returns
+		tuple: (Ab, aB, AB) for 2 samples or (Abc, aBc, ABc, abC, AbC, aBC, ABC) for 3
+		'''
+		codes, counts = self.membership[tuple(key)]
+		return comparisons.venn_subsets(codes, counts, len(self.samples))
+	@property
+	def sensitivity(self):
+		return self._ratio('tp', 'fn')
+	@property
+	def specificity(self):
+		return self._ratio('tn', 'fp')
+	@property
+	def precision(self):
+		return self._ratio('tp', 'fp')
+
+def wilson_interval(successes, trials, z=1.96):
+	'''
+	Wilson score interval of binomial proportions, which stays inside
+	[0, 1] for small or extreme samples
+
+	>>> lo, hi = wilson_interval(np.array([5]), np.array([10]))
+	>>> round(lo[0], 3), round(hi[0], 3)
+	(0.237, 0.763)
+	'''
+	k = np.asarray(successes, dtype=np.float64)
+	n = np.asarray(trials, dtype=np.float64)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		p = k/n
+		center = (p + z*z/(2*n))/(1 + z*z/n)
+		half = z*np.sqrt(p*(1-p)/n + z*z/(4*n*n))/(1 + z*z/n)
+	return center-half, center+half
+
+class base_estimate(base_result):
+	'''
+	Base pair metrics estimated from a sample of positions. Counts are the
+	sampled positions scaled by the number of bases each one represents,
+	and confidence intervals of the stats come from the sampled counts.
+
+	# Attributes
+	sampled (base_result): Unscaled counts of sampled positions
+	z (float): Normal quantile of the confidence level
+	'''
+	_stat_counts = {'sensitivity':('tp', 'fn'), 'specificity':('tn', 'fp'), 'precision':('tp', 'fp')}
+	def __init__(self, samples, z=1.96):
+		super(base_estimate, self).__init__(samples)
+		self.sampled = base_result(samples)
+		self.z = z
+	def interval(self, stat):
+		'''
+		# Returns
+		np.ndarray: Lower bounds (rows, samples)
+		np.ndarray: Upper bounds (rows, samples)
+		'''
+		num, other = self._stat_counts[stat]
+		k = self.sampled[num]
+		return wilson_interval(k, k+self.sampled[other], self.z)
+
+class region_bootstrap(region_result):
+	'''
+	Region metrics with bootstrap confidence intervals. Replicates of the
+	stats are stored as float32 arrays, and intervals are their percentiles.
+
+	# Attributes
+	replicates (dict): {stat: np.ndarray (rows, samples, replicates)}
+	level (float): Confidence level
+	'''
+	def __init__(self, samples, level=0.95):
+		super(region_bootstrap, self).__init__(samples)
+		self.replicates = {}
+		self.level = level
+	def interval(self, stat):
+		'''
+		# Returns
+		np.ndarray: Lower bounds (rows, samples)
+		np.ndarray: Upper bounds (rows, samples)
+		'''
+		A = self.replicates[stat]
+		tail = (1.0-self.level)*50
+		with warnings.catch_warnings():
+			# Rows without features only have nan replicates
+			warnings.simplefilter('ignore', RuntimeWarning)
+			lo, hi = np.nanpercentile(A, [tail, 100-tail], axis=2)
+		return lo, hi
+
+class comparison(object):
+	'''
+	Results of comparing treatment annotations against a control
+
+	# Attributes
+	samples (list): Control name followed by treatment names
+	region (region_result): Region metrics
+	base (base_result): Base pair metrics (None without a reference)
+	figures (list): Figures generated when plotting was requested
+	'''
+	def __init__(self, samples, region=None, base=None):
+		self.samples = list(samples)
+		self.region = region
+		self.base = base
+		self.figures = []
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+
+import logging
+import numpy as np
+from time import time
+from differannotate.constants import FORMAT
+from differannotate import comparisons, results, summaries
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+def allocate(lengths, n):
+	'''
+	Splits n samples across chromosomes in proportion to their lengths
+	with the largest remainder method, without exceeding any length
+
+	>>> allocate([100, 50, 50], 5)
+	[3, 1, 1]
+	'''
+	lengths = np.asarray(lengths, dtype=np.int64)
+	n = min(int(n), int(lengths.sum()))
+	share = lengths*float(n)/max(lengths.sum(), 1)
+	ret = np.minimum(np.floor(share).astype(np.int64), lengths)
+	for i in np.argsort(-(share-np.floor(share)), kind='mergesort'):
+		if ret.sum() >= n: break
+		if ret[i] < lengths[i]: ret[i] += 1
+	return ret.tolist()
+
+def stratified_positions(length, k, rng):
+	'''
+	Draws one uniform position from each of k equal-width strata
+
+	>>> list(stratified_positions(4, 4, np.random.RandomState(0)))
+	[0, 1, 2, 3]
+	'''
+	if k >= length:
+		return np.arange(length, dtype=np.int64)
+	edges = np.linspace(0, length, k+1).astype(np.int64)
+	widths = edges[1:]-edges[:-1]
+	return edges[:-1]+(rng.random_sample(k)*widths).astype(np.int64)
+
+def covered(starts, ends, positions):
+	'''
+	Looks up which sorted positions fall inside any interval with binary
+	searches over the sorted union of the intervals
+
+	>>> covered(np.array([5, 0]), np.array([8, 3]), np.array([0, 3, 5, 9]))
+	array([ True, False,  True, False])
+	'''
+	starts, ends = comparisons._union(np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64))
+	if not len(starts):
+		return np.zeros(len(positions), dtype=bool)
+	idx = np.searchsorted(starts, positions, 'right')-1
+	return (idx >= 0) & (positions < ends[np.maximum(idx, 0)])
+
+def estimate_base(GI, n, seed=None, temd=False, z=1.96, chroms=None):
+	'''
+	Estimates genome-wide base pair metrics from a stratified random sample
+	of positions. Positions are allocated to chromosomes by length and
+	spread over equal-width strata, and the membership of every annotation
+	is looked up without creating base pair arrays.
+
+	# Parameters
+	GI (gff3_interval): Control and treatment annotations
+	n (int): Number of positions to sample
+	seed (int): Random seed for reproducible samples
+	temd (bool): Include TE order and superfamily categories
+	z (float): Normal quantile of the confidence level
+	chroms (list): Chromosomes to sample [all shared]
+
+	# Returns
+	results.base_estimate: Rows use 'All' as the chromosome
+	'''
+	start = time()
+	rng = np.random.RandomState(seed)
+	chroms = chroms if chroms else sorted(GI.get_chrom_set())
+	lengths = [GI._get_max(c) for c in chroms]
+	positions = {}
+	for chrom, length, k in zip(chroms, lengths, allocate(lengths, n)):
+		positions[chrom] = (stratified_positions(length, k, rng), float(length)/k if k else 0.0)
+	ret = results.base_estimate(GI.gff3_names, z)
+	n_rows = len(GI.gff3_names)
+	for col, elem_list in summaries._category_list(GI, temd):
+		category = results.CATEGORIES[col]
+		for elem in elem_list:
+			eid = elem_list[elem]
+			for (sstr, sval), strand in zip(summaries.STRANDS, (None, 0, 1)):
+				sampled = np.zeros((4, n_rows), dtype=np.int64)
+				scaled = np.zeros((4, n_rows), dtype=np.float64)
+				for chrom in chroms:
+					pos, weight = positions[chrom]
+					if not len(pos): continue
+					A = np.array([covered(s, e, pos) for s, e in GI.elem_intervals(chrom, eid, col, strand)])
+					counts = np.array(comparisons.histogram_stats(*comparisons.membership_histogram(A), n=n_rows))
+					sampled += counts
+					scaled += counts*weight
+				key = ('All', sstr, category, elem)
+				ret.sampled.add(key, **dict(zip(('tp', 'fp', 'tn', 'fn'), sampled)))
+				ret.add(key, **dict(zip(('tp', 'fp', 'tn', 'fn'), np.round(scaled))))
+	logger.debug("Sampled %i positions in %.3f seconds"%(sum([len(p[0]) for p in positions.values()]), time()-start))
+	return ret
+
+def tabular(GI, n, seed=None, temd=False, z=1.96):
+	'''
+	Prints estimated base pair metrics with confidence intervals
+	'''
+	ret = estimate_base(GI, n, seed, temd, z)
+	mel = max(map(len, list(GI.element_dict)+list(GI.order_dict)+list(GI.sufam_dict)+list(results.CATEGORIES)))
+	mnl = max(map(len, list(GI.gff3_names)+["Sample"]))
+	header = ("S", "Feature", "Sample", "TP", "FP", "TN", "FN", "SENS", "SENS_CI", "SPEC", "SPEC_CI", "PREC", "PREC_CI")
+	template = "{:^3} {:<{mel}} {:<{mn}} "+' '.join(["{:>10}"]*4+["{:>6} {:>13}"]*3)
+	print(template.format(*header, mel=mel, mn=mnl))
+	stats = []
+	for stat in ('sensitivity', 'specificity', 'precision'):
+		lo, hi = ret.interval(stat)
+		stats.append((np.round(getattr(ret, stat), summaries.sd), np.round(lo, summaries.sd), np.round(hi, summaries.sd)))
+	for r, (chrom, sstr, category, elem) in enumerate(ret.rows):
+		for i, name in enumerate(ret.samples):
+			vals = [ret[c][r,i] for c in ('tp', 'fp', 'tn', 'fn')]
+			for est, lo, hi in stats:
+				vals += [est[r,i], "%s-%s"%(lo[r,i], hi[r,i])]
+			print(template.format(sstr if not i else '', elem if not i else '', name, *vals, mel=mel, mn=mnl))
+	print("")
+	return ret
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+import argparse, json, logging, os, sys, threading
+from collections import OrderedDict
+from time import time
+try:
+	import SocketServer as socketserver
+	from BaseHTTPServer import BaseHTTPRequestHandler
+except ImportError:
+	import socketserver
+	from http.server import BaseHTTPRequestHandler
+from differannotate.constants import FORMAT
+from differannotate import reader, comparisons, summaries
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+class resident_control:
+	'''
+	A parsed control annotation that stays in memory between requests
+
+	# Parameters
+	gff3 (str): Path to control GFF3
+	name (str): Name of the control
+	fasta (str): Control reference (enables base metrics)
+	'''
+	def __init__(self, gff3, name='control', fasta=None):
+		self.gff3 = gff3
+		self.name = name
+		self.fasta = fasta
+		self.GI = False
+		self.loaded = threading.Event()
+	def load(self):
+		start = time()
+		self.GI = reader.gff3_interval(self.gff3, name=self.name, fasta=self.fasta)
+		logger.info("Indexed %s in %.3f seconds"%(self.gff3, time()-start))
+		self.loaded.set()
+	def compare(self, treatments, names, p=90, temd=False, base=False):
+		'''
+		Compares treatment GFF3 files against the resident control
+
+		# Returns
+		dict: {'region':[records], 'base':[records]}
+		'''
+		self.loaded.wait()
+		# Treatment features only get ids in the dictionaries of the view
+		GI = self.GI.view()
+		for f, n in zip(treatments, names):
+			GI.gff3_trees[n] = GI._2tree(f)
+			GI.gff3_names.append(n)
+		ret = {'region':summaries.region_metrics(GI, p, temd).to_records()}
+		if base and GI.chrom_lens:
+			ret['base'] = summaries.base_metrics(GI, temd).to_records()
+		return ret
+
+class annotation_cache:
+	'''
+	Thread-safe cache of resident control annotations. When more than
+	max_resident controls are loaded, the least recently used is evicted.
+
+	# Parameters
+	max_resident (int): Maximum number of resident controls
+	fasta (str): Reference used for every control
+	'''
+	def __init__(self, max_resident=4, fasta=None):
+		if max_resident < 1:
+			raise ValueError(max_resident)
+		self.max_resident = max_resident
+		self.fasta = fasta
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+	def get(self, gff3, name='control'):
+		key = (os.path.abspath(gff3), name)
+		with self._lock:
+			if key in self._entries:
+				entry = self._entries.pop(key)
+				self._entries[key] = entry
+				new_entry = False
+			else:
+				entry = resident_control(gff3, name, self.fasta)
+				self._entries[key] = entry
+				new_entry = True
+				while len(self._entries) > self.max_resident:
+					old_key, old_entry = self._entries.popitem(last=False)
+					logger.info("Evicted %s"%(old_key[0]))
+		# Load outside of the cache lock so other controls stay available
+		if new_entry:
+			try:
+				entry.load()
+			except:
+				with self._lock:
+					if self._entries.get(key) is entry:
+						del self._entries[key]
+				entry.loaded.set()
+				raise
+		entry.loaded.wait()
+		if not entry.GI:
+			raise IOError("Failed to load %s"%(gff3))
+		return entry
+	def resident(self):
+		with self._lock:
+			return [k[0] for k in self._entries]
+
+class comparison_service:
+	'''
+	Handles decoded comparison requests
+
+	Request
+	-----------
+	{"control": "control.gff3", "treat": ["a.gff3", ...], "names": ["a", ...],
+	 "percent": 90, "tolerance": null, "criterion": null, "matching": "greedy",
+	 "temd": false, "base": false}
+
+	Response
+	-----------
+	{"status": "ok", "seconds": float, "region": [...], "base": [...]}
+	'''
+	def __init__(self, cache):
+		self.cache = cache
+	def handle(self, request):
+		start = time()
+		try:
+			control = request['control']
+			treat = list(request['treat'])
+			names = list(request.get('names', [os.path.basename(f) for f in treat]))
+			if len(names) != len(treat):
+				raise ValueError("treat(%i) != names(%i)"%(len(treat), len(names)))
+			cname = request.get('cname', 'control')
+			if cname in names or len(set(names)) != len(names):
+				raise ValueError("sample names must be unique")
+			for f in treat:
+				if not os.path.exists(f):
+					raise IOError("%s does not exist"%(f))
+			entry = self.cache.get(control, cname)
+			tolerance = request.get('tolerance', None)
+			match = comparisons.match_criterion(int(request.get('percent', 90)), \
+				None if tolerance is None else int(tolerance), request.get('criterion', None), \
+				request.get('matching', 'greedy'))
+			ret = entry.compare(treat, names, p=match, \
+				temd=bool(request.get('temd', False)), base=bool(request.get('base', False)))
+		except Exception as e:
+			logger.error("%s: %s"%(type(e).__name__, e))
+			return {'status':'error', 'error':"%s: %s"%(type(e).__name__, e)}
+		ret['status'] = 'ok'
+		ret['seconds'] = time()-start
+		return ret
+	def status(self):
+		return {'status':'ok', 'resident':self.cache.resident()}
+
+class unix_handler(socketserver.StreamRequestHandler):
+	'''
+	Reads one JSON request per line and writes one JSON response per line
+	'''
+	def handle(self):
+		for line in iter(self.rfile.readline, b''):
+			line = line.strip()
+			if not line: continue
+			try:
+				request = json.loads(line.decode('utf-8'))
+			except ValueError as e:
+				response = {'status':'error', 'error':'Invalid JSON: %s'%(e)}
+			else:
+				if request.get('status'):
+					response = self.server.service.status()
+				else:
+					response = self.server.service.handle(request)
+			self.wfile.write((json.dumps(response)+'\n').encode('utf-8'))
+			self.wfile.flush()
+
+class http_handler(BaseHTTPRequestHandler):
+	'''
+	POST /compare with a JSON request body, or GET /status
+	'''
+	def _respond(self, code, response):
+		body = json.dumps(response).encode('utf-8')
+		self.send_response(code)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+	def do_GET(self):
+		if self.path.rstrip('/') == '/status':
+			self._respond(200, self.server.service.status())
+		else:
+			self._respond(404, {'status':'error', 'error':'Unknown path %s'%(self.path)})
+	def do_POST(self):
+		if self.path.rstrip('/') != '/compare':
+			return self._respond(404, {'status':'error', 'error':'Unknown path %s'%(self.path)})
+		length = int(self.headers.get('Content-Length', 0))
+		try:
+			request = json.loads(self.rfile.read(length).decode('utf-8'))
+		except ValueError as e:
+			return self._respond(400, {'status':'error', 'error':'Invalid JSON: %s'%(e)})
+		response = self.server.service.handle(request)
+		self._respond(200 if response['status'] == 'ok' else 400, response)
+	def log_message(self, fmt, *args):
+		logger.debug(fmt%args)
+
+class threaded_unix_server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+class threaded_http_server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+def make_server(service, socket_path=None, host='127.0.0.1', port=None):
+	'''
+	Creates a threaded server on a UNIX socket or an HTTP port
+
+	# Returns
+	socketserver.BaseServer: call serve_forever() to start
+	'''
+	if socket_path:
+		if os.path.exists(socket_path):
+			os.remove(socket_path)
+		server = threaded_unix_server(socket_path, unix_handler)
+	elif port is not None:
+		server = threaded_http_server((host, port), http_handler)
+	else:
+		raise ValueError("Either a socket path or a port is required")
+	server.service = service
+	return server
+
+def main(argv=None):
+	from differannotate.argValidators import fileCheck
+	fCheck = fileCheck()
+	parser = argparse.ArgumentParser(prog="differannotate serve", \
+		description="Keeps control annotations indexed in memory and serves comparison requests")
+	parser.add_argument('-C', '--control', metavar='GFF3', help='Control GFF3 files to index at start-up', \
+		type=fCheck.gff3, nargs='*', default=[])
+	parser.add_argument('-R', '--reference', metavar='FASTA', \
+		help='Control reference (required for base pair metrics)', type=fCheck.fasta)
+	group = parser.add_mutually_exclusive_group(required=True)
+	group.add_argument('--socket', metavar='PATH', help='UNIX socket to listen on')
+	group.add_argument('--port', metavar='INT', help='HTTP port to listen on', type=int)
+	parser.add_argument('--host', metavar='STR', help='HTTP host to bind [%(default)s]', default='127.0.0.1')
+	parser.add_argument('--max-resident', metavar='INT', \
+		help='Maximum number of control annotations kept in memory [%(default)s]', type=int, default=4)
+	parser.add_argument('-v', '--verbose', action="store_true", help='Enable verbose logging')
+	args = parser.parse_args(argv)
+	logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+	cache = annotation_cache(args.max_resident, args.reference)
+	for gff3 in args.control:
+		cache.get(gff3)
+	server = make_server(comparison_service(cache), args.socket, args.host, args.port)
+	logger.info("Listening on %s"%(args.socket if args.socket else "%s:%i"%(args.host, args.port)))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		if args.socket and os.path.exists(args.socket):
+			os.remove(args.socket)
+
+if __name__ == "__main__":
+	main()
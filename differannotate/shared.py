@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+
+import atexit, logging, os, tempfile, weakref
+import numpy as np
+from differannotate.constants import FORMAT
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+# Memory backed on Linux, with a fallback to the temporary directory
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# Open segment owners, closed together at exit without keeping them alive
+_LIVE = weakref.WeakSet()
+
+@atexit.register
+def _close_all():
+	for SA in list(_LIVE):
+		SA.close()
+
+class shared_arrays(object):
+	'''
+	Named segments of shared memory that hold numpy arrays. The segments
+	are owned by the process that created them and are unlinked when the
+	object is closed, when its context exits (even if a worker raised),
+	when it is garbage collected, or when the interpreter exits. Workers only attach to them by descriptor,
+	so a crashed worker never leaks a segment.
+
+	# Parameters
+	directory (str): Memory backed directory [SHM_DIR]
+
+	# Usage
+	>>> with shared_arrays() as SA:
+	...     desc = SA.put(np.arange(4))
+	...     list(attach(desc))
+	[0, 1, 2, 3]
+	>>> os.path.exists(segment_path(desc))
+	False
+	'''
+	def __init__(self, directory=None):
+		self.directory = directory if directory else SHM_DIR
+		self.prefix = 'differannotate_%i_%s_'%(os.getpid(), os.urandom(4).encode('hex'))
+		self.paths = []
+		_LIVE.add(self)
+	def empty(self, shape, dtype=np.bool):
+		'''
+		Creates a zeroed segment
+
+		# Returns
+		tuple: Descriptor that workers attach to
+		np.memmap: Writable view of the segment
+		'''
+		path = os.path.join(self.directory, self.prefix+str(len(self.paths)))
+		self.paths.append(path)
+		shape = tuple(shape)
+		dtype = np.dtype(dtype)
+		if not np.prod(shape):
+			# Empty maps are not allowed, so only the descriptor is kept
+			open(path, 'wb').close()
+			return (path, dtype.str, shape), np.zeros(shape, dtype=dtype)
+		return (path, dtype.str, shape), np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+	def put(self, array):
+		'''
+		Copies an array into a new segment
+
+		# Returns
+		tuple: Descriptor that workers attach to
+		'''
+		desc, view = self.empty(array.shape, array.dtype)
+		view[:] = array
+		return desc
+	def close(self):
+		'''
+		Unlinks every segment
+		'''
+		for path in self.paths:
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+		self.paths = []
+		_LIVE.discard(self)
+	def __del__(self):
+		self.close()
+	def __enter__(self):
+		return self
+	def __exit__(self, *args):
+		self.close()
+
+def segment_path(desc):
+	return desc[0]
+
+def attach(desc):
+	'''
+	Attaches to a segment without copying it
+
+	# Parameters
+	desc (tuple): Descriptor from shared_arrays
+
+	# Returns
+	np.ndarray: Read-only view of the segment
+	'''
+	path, dtype, shape = desc
+	if not np.prod(shape):
+		return np.zeros(shape, dtype=np.dtype(dtype))
+	return np.memmap(path, dtype=np.dtype(dtype), mode='r', shape=shape)
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
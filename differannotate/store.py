@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+
+import hashlib, json, logging, os
+import numpy as np
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+from differannotate.constants import FORMAT
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+VERSION = 1
+EMPTY_DIGEST = hashlib.sha1(b'').hexdigest()
+
+class result_store(object):
+	'''
+	Directory of per-chromosome result units keyed by the content digests
+	of every input. A unit is only recomputed when a chromosome of the
+	control or of any treatment changed, or when the options, samples, or
+	features of that chromosome differ from the stored run. Rows of
+	features that only exist on other chromosomes are computed fresh, so
+	a new feature type on one chromosome does not invalidate the others.
+
+	# Parameters
+	path (str): Store directory
+	GI (gff3_interval): Annotations parsed with digests=True
+	'''
+	def __init__(self, path, GI):
+		if not GI.gff3_digests:
+			raise ValueError("Annotations need to be parsed with digests=True")
+		self.path = path
+		self.GI = GI
+		if not os.path.exists(path):
+			os.makedirs(path)
+		FA = GI.FA
+		self.reference = getattr(FA, 'header', {}).get('source', None) if FA else None
+		self.hits, self.misses = 0, 0
+		self.changed = set()
+	def unit_key(self, kind, chrom, col, elem_list, **options):
+		'''
+		# Returns
+		str: Digest of everything a unit depends on
+		'''
+		GI = self.GI
+		names = list(GI.gff3_names)
+		state = [VERSION, kind, chrom, col, names, \
+			[GI.gff3_digests[n].get(chrom, EMPTY_DIGEST) for n in names], \
+			sorted(elem_list), GI.chrom_lens.get(chrom, None) if GI.chrom_lens else None, \
+			self.reference, sorted(options.items())]
+		return hashlib.sha1(json.dumps(state).encode('utf-8')).hexdigest()
+	def _unit_path(self, key):
+		return os.path.join(self.path, key[:2], key+'.pkl')
+	def present(self, chrom, col, elem_list):
+		'''
+		# Returns
+		dict: Features of elem_list with intervals on the chromosome in any input
+		'''
+		ids = set()
+		for name in self.GI.gff3_names:
+			if chrom in self.GI.gff3_trees[name]:
+				index = self.GI.gff3_trees[name][chrom].to_index()
+				ids.update(np.unique((None, index.element, index.order, index.sufam)[col]).tolist())
+		return dict([(elem, eid) for elem, eid in elem_list.items() if eid in ids])
+	def fetch(self, kind, chrom, col, elem_list, compute, **options):
+		'''
+		Loads a stored unit or computes and stores it. Only the features
+		present on the chromosome are stored, and the rows of the others
+		are computed and merged in the order of elem_list.
+
+		# Parameters
+		kind (str): Stage name, like 'region' or 'base'
+		chrom (str): Chromosome
+		col (int): Feature category
+		elem_list (dict): Features of the category
+		compute (function): Creates the unit of a dict of features
+		options (dict): JSON serializable options the unit depends on
+
+		# Returns
+		unit created by compute
+		'''
+		present = self.present(chrom, col, elem_list)
+		path = self._unit_path(self.unit_key(kind, chrom, col, present, **options))
+		unit = _load(path)
+		if unit is not None:
+			self.hits += 1
+		else:
+			unit = compute(present)
+			self.misses += 1
+			self.changed.add(chrom)
+			_dump(path, unit)
+		if len(present) == len(elem_list):
+			return _ordered([unit], elem_list)
+		absent = dict([(elem, eid) for elem, eid in elem_list.items() if elem not in present])
+		return _ordered([unit, compute(absent)], elem_list)
+	def summary(self):
+		'''
+		Logs the number of reused units and the recomputed chromosomes
+		'''
+		changed = ', '.join(sorted(self.changed)) if self.changed else 'none'
+		logger.info("Reused %i of %i stored units. Recomputed chromosomes: %s"%(self.hits, self.hits+self.misses, changed))
+
+class checkpoint(result_store):
+	'''
+	Durable record of every finished (chromosome, category) unit of a run,
+	along with the names of the figures it generated. Records are keyed
+	like result_store units, so they also cover every run-wide option, and
+	only a resumed run reads them back.
+
+	# Parameters
+	path (str): Checkpoint directory
+	GI (gff3_interval): Annotations parsed with digests=True
+	resume (bool): Skip units that already finished
+	options (dict): JSON serializable options of the whole run
+	'''
+	def __init__(self, path, GI, resume=False, **options):
+		result_store.__init__(self, path, GI)
+		self.resume = resume
+		self.options = options
+	def _record_path(self, kind, chrom, col, elem_list, options):
+		options = dict(self.options, **options)
+		return self._unit_path(self.unit_key('checkpoint_'+kind, chrom, col, elem_list, **options))
+	def load(self, kind, chrom, col, elem_list, **options):
+		'''
+		# Returns
+		tuple: (unit, figures) of a finished unit, or None when the unit
+			needs to be computed
+		'''
+		if not self.resume:
+			return None
+		record = _load(self._record_path(kind, chrom, col, elem_list, options))
+		if record is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		return record
+	def save(self, kind, chrom, col, elem_list, unit, figures, **options):
+		'''
+		Records a finished unit and the figures it generated
+		'''
+		_dump(self._record_path(kind, chrom, col, elem_list, options), (unit, list(figures)))
+	def summary(self):
+		if self.resume:
+			logger.info("Resumed %i of %i units from %s"%(self.hits, self.hits+self.misses, self.path))
+
+def _ordered(units, elem_list):
+	'''
+	Merges units into one with the row order of a unit of elem_list
+	'''
+	ret = type(units[0])(units[0].samples)
+	order = dict([(elem, i) for i, elem in enumerate(elem_list)])
+	rows = sorted([(order[key[3]], j, i, key) for j, unit in enumerate(units) for i, key in enumerate(unit.rows)])
+	# Consecutive rows of the same unit are copied together
+	runs = []
+	for o, j, i, key in rows:
+		if runs and runs[-1][0] == j:
+			runs[-1][1].append(key)
+		else:
+			runs.append((j, [key]))
+	for j, keys in runs:
+		ret.extend(units[j], keys)
+	return ret
+
+def _load(path):
+	if os.path.exists(path):
+		try:
+			with open(path, 'rb') as IF:
+				return pickle.load(IF)
+		except (IOError, EOFError, pickle.UnpicklingError) as e:
+			logger.warn("Recomputing unreadable %s (%s)"%(path, e))
+	return None
+
+def _dump(path, obj):
+	if not os.path.exists(os.path.dirname(path)):
+		os.makedirs(os.path.dirname(path))
+	# Units are renamed into place so interrupted runs never leave partial files
+	tmp = '%s.%i.tmp'%(path, os.getpid())
+	with open(tmp, 'wb') as OF:
+		pickle.dump(obj, OF, pickle.HIGHEST_PROTOCOL)
+	os.rename(tmp, path)
@@ -35,224 +35,351 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 ###############################################################################
 
-import logging, sys
+import logging, os, sys
 from .constants import FORMAT, BaseIndex
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.WARN, format=FORMAT)
 
-from . import comparisons
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib_venn import venn2, venn3
+from . import comparisons, results, shared
+from .lazy import plt, matplotlib_venn, mp
 import numpy as np
 from time import time
 
-def tabular_region(GI, p=95, fig_ext='png', temd=False):
+STRANDS = (('+/-', False), ('+', '+'), ('-', '-'))
+
+def _category_list(GI, temd=False):
+	ret = [(1, GI.element_dict)]
+	if temd:
+		ret += [(2, GI.order_dict), (3, GI.sufam_dict)]
+	return ret
+
+def _sstrand(sstr):
+	return 'B' if sstr == '+/-' else sstr
+
+def region_metrics(GI, p=95, temd=False, lengths=False, proportions=False, match_sets=False, chroms=None):
+	'''
+	Computes region metrics for every chromosome, feature category,
+	and strand without printing or plotting
+
+	# Parameters
+	GI (gff3_interval): Control and treatment annotations
+	p (int): Reciprocal percent overlap threshold or comparisons.match_criterion
+	temd (bool): Include TE order and superfamily categories
+	lengths (bool): Store feature length sketches
+	proportions (bool): Store nucleotide proportion arrays (requires reference)
+	match_sets (bool): Store (Ab, aB, AB) interval sets
+	chroms (list): Chromosomes to analyze [all shared]
+
+	# Returns
+	results.region_result
+	'''
+	ret = results.region_result(GI.gff3_names)
+	for chrom in (chroms if chroms else sorted(GI.get_chrom_set())):
+		for col, elem_list in _category_list(GI, temd):
+			ret.extend(_region_unit(GI, chrom, elem_list, col, p, lengths, proportions, match_sets))
+	return ret
+def _region_unit(GI, chrom, elem_list, col, p=95, lengths=False, proportions=False, match_sets=False):
+	ret = results.region_result(GI.gff3_names)
+	cname = GI.gff3_names[0]
+	category = results.CATEGORIES[col]
+	for elem in elem_list:
+		eid = elem_list[elem]
+		for sstr, sval in STRANDS:
+			key = (chrom, sstr, category, elem)
+			counts = {'tp':[], 'fp':[], 'fn':[]}
+			for name in GI.gff3_names:
+				if match_sets:
+					sets = GI.calc_intersect_2(chrom, cname, name, eid, col, p, strand=sval, ret_set=True)
+					ret.matches[(key, name)] = sets
+					Ab, aB, AB = map(len, sets)
+				else:
+					Ab, aB, AB = GI.calc_intersect_2(chrom, cname, name, eid, col, p, strand=sval)
+				counts['tp'].append(AB)
+				counts['fp'].append(aB)
+				counts['fn'].append(Ab)
+				if lengths:
+					ret.lengths[(key, name)] = GI.get_length_sketch(chrom, name, eid, col, sval)
+				if proportions and GI.FA:
+					prop = GI.get_proportion_arrays(chrom, name, eid, col, sval)
+					ret.proportions[(key, name)] = np.array([list(a) for a in prop], dtype=np.float64).reshape(4,-1)
+			ret.add(key, **counts)
+	return ret
+
+def tabular_region(GI, p=95, fig_ext='png', temd=False, store=None, exporter=None, checkpoint=None):
 	chrom_set = GI.get_chrom_set()	# intersecting set chroms from all files
 	max_chrom_len = max(map(len, chrom_set)+[len("Chrom")])
-	max_elem_len = max(map(len, list(GI.element_dict)+list(GI.order_dict)+list(GI.sufam_dict)))
+	max_elem_len = max(map(len, list(GI.element_dict)+list(GI.order_dict)+list(GI.sufam_dict)+["Element"]))
 	max_name_len = max(map(len, list(GI.gff3_names)))
-	#feature_set = # features only in reference
-	non_te_elements = set(GI.element_dict) - GI.te_names
-	te_elements = set(GI.element_dict) & GI.te_names
-	for chrom in chrom_set:
-		_print_table_region(GI, chrom, GI.element_dict, 1, max_chrom_len, \
-			max_elem_len, max_name_len, p, fig_ext)
-		if temd:
-			_print_table_region(GI, chrom, GI.order_dict, 2, max_chrom_len, \
-				max_elem_len, max_name_len, p, fig_ext)
-			_print_table_region(GI, chrom, GI.sufam_dict, 3, max_chrom_len, \
-				max_elem_len, max_name_len, p, fig_ext)
-def _print_table_region(GI, chrom, elem_list, col, mcl, mel, mnl, p=95, fig_ext='png'):
-	target = ("", "Element", "TE_Order", "TE_Superfamily")
+	p_key = comparisons.as_criterion(p).key()
+	# Sorted so exported features are sorted by chromosome
+	for chrom in sorted(chrom_set):
+		for col, elem_list in _category_list(GI, temd):
+			compute = lambda elems: _region_unit(GI, chrom, elems, col, p, lengths=True, \
+				proportions=bool(fig_ext), match_sets=bool(exporter))
+			fetch = lambda: store.fetch('region', chrom, col, elem_list, compute, p=p_key, proportions=bool(fig_ext)) if store else compute(elem_list)
+			plot = lambda unit: plot_region(GI, unit, p, fig_ext) if fig_ext else []
+			unit = _checkpointed(checkpoint, 'region', chrom, col, elem_list, fetch, plot, p=p_key, match_sets=bool(exporter))
+			if exporter:
+				exporter.export_unit(unit, p)
+				unit.matches.clear()
+			_print_table_region(unit, col, max_chrom_len, max_elem_len, max_name_len)
+	logger.info("Finished region table")
+def _checkpointed(checkpoint, kind, chrom, col, elem_list, compute, plot, **options):
+	'''
+	Computes and plots a unit and records it in a checkpoint, or reuses
+	the record of a unit that already finished. Figures missing from a
+	finished unit are plotted again.
+	'''
+	record = checkpoint.load(kind, chrom, col, elem_list, **options) if checkpoint else None
+	if record:
+		unit, figures = record
+		if not all(map(os.path.exists, figures)):
+			plot(unit)
+		return unit
+	unit = compute()
+	figures = plot(unit)
+	if checkpoint:
+		checkpoint.save(kind, chrom, col, elem_list, unit, figures, **options)
+	return unit
+def _print_table_region(unit, col, mcl, mel, mnl):
+	target = results.CATEGORIES
 	mel = max(map(len, target)+[mel])
-	header = ("Chrom","S",target[col],"Sample","TP", "FP", "FN", "SENS", "PREC")
-	template = "{:<{mcl}} {:^3} {:<{mel}} {:<{mn}} "+' '.join(["{:>5}"]*5)
+	header = ("Chrom","S",target[col],"Sample","TP", "FP", "FN", "SENS", "PREC", "N", "MIN", "Q1", "MED", "Q3", "MAX")
+	template = "{:<{mcl}} {:^3} {:<{mel}} {:<{mn}} "+' '.join(["{:>5}"]*5+["{:>8}"]*6)
 	print(template.format(*header, mcl=mcl, mn=mnl, mel=mel))
-	cname = GI.gff3_names[0]
-	for elem in elem_list:
-		eid = elem_list[elem]
-		#print col, eid
-		for sstr, sval in zip(('+/-','+','-'), (False, '+', '-')):
-			#if not np.sum(A): continue
-			length_array_dict = {}
-			proportion_array_dict = {}
-			tp_list, fp_list = [], []
-			for i, name in enumerate(GI.gff3_names):
-				Ab, aB, AB = GI.calc_intersect_2(chrom, cname, name, eid, col, p, strand=sval)
-				#if col == 2:
-				#	sAb, saB, sAB = GI.calc_intersect_2(chrom, cname, name, eid, col, p, strand=sval, ret_set=True)
-				#	print "%s-%s"%(cname.upper(), name), sAb
-				#	print "%s-%s"%(cname, name.upper()), saB
-				#	print "%s-%s"%(cname.upper(), name.upper()), sAB
-				tp, fp, fn, sen, pre = _calc_stats_region(Ab, aB, AB)
-				if i != 0:
-					tp_list.append(tp)
-					fp_list.append(fp)
-				if not i:
-					print(template.format(chrom, sstr, elem, name, tp,fp,fn,sen,pre, mcl=mcl, mn=mnl, mel=mel))
-				else:
-					print(template.format('', '', '', name, tp,fp,fn,sen,pre, mcl=mcl, mn=mnl, mel=mel))
-				# Store array of interval lengths
-				length_array_dict[name] = GI.get_length_array(chrom, name, eid, col, sval)
-				if GI.FA:
-					proportion_array_dict[name] = GI.get_proportion_arrays(chrom, name, eid, col, sval)
-			if not fig_ext or not (sum(tp_list) or sum(fp_list)): continue
-			sstrand = 'B' if sstr == '+/-' else sstr
-			# Generate length boxplot
+	tp, fp, fn = unit['tp'], unit['fp'], unit['fn']
+	sen, pre = np.round(unit.sensitivity, sd), np.round(unit.precision, sd)
+	for r, key in enumerate(unit.rows):
+		chrom, sstr, category, elem = key
+		for i, name in enumerate(unit.samples):
+			len_stats = _length_columns(unit.lengths.get((key, name), None))
+			if not i:
+				print(template.format(chrom, sstr, elem, name, tp[r,i],fp[r,i],fn[r,i],sen[r,i],pre[r,i], *len_stats, mcl=mcl, mn=mnl, mel=mel))
+			else:
+				print(template.format('', '', '', name, tp[r,i],fp[r,i],fn[r,i],sen[r,i],pre[r,i], *len_stats, mcl=mcl, mn=mnl, mel=mel))
+	print("")
+def _length_columns(sketch):
+	if sketch is None:
+		return ('',)*6
+	return [v if np.isnan(v) else int(round(v)) for v in sketch.summary()]
+
+def plot_region(GI, result, p=95, fig_ext='png'):
+	'''
+	Generates length, proportion, and venn figures for every row of a
+	region_result with true or false positives in the treatments
+
+	# Returns
+	list: figure names
+	'''
+	figures = []
+	names = result.samples
+	for r, key in enumerate(result.rows):
+		chrom, sstr, category, elem = key
+		if not (result['tp'][r,1:].sum() or result['fp'][r,1:].sum()): continue
+		sstrand = _sstrand(sstr)
+		# Generate length boxplot
+		if all([(key, name) in result.lengths for name in names]):
 			fig_name = "length_bp_%s_%s_%s.%s"%(chrom, sstrand, elem, fig_ext)
 			plt.figure(dpi=200)
-			assert(np.all(length_array_dict[length_array_dict.keys()[0]] == length_array_dict.values()[0]))
-			len_list = [length_array_dict[name] for name in GI.gff3_names]
-			plt.boxplot(map(np.sqrt, len_list), labels=GI.gff3_names)
+			stats = []
+			for name in names:
+				stats.append(result.lengths[(key, name)].boxplot_stats(np.sqrt))
+				stats[-1]['label'] = name
+			plt.gca().bxp(stats)
 			plt.ylabel('sqrt(length)')
 			plt.title('%s %s %s length distribution'%(chrom, sstr, elem))
 			plt.savefig(fig_name)
-			del len_list
 			plt.close()
-			# Generate proportion boxplot
-			if GI.FA:
-				fig_name = "proportion_%s_%s_%s.%s"%(chrom, sstrand, elem, fig_ext)
-				plt.figure(dpi=200)
-				colors = {'G':'gold', 'T':'tomato', 'A':'seagreen', 'C':'royalblue'}
-				space, width = 2.0/33, 4.0/33
-				pos_stop = space/2.0+width/2.0
-				pos = np.array([-3.0*pos_stop, -pos_stop, pos_stop, 3*pos_stop])
-				bpl = []
-				for i,name in enumerate(GI.gff3_names):
-					for j in range(4):
-						bp = plt.boxplot(proportion_array_dict[name][j], positions=[pos[j]+(i+1.0)], patch_artist=True, widths=[width], showfliers=False)
-						bpl.append(bp)
-						plt.setp(bpl[-1]["boxes"], facecolor=colors[BaseIndex[j]])
-				plt.xticks(np.arange(len(GI.gff3_names))+1, GI.gff3_names)
-				max_pro = 0.5
-				#for pa in proportion_array_dict.values():
-				#	for a in pa:
-				#		if len(a) > 0: max_pro = max(max_pro, max(a))
-				for bp in bpl:
-					max_pro = max(max_pro, max([max(w.get_ydata()) for w in bp['whiskers']]))
-				plt.legend([bp["boxes"][0] for bp in bpl[:4]], [BaseIndex[i] for i in range(4)], loc='upper right')
-				plt.ylim(0, min(max_pro*1.2, 1))
-				plt.xlim(0.5, len(GI.gff3_names)+0.5)
-				plt.ylabel('Proportion')
-				plt.title('%s %s %s Nucleotide Proportion'%(chrom, sstr, elem))
-				plt.savefig(fig_name)
-				plt.close()
-			# Generate venn figure
-			if len(GI.gff3_names) not in (2,3): continue
-			fig_name = "region_%s_%s_%s.%s"%(chrom, sstrand, elem, fig_ext)
-			logger.debug("Generating %s"%(fig_name))
-			if len(GI.gff3_names) in (2,3):
-				plt.figure(figsize=(4,4), dpi=200)
-				plt.title("%s %s %s"%(chrom, sstr, elem))
-			if len(GI.gff3_names) == 2: # (Ab, aB, AB)
-				n1, n2 = GI.gff3_names
-				ret = GI.calc_intersect_2(chrom, n1, n2, eid, col, p, strand=sval)
-				if Ab or aB or AB:
-					venn2(subsets=ret, set_labels=GI.gff3_names)
-				else:
-					logger.warn("Empty plot for %s_%s_%s"%(chrom, sstrand, elem))
-			elif len(GI.gff3_names) == 3: # (Abc, aBc, ABc, abC, AbC, aBC, ABC)
-				n1, n2, n3 = GI.gff3_names
-				ret = GI.calc_intersect_3(chrom, n1, n2, n3, eid, col, p, strand=sval)
-				if np.sum(ret):
-					venn3(subsets=ret, set_labels=GI.gff3_names)
-				else:
-					strand = 'B' if sstr == '+/-' else sstr
-					logger.warn("Empty plot for %s_%s_%s"%(chrom, strand, elem))
-			if len(GI.gff3_names) in (2,3):
-				plt.savefig(fig_name)
-				plt.close()
-	print("")
-	logger.info("Finished region table")
+			figures.append(fig_name)
+		# Generate proportion boxplot
+		if all([(key, name) in result.proportions for name in names]):
+			fig_name = "proportion_%s_%s_%s.%s"%(chrom, sstrand, elem, fig_ext)
+			plt.figure(dpi=200)
+			colors = {'G':'gold', 'T':'tomato', 'A':'seagreen', 'C':'royalblue'}
+			space, width = 2.0/33, 4.0/33
+			pos_stop = space/2.0+width/2.0
+			pos = np.array([-3.0*pos_stop, -pos_stop, pos_stop, 3*pos_stop])
+			bpl = []
+			for i,name in enumerate(names):
+				for j in range(4):
+					bp = plt.boxplot(result.proportions[(key, name)][j], positions=[pos[j]+(i+1.0)], patch_artist=True, widths=[width], showfliers=False)
+					bpl.append(bp)
+					plt.setp(bpl[-1]["boxes"], facecolor=colors[BaseIndex[j]])
+			plt.xticks(np.arange(len(names))+1, names)
+			max_pro = 0.5
+			for bp in bpl:
+				max_pro = max(max_pro, max([max(w.get_ydata()) for w in bp['whiskers']]))
+			plt.legend([bp["boxes"][0] for bp in bpl[:4]], [BaseIndex[i] for i in range(4)], loc='upper right')
+			plt.ylim(0, min(max_pro*1.2, 1))
+			plt.xlim(0.5, len(names)+0.5)
+			plt.ylabel('Proportion')
+			plt.title('%s %s %s Nucleotide Proportion'%(chrom, sstr, elem))
+			plt.savefig(fig_name)
+			plt.close()
+			figures.append(fig_name)
+		# Generate venn figure
+		if len(names) not in (2,3): continue
+		fig_name = "region_%s_%s_%s.%s"%(chrom, sstrand, elem, fig_ext)
+		logger.debug("Generating %s"%(fig_name))
+		plt.figure(figsize=(4,4), dpi=200)
+		plt.title("%s %s %s"%(chrom, sstr, elem))
+		if len(names) == 2: # (Ab, aB, AB)
+			ret = (result['fn'][r,1], result['fp'][r,1], result['tp'][r,1])
+			if sum(ret):
+				matplotlib_venn.venn2(subsets=ret, set_labels=names)
+			else:
+				logger.warn("Empty plot for %s_%s_%s"%(chrom, sstrand, elem))
+		elif len(names) == 3: # (Abc, aBc, ABc, abC, AbC, aBC, ABC)
+			col = results.CATEGORIES.index(category)
+			eid = dict(_category_list(GI, True))[col][elem]
+			n1, n2, n3 = names
+			ret = GI.calc_intersect_3(chrom, n1, n2, n3, eid, col, p, strand=dict(STRANDS)[sstr])
+			if np.sum(ret):
+				matplotlib_venn.venn3(subsets=ret, set_labels=names)
+			else:
+				logger.warn("Empty plot for %s_%s_%s"%(chrom, sstrand, elem))
+		plt.savefig(fig_name)
+		plt.close()
+		figures.append(fig_name)
+	return figures
+
+def base_metrics(GI, temd=False, chroms=None, plan=None):
+	'''
+	Computes base pair metrics for every chromosome, feature category,
+	and strand without printing or plotting
 
-def tabular(GI, strand=True, fig_ext='png', temd=False):
+	# Parameters
+	GI (gff3_interval): Control and treatment annotations
+	temd (bool): Include TE order and superfamily categories
+	chroms (list): Chromosomes to analyze [all shared]
+	plan (planner.execution_plan): Base pair strategy [dense]
+
+	# Returns
+	results.base_result
+	'''
+	ret = results.base_result(GI.gff3_names)
+	pool = _base_pool(plan)
+	try:
+		for chrom in (chroms if chroms else sorted(GI.get_chrom_set())):
+			for col, elem_list in _category_list(GI, temd):
+				ret.extend(_base_unit(GI, chrom, elem_list, col, plan, pool))
+	finally:
+		if pool:
+			pool.close()
+			pool.join()
+	return ret
+def _base_unit(GI, chrom, elem_list, col, plan=None, pool=None):
+	ret = results.base_result(GI.gff3_names)
+	category = results.CATEGORIES[col]
+	n = len(GI.gff3_names)
+	if pool:
+		histograms = shared_histograms(GI, chrom, list(elem_list), col, plan, pool)
+	for elem in elem_list:
+		hists = histograms[elem] if pool else base_histograms(GI, chrom, elem, col, plan)
+		for (sstr, sval), (codes, counts) in zip(STRANDS, hists):
+			key = (chrom, sstr, category, elem)
+			# Every table value and figure subset comes from one histogram
+			tp, fp, tn, fn = comparisons.histogram_stats(codes, counts, n)
+			ret.add(key, tp=tp, fp=fp, tn=tn, fn=fn)
+			ret.membership[key] = (codes, counts)
+	return ret
+
+def tabular(GI, strand=True, fig_ext='png', temd=False, plan=None, store=None, checkpoint=None):
 	chrom_set = GI.get_chrom_set()	# intersecting set chroms from all files
 	max_chrom_len = max(map(len, chrom_set)+[len("Chrom")])
-	max_elem_len = max(map(len, list(GI.element_dict)+list(GI.order_dict)+list(GI.sufam_dict)))
+	max_elem_len = max(map(len, list(GI.element_dict)+list(GI.order_dict)+list(GI.sufam_dict)+["Element"]))
 	max_name_len = max(map(len, list(GI.gff3_names)))
-	#feature_set = # features only in reference
-	non_te_elements = set(GI.element_dict)-GI.te_names
-	te_elements = set(GI.element_dict) & GI.te_names
-	for chrom in chrom_set:
-		_print_table(GI, chrom, GI.element_dict, 1, max_chrom_len, \
-			max_elem_len, max_name_len, fig_ext)
-		if temd:
-			_print_table(GI, chrom, GI.order_dict, 2, max_chrom_len, \
-				max_elem_len, max_name_len, fig_ext)
-			_print_table(GI, chrom, GI.sufam_dict, 3, max_chrom_len, \
-				max_elem_len, max_name_len, fig_ext)
-				
-def _print_table(GI, chrom, elem_list, col, mcl, mel, mnl, fig_ext='png'):
-	target = ("", "Element", "TE_Order", "TE_Superfamily")
+	pool = _base_pool(plan)
+	try:
+		for chrom in chrom_set:
+			for col, elem_list in _category_list(GI, temd):
+				compute = lambda elems: _base_unit(GI, chrom, elems, col, plan, pool)
+				fetch = lambda: store.fetch('base', chrom, col, elem_list, compute) if store else compute(elem_list)
+				plot = lambda unit: plot_base(unit, fig_ext) if fig_ext else []
+				unit = _checkpointed(checkpoint, 'base', chrom, col, elem_list, fetch, plot)
+				_print_table(unit, col, max_chrom_len, max_elem_len, max_name_len)
+	finally:
+		if pool:
+			pool.close()
+			pool.join()
+def _print_table(unit, col, mcl, mel, mnl):
+	target = results.CATEGORIES
 	mel = max(map(len, target)+[mel])
 	header = ("Chrom","S",target[col],"Sample","TP", "FP", "TN", "FN", "SENS", "SPEC", "PREC")
 	template = "{:<{mcl}} {:^3} {:<{mel}} {:<{mn}} "+' '.join(["{:>8}"]*7)
 	print(template.format(*header, mcl=mcl, mn=mnl, mel=mel))
-	for elem in elem_list:
-		fa, ra, ba = _gen_arrays(GI, chrom, elem, col)
-		for s, A in zip(('+/-','+','-'), (ba,fa,ra)):
-			#if not np.sum(A): continue
-			tp, fp, tn, fn, sen, spe, pre = _calc_stats(A)
-			for i, name in enumerate(GI.gff3_names):
-				if not i:
-					print(template.format(chrom, s, elem, name, tp[i],fp[i],tn[i],fn[i],sen[i],spe[i],pre[i], mcl=mcl, mn=mnl, mel=mel))
-				else:
-					print(template.format('','','', name, tp[i],fp[i],tn[i],fn[i],sen[i],spe[i],pre[i], mcl=mcl, mn=mnl, mel=mel))
-			if not fig_ext or A.shape[0] not in (2,3) or not (tp[1:].sum() or fp[1:].sum()): continue
-			# Generate figure
-			strand = 'B' if s == '+/-' else s
+	tp, fp, tn, fn = unit['tp'], unit['fp'], unit['tn'], unit['fn']
+	sen, spe, pre = [np.round(a, sd) for a in (unit.sensitivity, unit.specificity, unit.precision)]
+	for r, (chrom, s, category, elem) in enumerate(unit.rows):
+		for i, name in enumerate(unit.samples):
+			if not i:
+				print(template.format(chrom, s, elem, name, tp[r,i],fp[r,i],tn[r,i],fn[r,i],sen[r,i],spe[r,i],pre[r,i], mcl=mcl, mn=mnl, mel=mel))
+			else:
+				print(template.format('','','', name, tp[r,i],fp[r,i],tn[r,i],fn[r,i],sen[r,i],spe[r,i],pre[r,i], mcl=mcl, mn=mnl, mel=mel))
+	print("")
+
+def plot_base(result, fig_ext='png'):
+	'''
+	Generates venn (2-3 samples) or UpSet (4+ samples) figures for every
+	row of a base_result with true or false positives in the treatments
+
+	# Returns
+	list: figure names
+	'''
+	figures = []
+	names = result.samples
+	for r, key in enumerate(result.rows):
+		chrom, s, category, elem = key
+		if key not in result.membership or len(names) < 2 or not (result['tp'][r,1:].sum() or result['fp'][r,1:].sum()): continue
+		# Generate figure
+		strand = _sstrand(s)
+		codes, counts = result.membership[key]
+		title = "%s %s %s"%(chrom, s, elem)
+		if len(names) in (2,3):
 			fig_name = "base_%s_%s_%s.%s"%(chrom, strand, elem, fig_ext)
 			logger.debug("Generating %s"%(fig_name))
 			plt.figure(figsize=(4,4), dpi=200)
-			plt.title("%s %s %s"%(chrom, s, elem))
-			if A.shape[0] == 2: # (Ab, aB, AB)
-				Ab = _venn2_helper(A, 1, 0)
-				aB = _venn2_helper(A, 0, 1)
-				AB = _venn2_helper(A, 1, 1)
-				venn_sets = (Ab, aB, AB)
-				assert(venn_sets == (fn[1], fp[1], tp[1]))
-				if A.sum():
-					venn2(subsets=venn_sets, set_labels=GI.gff3_names)
-				else:
-					logger.warn("Empty plot for %s_%s_%s"%(chrom, strand, elem))
-			elif A.shape[0] == 3: # (Abc, aBc, ABc, abC, AbC, aBC, ABC)
-				Abc = _venn3_helper(A, 1, 0, 0)
-				aBc = _venn3_helper(A, 0, 1, 0)
-				ABc = _venn3_helper(A, 1, 1, 0)
-				abC = _venn3_helper(A, 0, 0, 1)
-				AbC = _venn3_helper(A, 1, 0, 1)
-				aBC = _venn3_helper(A, 0, 1, 1)
-				ABC = _venn3_helper(A, 1, 1, 1)
-				if A.sum():
-					venn3(subsets=(Abc, aBc, ABc, abC, AbC, aBC, ABC), set_labels=GI.gff3_names)
-				else:
-					logger.warn("Empty plot for %s_%s_%s"%(chrom, strand, elem))
-			plt.savefig(fig_name)
-			plt.close()
-	print("")
-
-def _venn3_helper(array, rv0=1, rv1=0, rv2=0):
-	start = time()
-	m0 = array[0,:] == rv0
-	m1 = array[1,:] == rv1
-	m2 = array[2,:] == rv2
-	assert(len(m0) == len(m1) and len(m1) == len(m2))
-	m0a1 = np.logical_and(m0, m1)
-	m0a1a2 = np.logical_and(m0a1, m2)
-	ret = np.sum(m0a1a2)
-	logger.debug("%.3f seconds"%(time()-start))
-	return ret
-def _venn2_helper(array, rv0=1, rv1=0):
-	start = time()
-	m0 = array[0,:] == rv0
-	m1 = array[1,:] == rv1
-	assert(len(m0) == len(m1))
-	m0a1 = np.logical_and(m0, m1)
-	ret = np.sum(m0a1)
-	logger.debug("%.3f seconds"%(time()-start))
-	return ret
+			plt.title(title)
+			venn_sets = result.venn_subsets(key)
+			if len(names) == 2: # (Ab, aB, AB)
+				assert(venn_sets == (result['fn'][r,1], result['fp'][r,1], result['tp'][r,1]))
+				matplotlib_venn.venn2(subsets=venn_sets, set_labels=names)
+			else: # (Abc, aBc, ABc, abC, AbC, aBC, ABC)
+				matplotlib_venn.venn3(subsets=venn_sets, set_labels=names)
+		else:
+			fig_name = "upset_%s_%s_%s.%s"%(chrom, strand, elem, fig_ext)
+			logger.debug("Generating %s"%(fig_name))
+			_plot_upset(names, codes, counts, title)
+		plt.savefig(fig_name)
+		plt.close()
+		figures.append(fig_name)
+	return figures
+def _plot_upset(names, codes, counts, title, max_cells=30):
+	'''
+	Draws an UpSet plot of the largest non-empty membership cells
+	'''
+	mask = codes != 0
+	codes, counts = codes[mask], counts[mask]
+	order = np.argsort(counts, kind='mergesort')[::-1][:max_cells]
+	codes, counts = codes[order], counts[order]
+	bits = comparisons._code_bits(codes, len(names))
+	x = np.arange(len(codes))
+	fig, (ax_bar, ax_dot) = plt.subplots(2, 1, sharex=True, dpi=200, \
+		figsize=(max(4, 0.3*len(codes)+2), 3+0.25*len(names)), gridspec_kw={'height_ratios':[2, 1]})
+	ax_bar.bar(x, counts, color='dimgray')
+	ax_bar.set_ylabel('Bases')
+	ax_bar.set_title(title)
+	for i in range(len(names)):
+		ax_dot.scatter(x, [i]*len(x), c=np.where(bits[:,i], 'black', 'lightgray'), s=20)
+	for j in x:
+		rows = np.nonzero(bits[j])[0]
+		if len(rows) > 1:
+			ax_dot.plot([j, j], [rows.min(), rows.max()], color='black')
+	ax_dot.set_yticks(np.arange(len(names)))
+	ax_dot.set_yticklabels(names)
+	ax_dot.set_xticks([])
+	ax_dot.set_ylim(-0.5, len(names)-0.5)
+	plt.tight_layout()
 
 def _gen_arrays(GI, chrom, elem, col):
 	start = time()
@@ -267,6 +394,82 @@ def _gen_arrays(GI, chrom, elem, col):
 	assert(not da)
 	logger.debug("%.3f seconds"%(time()-start))
 	return fa, ra, ba
+def base_histograms(GI, chrom, elem, col, plan=None):
+	'''
+	Membership histograms of both strands, the forward strand, and the
+	reverse strand of a feature using the strategy of an execution plan
+
+	# Returns
+	list: (codes, counts) for each strand in STRANDS
+	'''
+	strategy = plan.strategy if plan else 'dense'
+	if strategy == 'dense':
+		fa, ra, ba = _gen_arrays(GI, chrom, elem, col)
+		return [comparisons.membership_histogram(A) for A in (ba, fa, ra)]
+	eid = dict(_category_list(GI, True))[col][elem]
+	length = GI._get_max(chrom)
+	if strategy == 'intervals':
+		return [comparisons.interval_histogram(GI.elem_intervals(chrom, eid, col, s), length) for s in (None, 0, 1)]
+	tiles = [[], [], []]
+	for start in range(0, length, plan.tile):
+		end = min(start+plan.tile, length)
+		ba, da = GI.elem_array(chrom, eid, col, False, start, end)
+		fa, ra = GI.elem_array(chrom, eid, col, True, start, end)
+		for h, A in zip(tiles, (ba, fa, ra)):
+			h.append(comparisons.membership_histogram(A))
+	return [comparisons.merge_histograms(h) for h in tiles]
+def _base_pool(plan):
+	'''
+	Worker pool for the base pair stage when a plan has more than one
+	worker. Tiles are computed serially, since they exist to bound memory.
+	'''
+	if plan and plan.workers > 1 and plan.strategy != 'tiled':
+		return mp.Pool(plan.workers)
+	return None
+def _histogram_worker(task):
+	kind, args = task
+	if kind == 'dense':
+		return comparisons.membership_histogram(shared.attach(args))
+	starts, ends, bounds, length = args
+	starts, ends = shared.attach(starts), shared.attach(ends)
+	rows = [(starts[a:b], ends[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+	return comparisons.interval_histogram(rows, length)
+def shared_histograms(GI, chrom, elems, col, plan, pool):
+	'''
+	Membership histograms of several features computed by a pool of
+	workers. The base arrays (dense) or interval columns (intervals) of
+	plan.workers features at a time are written once to shared memory,
+	and workers attach to them by name instead of receiving copies.
+
+	# Returns
+	dict: {elem: [(codes, counts) for each strand in STRANDS]}
+	'''
+	eids = dict(_category_list(GI, True))[col]
+	length = GI._get_max(chrom)
+	n = len(GI.gff3_names)
+	ret = {}
+	for b in range(0, len(elems), plan.workers):
+		batch = elems[b:b+plan.workers]
+		tasks = []
+		with shared.shared_arrays() as SA:
+			for elem in batch:
+				eid = eids[elem]
+				if plan.strategy == 'intervals':
+					for s in (None, 0, 1):
+						rows = GI.elem_intervals(chrom, eid, col, s)
+						bounds = np.cumsum([0]+[len(r[0]) for r in rows]).tolist()
+						starts = SA.put(np.concatenate([r[0] for r in rows]))
+						ends = SA.put(np.concatenate([r[1] for r in rows]))
+						tasks.append(('intervals', (starts, ends, bounds, length)))
+				else:
+					(bd, ba), (fd, fa), (rd, ra) = [SA.empty((n, length)) for i in range(3)]
+					GI.elem_array(chrom, eid, col, False, out=(ba,))
+					GI.elem_array(chrom, eid, col, True, out=(fa, ra))
+					tasks += [('dense', bd), ('dense', fd), ('dense', rd)]
+			out = pool.map(_histogram_worker, tasks, chunksize=1)
+		for i, elem in enumerate(batch):
+			ret[elem] = out[3*i:3*i+3]
+	return ret
 sd = 3
 def _calc_stats(A):
 	tp = comparisons.tp(A)
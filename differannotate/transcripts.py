@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+import logging, re
+import numpy as np
+from collections import defaultdict as dd
+from differannotate.constants import FORMAT
+from differannotate.datastructures import interval_index
+from differannotate import results
+from differannotate.comparisons import _overlap_r_tup
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+LEVELS = ('exon', 'intron', 'cds')
+_parent_re = re.compile('(?:^|;)\s*Parent=(?P<parent>[^;]+)')
+
+class chain_builder:
+	'''
+	Collects exon and CDS records by parent while a GFF3 is parsed
+	'''
+	def __init__(self, exon_names=('exon',), cds_names=('cds',)):
+		self.exon_names = set(exon_names)
+		self.cds_names = set(cds_names)
+		self.exons = dd(list)
+		self.cds = dd(list)
+		self.order = []
+	def wants(self, element):
+		return element in self.exon_names or element in self.cds_names
+	def add(self, chrom, element, start, end, strand, attributes):
+		'''
+		# Parameters
+		element (str): Lower-case feature type
+		start (int): 0-based start
+		end (int): Exclusive end
+		'''
+		if element in self.exon_names:
+			target = self.exons
+		elif element in self.cds_names:
+			target = self.cds
+		else:
+			return
+		match = _parent_re.search(attributes)
+		if not match:
+			return
+		for parent in match.group('parent').split(','):
+			key = (chrom, strand, parent)
+			if key not in self.exons and key not in self.cds:
+				self.order.append(key)
+			target[key].append((start, end))
+	def merge(self, other):
+		'''
+		Appends the records of a builder that collected the lines after
+		the ones of this builder
+
+		# Returns
+		chain_builder: self
+		'''
+		for key in other.order:
+			if key not in self.exons and key not in self.cds:
+				self.order.append(key)
+		for target, source in ((self.exons, other.exons), (self.cds, other.cds)):
+			for key, blocks in source.items():
+				target[key].extend(blocks)
+		return self
+	def build(self):
+		'''
+		# Returns
+		transcript_set
+		'''
+		return transcript_set(self.exons, self.cds, self.order)
+
+def _merge(blocks):
+	'''
+	Sorts blocks and merges the ones that overlap or touch
+
+	>>> _merge([(20, 30), (0, 10), (10, 15)])
+	((0, 15), (20, 30))
+	'''
+	ret = []
+	for s, e in sorted(blocks):
+		if ret and s <= ret[-1][1]:
+			ret[-1][1] = max(ret[-1][1], e)
+		else:
+			ret.append([s, e])
+	return tuple([tuple(b) for b in ret])
+
+def exon_chain(blocks):
+	'''
+	Canonical key of all exon coordinates
+
+	>>> exon_chain([(50, 60), (0, 10)])
+	(0, 10, 50, 60)
+	'''
+	return tuple([c for b in _merge(blocks) for c in b])
+
+def intron_chain(blocks):
+	'''
+	Canonical key of intron boundaries. Single exon transcripts have an
+	empty intron chain.
+
+	>>> intron_chain([(50, 60), (0, 10), (20, 30)])
+	(10, 20, 30, 50)
+	'''
+	chain = exon_chain(blocks)
+	return chain[1:-1]
+
+class transcript_set:
+	'''
+	Transcripts of one annotation keyed by their canonical chains. Indices
+	follow the order transcripts first appear in the GFF3.
+
+	# Attributes
+	ids (dict): {chrom: [transcript id, ...]}
+	spans (dict): {chrom: interval_index of transcript spans}
+	chains (dict): {level: {chrom: [chain, ...]}}
+	lookup (dict): {level: {(chrom, strand, chain): [transcript index, ...]}}
+	'''
+	def __init__(self, exons, cds, order):
+		self.ids = dd(list)
+		self.strands = dd(list)
+		self.chains = dict([(level, dd(list)) for level in LEVELS])
+		self.lookup = dict([(level, dd(list)) for level in LEVELS])
+		starts, ends = dd(list), dd(list)
+		for key in order:
+			if key not in exons: continue
+			chrom, strand, tid = key
+			blocks = exons[key]
+			i = len(self.ids[chrom])
+			chains = {'exon':exon_chain(blocks), 'intron':intron_chain(blocks), \
+				'cds':exon_chain(cds[key]) if key in cds else ()}
+			self.ids[chrom].append(tid)
+			self.strands[chrom].append(strand)
+			chain = chains['exon']
+			starts[chrom].append(chain[0])
+			ends[chrom].append(chain[-1])
+			for level in LEVELS:
+				self.chains[level][chrom].append(chains[level])
+				if chains[level]:
+					self.lookup[level][(chrom, strand, chains[level])].append(i)
+		self.spans = {}
+		for chrom in self.ids:
+			n = len(self.ids[chrom])
+			self.spans[chrom] = interval_index(starts[chrom], ends[chrom], \
+				[1 if s == '-' else 0 for s in self.strands[chrom]], np.arange(n))
+	def __len__(self):
+		return sum(map(len, self.ids.values()))
+	def count(self, chrom, level):
+		'''
+		Number of transcripts with a chain at this level (all transcripts
+		have exon and intron levels)
+		'''
+		if level == 'cds':
+			return sum([1 for c in self.chains[level].get(chrom, []) if c])
+		return len(self.ids.get(chrom, []))
+
+def _chains_match(a, b, tol):
+	'''
+	Chains match when they have the same number of boundaries and every
+	boundary differs by at most tol bases
+
+	>>> _chains_match((10, 20, 30, 50), (12, 20, 30, 49), 2)
+	True
+	'''
+	if len(a) != len(b):
+		return False
+	return max([abs(x-y) for x, y in zip(a, b)]) <= tol
+
+def match_transcripts(ref, query, chrom, level='intron', tol=0, p=90):
+	'''
+	Finds which reference and query transcripts match. Identical chains
+	are found with a single hash lookup, and only the remaining near misses
+	are checked against overlapping transcripts when tol > 0. Single exon
+	transcripts match by reciprocal overlap at the intron level.
+
+	# Parameters
+	ref (transcript_set): Reference transcripts
+	query (transcript_set): Query transcripts
+	chrom (str): Chromosome
+	level (str): 'exon', 'intron', or 'cds' chains
+	tol (int): Maximum boundary difference in bases for fuzzy matches
+	p (int): Reciprocal percent overlap of single exon transcripts
+
+	# Returns
+	np.ndarray: Boolean matched flags of reference transcripts
+	np.ndarray: Boolean matched flags of query transcripts
+	'''
+	ref_chains = ref.chains[level].get(chrom, [])
+	query_chains = query.chains[level].get(chrom, [])
+	ref_hit = np.zeros(len(ref_chains), dtype=bool)
+	query_hit = np.zeros(len(query_chains), dtype=bool)
+	if not len(ref_chains) or not len(query_chains):
+		return ref_hit, query_hit
+	query_lookup = query.lookup[level]
+	near_miss = []
+	for i, chain in enumerate(ref_chains):
+		if not chain:
+			# Single exon transcripts have no intron chain to hash
+			if level == 'intron':
+				near_miss.append(i)
+			continue
+		hits = query_lookup.get((chrom, ref.strands[chrom][i], chain), [])
+		if hits:
+			ref_hit[i] = True
+			query_hit[hits] = True
+		elif tol > 0:
+			near_miss.append(i)
+	if not near_miss:
+		return ref_hit, query_hit
+	ref_exons = ref.chains['exon'][chrom]
+	query_exons = query.chains['exon'][chrom]
+	starts = np.array([ref_exons[i][0] for i in near_miss])
+	ends = np.array([ref_exons[i][-1] for i in near_miss])
+	spans = query.spans[chrom]
+	qidx, hidx = spans.query(starts, ends)
+	for q, h in zip(qidx, hidx):
+		i = near_miss[q]
+		j = spans.element[h]
+		if ref.strands[chrom][i] != query.strands[chrom][j]:
+			continue
+		a, b = ref_chains[i], query_chains[j]
+		if not a:
+			ok = not b and _overlap_r_tup(ref_exons[i], query_exons[j], p)
+		else:
+			ok = _chains_match(a, b, tol)
+		if ok:
+			ref_hit[i] = True
+			query_hit[j] = True
+	return ref_hit, query_hit
+
+class transcript_result(results.metric_table):
+	'''
+	Transcript matches relative to the first sample. Sensitivity is the
+	fraction of reference transcripts with a match, and precision is the
+	fraction of query transcripts with a match.
+	'''
+	count_names = ('tp_ref', 'fn', 'tp_query', 'fp')
+	stat_names = ('sensitivity', 'precision')
+	@property
+	def sensitivity(self):
+		return self._ratio('tp_ref', 'fn')
+	@property
+	def precision(self):
+		return self._ratio('tp_query', 'fp')
+
+def transcript_metrics(GI, tol=0, p=90, levels=LEVELS, chroms=None):
+	'''
+	Compares the transcripts of every annotation against the first one
+
+	# Returns
+	transcript_result
+	'''
+	ret = transcript_result(GI.gff3_names)
+	ref = GI.gff3_chains[GI.gff3_names[0]]
+	for chrom in (chroms if chroms else sorted(GI.get_chrom_set())):
+		for level in levels:
+			counts = dict([(n, []) for n in transcript_result.count_names])
+			for name in GI.gff3_names:
+				query = GI.gff3_chains[name]
+				ref_hit, query_hit = match_transcripts(ref, query, chrom, level, tol, p)
+				n_ref, n_query = ref.count(chrom, level), query.count(chrom, level)
+				counts['tp_ref'].append(ref_hit.sum())
+				counts['fn'].append(n_ref-ref_hit.sum())
+				counts['tp_query'].append(query_hit.sum())
+				counts['fp'].append(n_query-query_hit.sum())
+			ret.add((chrom, '+/-', 'Transcript', level), **counts)
+	return ret
+
+def tabular(GI, tol=0, p=90):
+	'''
+	Prints transcript chain metrics for every chromosome
+	'''
+	ret = transcript_metrics(GI, tol, p)
+	chroms = [r[0] for r in ret.rows]
+	mcl = max(map(len, chroms)+[len("Chrom")])
+	mnl = max(map(len, list(GI.gff3_names)))
+	header = ("Chrom", "Chain", "Sample", "TP_REF", "FN", "TP_QRY", "FP", "SENS", "PREC")
+	template = "{:<{mcl}} {:<6} {:<{mn}} "+' '.join(["{:>6}"]*6)
+	print(template.format(*header, mcl=mcl, mn=mnl))
+	sen, pre = np.round(ret.sensitivity, 3), np.round(ret.precision, 3)
+	for r, (chrom, sstr, category, level) in enumerate(ret.rows):
+		for i, name in enumerate(ret.samples):
+			vals = [ret[n][r,i] for n in transcript_result.count_names]+[sen[r,i], pre[r,i]]
+			if not i:
+				print(template.format(chrom, level, name, *vals, mcl=mcl, mn=mnl))
+			else:
+				print(template.format('', '', name, *vals, mcl=mcl, mn=mnl))
+	print("")
+	return ret
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#
+###############################################################################
+# Author: Greg Zynda
+# Last Modified: 10/19/2026
+###############################################################################
+# BSD 3-Clause License
+# 
+# Copyright (c) 2019, Greg Zynda
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# 
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+
+import logging, os, re
+import numpy as np
+from time import time
+from differannotate.constants import FORMAT
+from differannotate import comparisons, results, summaries
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.WARN, format=FORMAT)
+
+COUNTS = ('tp', 'fp', 'tn', 'fn')
+# Category of each column in track names, so features that share a name do not collide
+TRACK_CATEGORIES = (None, 'element', 'order', 'sufam')
+_unsafe_re = re.compile('[^A-Za-z0-9_.+-]+')
+
+class prefix_counts(object):
+	'''
+	Cumulative TP, FP, TN, and FN base counts of every sample along a
+	chromosome. Counts are stored at the boundaries of constant membership
+	segments, so any window is two lookups and a difference, and the cost
+	does not depend on the number of windows.
+
+	# Parameters
+	rows (list): (starts, ends) arrays of each sample, control first
+	length (int): Chromosome length
+
+	# Usage
+	>>> PC = prefix_counts([(np.array([0]), np.array([6])), (np.array([3]), np.array([9]))], 10)
+	>>> [list(c[:,1]) for c in PC.window_counts([0, 5], [5, 10])]
+	[[2, 1], [0, 3], [0, 1], [3, 0]]
+	'''
+	def __init__(self, rows, length, control_row=0):
+		self.bounds, codes = comparisons.interval_segments(rows, length)
+		bits = comparisons._code_bits(codes, len(rows))
+		c = bits[:,control_row][:,None]
+		seg_lens = np.diff(self.bounds)
+		# (4, segments, samples) indicators of every class
+		self.indicators = np.array([c & bits, ~c & bits, ~c & ~bits, c & ~bits]).astype(np.int64)
+		cum = np.cumsum(self.indicators*seg_lens[None,:,None], axis=1)
+		self.cumulative = np.concatenate([np.zeros((4, 1, len(rows)), dtype=np.int64), cum], axis=1)
+	def at(self, positions):
+		'''
+		# Returns
+		np.ndarray: (4, positions, samples) counts in [0, position)
+		'''
+		positions = np.asarray(positions, dtype=np.int64)
+		seg = np.clip(np.searchsorted(self.bounds, positions, 'right')-1, 0, len(self.bounds)-2)
+		offset = (positions-self.bounds[seg])[None,:,None]
+		return self.cumulative[:,seg,:]+offset*self.indicators[:,seg,:]
+	def window_counts(self, starts, ends):
+		'''
+		# Returns
+		np.ndarray: (4, windows, samples) TP, FP, TN, and FN counts
+		'''
+		return self.at(ends)-self.at(starts)
+
+def window_edges(length, size, step=None):
+	'''
+	>>> [list(a) for a in window_edges(10, 4, 3)]
+	[[0, 3, 6, 9], [4, 7, 10, 10]]
+	'''
+	step = step if step else size
+	starts = np.arange(0, length, step, dtype=np.int64)
+	return starts, np.minimum(starts+size, length)
+
+def _ratio(num, other):
+	with np.errstate(divide='ignore', invalid='ignore'):
+		return num.astype(np.float64)/(num+other)
+
+def track_name(name):
+	'''
+	Makes a feature or sample name safe for file names
+
+	>>> track_name('LTR/Copia'), track_name('')
+	('LTR-Copia', 'none')
+	'''
+	return _unsafe_re.sub('-', name) or 'none'
+
+def tracks(GI, size, step=None, temd=False, prefix='window', chroms=None):
+	'''
+	Writes sliding-window agreement of every treatment against the control
+	for every feature on both strands. Each feature and sample gets a TSV
+	of window counts and metrics, and a bedGraph of base pair Jaccard
+	agreement (TP/(TP+FP+FN)). Overlapping windows are written to the
+	bedGraph as their first step bases so intervals do not overlap.
+
+	# Parameters
+	GI (gff3_interval): Control and treatment annotations
+	size (int): Window size
+	step (int): Distance between window starts [size]
+	temd (bool): Include TE order and superfamily categories
+	prefix (str): Output prefix of [prefix]_[category]_[feature]_[sample].(tsv|bedgraph),
+		where the category is element, order, or sufam
+	chroms (list): Chromosomes to analyze [all shared]
+
+	# Returns
+	list: Written files
+	'''
+	start = time()
+	step = step if step else size
+	chroms = chroms if chroms else sorted(GI.get_chrom_set())
+	samples = GI.gff3_names[1:]
+	files = []
+	for col, elem_list in summaries._category_list(GI, temd):
+		for elem in sorted(elem_list):
+			eid = elem_list[elem]
+			base = ["%s_%s_%s_%s"%(prefix, TRACK_CATEGORIES[col], track_name(elem), track_name(n)) for n in samples]
+			paths = [(b+".tsv", b+".bedgraph") for b in base]
+			handles = [(open(t, 'w'), open(b, 'w')) for t, b in paths]
+			try:
+				for (TSV, BG), name in zip(handles, samples):
+					TSV.write('\t'.join(("chrom", "start", "end")+COUNTS+("sensitivity", "specificity", "precision", "jaccard"))+'\n')
+					BG.write('track type=bedGraph name="%s %s"\n'%(name, elem))
+				for chrom in chroms:
+					length = GI._get_max(chrom)
+					PC = prefix_counts(GI.elem_intervals(chrom, eid, col), length)
+					starts, ends = window_edges(length, size, step)
+					tp, fp, tn, fn = PC.window_counts(starts, ends)
+					stats = [_ratio(tp, fn), _ratio(tn, fp), _ratio(tp, fp), _ratio(tp, fp+fn)]
+					bg_ends = np.minimum(starts+min(step, size), ends)
+					for i, (TSV, BG) in enumerate(handles):
+						# Column 0 is the control
+						for w in range(len(starts)):
+							vals = [tp[w,i+1], fp[w,i+1], tn[w,i+1], fn[w,i+1]]+["%.4f"%(a[w,i+1]) for a in stats]
+							TSV.write('\t'.join(map(str, [chrom, starts[w], ends[w]]+vals))+'\n')
+							if not np.isnan(stats[3][w,i+1]):
+								BG.write("%s\t%i\t%i\t%.4f\n"%(chrom, starts[w], bg_ends[w], stats[3][w,i+1]))
+			finally:
+				for TSV, BG in handles:
+					TSV.close()
+					BG.close()
+			for t, b in paths:
+				files += [t, b]
+	logger.debug("Wrote %i window tracks in %.3f seconds"%(len(files), time()-start))
+	return files
+
+if __name__ == "__main__":
+	import doctest
+	doctest.testmod()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-import unittest, sys, os, logging
+import unittest, sys, os, logging, argparse, itertools
 from operator import itemgetter
 from glob import glob
 from time import time
@@ -21,7 +21,7 @@ logging.basicConfig(stream=logStream, level=logging.INFO, format=FORMAT)
 import numpy as np
 from quicksect import Interval
 import differannotate
-from differannotate import reader, comparisons, summaries, datastructures
+from differannotate import reader, comparisons, summaries, datastructures, server, refstore, allvsall, transcripts, planner, store, export, sampling, windows, shared, batch, api, bootstrap, matching
 
 class TestReader(unittest.TestCase):
 	def setUp(self):
@@ -103,6 +103,58 @@ class TestReader(unittest.TestCase):
 		ret = map(datastructures.interval2tuple, IIT.iifilter(1, 2, strand=1))
 		self.assertEqual(len(ret), 1)
 		self.assertEqual(ret[0], (10, 20, 1, 2, 1))
+	def test_interval_index(self):
+		IIT = datastructures.iterit()
+		IIT.add(0, 10, (0, 0))
+		IIT.add(5, 15, (1, 1))
+		IIT.add(10, 20, (1, 2, 1, 3))
+		II = IIT.to_index()
+		self.assertTrue(II is IIT.to_index())
+		self.assertEqual(list(II.order), [-1, -1, 1])
+		qidx, hidx = II.query([6, 10, 20, 0], [7, 11, 30, 100])
+		pairs = sorted(zip(qidx, II.starts[hidx]))
+		self.assertEqual(pairs, [(0,0), (0,5), (1,5), (1,10), (3,0), (3,5), (3,10)])
+		self.assertEqual(list(II.select(1, 1)), [1])
+		self.assertEqual(II.to_set(2, 1, strand='-'), set([(10, 20, 1, 2, 1, 3)]))
+		self.assertEqual(II.to_set(2, 1, strand=0), set())
+		IIT.add(30, 40, (0, 0))
+		self.assertEqual(len(IIT.to_index()), 4)
+		self.assertEqual(IIT.to_set(0, 1), set([(0, 10, 0, 0), (30, 40, 0, 0)]))
+	def test_columns_index(self):
+		GI = reader.gff3_interval(self.gff3_1)
+		for name in GI.gff3_names:
+			for tree in GI.gff3_trees[name].values():
+				II, built = tree.to_index(), datastructures.interval_index.from_iterit(tree)
+				for attr in ('starts', 'ends', 'strand', 'element', 'order', 'sufam'):
+					self.assertEqual(sorted(zip(II.starts, II.ends, getattr(II, attr))), \
+						sorted(zip(built.starts, built.ends, getattr(built, attr))))
+				for eid in GI.element_dict.values():
+					self.assertEqual(II.to_set(eid, 1), set(map(datastructures.interval2tuple, tree.iifilter(eid, 1))))
+	def test_spanning_index(self):
+		# One chromosome-spanning region before 20k genes
+		n = 20000
+		starts = np.concatenate([[0], np.arange(n)*100+50])
+		ends = np.concatenate([[n*100+100], np.arange(n)*100+60])
+		II = datastructures.interval_index(starts, ends, np.zeros(n+1), np.arange(n+1) > 0)
+		qidx, hidx = II.query(starts[1:], ends[1:])
+		self.assertEqual(len(qidx), 2*n)
+		self.assertEqual(list(qidx[:4]), [0, 0, 1, 1])
+		self.assertEqual(list(II.starts[hidx[:4]]), [0, 50, 0, 150])
+		qidx, hidx = II.query([55, n*100+90], [56, n*100+95])
+		self.assertEqual(list(zip(qidx, II.starts[hidx])), [(0, 0), (0, 50), (1, 0)])
+	def test_length_sketch(self):
+		LS = datastructures.length_sketch()
+		lengths = np.arange(1, 10001)
+		for chunk in np.array_split(lengths, 7):
+			part = datastructures.length_sketch()
+			part.add(chunk)
+			LS.merge(part)
+		self.assertEqual((LS.count, LS.min, LS.max, LS.sum), (10000, 1, 10000, lengths.sum()))
+		for q in (0.1, 0.25, 0.5, 0.75, 0.9):
+			exact = np.percentile(lengths, q*100)
+			self.assertTrue(abs(LS.quantile(q)-exact) <= exact*LS.alpha*1.01)
+		self.assertEqual(LS.histogram()[2].sum(), 10000)
+		self.assertTrue(np.isnan(datastructures.length_sketch().quantile(0.5)))
 	def test_tuple_size(self):
 		self.assertEqual(reader._tuple_size((0, 10, 0, 0)), 10)
 		self.assertEqual(reader._tuple_size((5, 15, 1, 1)), 10)
@@ -149,6 +201,8 @@ class TestReader(unittest.TestCase):
 		GI = reader.gff3_interval(self.gff3_1)
 		self._test_elem_sets(GI)
 		self.assertEqual(GI.gff3_names, ['control'])
+		self.assertEqual(GI.gff3_files.keys(), ['control'])
+		self.assertEqual(len(GI.element_dict), len(reader.gff3_interval(self.gff3_1).element_dict))
 		for chrom in ('Chr1','Chr2'):
 			self.assertEqual(GI._get_max(chrom), self.gff3_max[chrom])
 		# Check sums
@@ -161,6 +215,8 @@ class TestReader(unittest.TestCase):
 		GI = reader.gff3_interval(self.gff3_1, fasta=self.fa)
 		self._test_elem_sets(GI)
 		self.assertEqual(GI.gff3_names, ['control'])
+		self.assertEqual(GI.gff3_files.keys(), ['control'])
+		self.assertEqual(len(GI.element_dict), len(reader.gff3_interval(self.gff3_1).element_dict))
 		for chrom in ('Chr1','Chr2'):
 			self.assertEqual(GI._get_max(chrom), self.fa_max[chrom])
 		# Check sums
@@ -253,6 +309,142 @@ class TestReader(unittest.TestCase):
 		fa, ra = GI.elem_array(chrom, GI.element_dict[elem], col, True)
 		self.assertFalse(da)
 		return fa, ra, ba
+	def test_filters(self):
+		full = reader.gff3_interval(self.gff3_1, fasta=self.fa)
+		GI = reader.gff3_interval(self.gff3_1, fasta=self.fa, features=['Transposable_Element', 'transposon_fragment'])
+		self.assertEqual(sorted(GI.element_dict.keys()), ['transposable_element', 'transposon_fragment'])
+		self.assertEqual(sorted(GI.order_dict.keys()), sorted(full.order_dict.keys()))
+		for elem in GI.element_dict.keys():
+			for a, b in zip(self._gen_arrays(GI, 'Chr1', elem, 1), self._gen_arrays(full, 'Chr1', elem, 1)):
+				self.assertTrue(np.array_equal(a, b))
+		GI = reader.gff3_interval(self.gff3_1, exclude_features=['exon', 'CDS'], chroms=['Chr2'])
+		self.assertEqual(sorted(GI.gff3_trees['control'].keys()), ['Chr2'])
+		self.assertEqual(list(GI.element_dict.keys()), ['gene'])
+	def test_concurrent(self):
+		files = [(self.gff3_1, 'treat1'), (self.gff3_2, 'treat2'), (self.gff3_1, 'treat3')]
+		kwargs = {'chains':True, 'digests':True, 'offsets':True}
+		serial = reader.gff3_interval(self.gff3_2, **kwargs)
+		for f, n in files:
+			serial.add_gff3(f, n)
+		GI = reader.gff3_interval(self.gff3_2, treatments=files, procs=3, **kwargs)
+		self.assertEqual(GI.gff3_names, serial.gff3_names)
+		for attr in ('element_dict', 'order_dict', 'sufam_dict', 'gff3_digests', 'gff3_offsets'):
+			self.assertEqual(getattr(GI, attr), getattr(serial, attr))
+		for name in GI.gff3_names:
+			self.assertEqual(sorted(GI.gff3_trees[name]), sorted(serial.gff3_trees[name]))
+			for chrom, tree in GI.gff3_trees[name].items():
+				self.assertEqual(sorted(map(datastructures.interval2tuple, tree.iterintervals())), \
+					sorted(map(datastructures.interval2tuple, serial.gff3_trees[name][chrom].iterintervals())))
+			self.assertEqual(GI.gff3_chains[name].chains, serial.gff3_chains[name].chains)
+		cols = reader.parse_gff3(self.gff3_1, GI._parse_settings())
+		self.assertEqual(len(cols), sum([len(t.to_index()) for t in GI.gff3_trees['treat1'].values()]))
+		self.assertEqual(cols.columns['order'].max(), len(cols.orders)-1)
+	def test_malformed(self):
+		import tempfile
+		tmpdir = tempfile.mkdtemp()
+		bad = os.path.join(tmpdir, 'bad.gff3')
+		with open(self.gff3_1) as IF, open(bad, 'w') as OF:
+			OF.write(IF.read()+'Chr1\ttest\tgene\t1\n')
+		try:
+			# Workers report the line instead of exiting and hanging the pool
+			with self.assertRaises(ValueError) as cm:
+				reader.gff3_interval(self.gff3_2, treatments=[(bad, 'bad')], procs=2)
+			self.assertTrue(bad in str(cm.exception))
+			self.assertTrue('byte %i'%(os.path.getsize(self.gff3_1)) in str(cm.exception))
+		finally:
+			rmtree(tmpdir)
+	def test_byte_ranges(self):
+		ranges = reader.byte_ranges(self.gff3_1, 200)
+		self.assertTrue(len(ranges) > 5)
+		self.assertEqual((ranges[0][0], ranges[-1][1]), (0, os.path.getsize(self.gff3_1)))
+		with open(self.gff3_1) as IF:
+			text = IF.read()
+		for (s1, e1), (s2, e2) in zip(ranges[:-1], ranges[1:]):
+			self.assertEqual(e1, s2)
+			self.assertEqual(text[s2-1], '\n')
+		kwargs = {'chains':True, 'digests':True, 'offsets':True}
+		serial = reader.gff3_interval(self.gff3_1, treatments=[(self.gff3_2, 'treat')], **kwargs)
+		with patch('differannotate.reader.RANGE_BYTES', 200):
+			GI = reader.gff3_interval(self.gff3_1, treatments=[(self.gff3_2, 'treat')], procs=3, **kwargs)
+			digests = reader.gff3_interval(self.gff3_1, digests=True).gff3_digests
+		for attr in ('element_dict', 'order_dict', 'sufam_dict', 'gff3_offsets'):
+			self.assertEqual(getattr(GI, attr), getattr(serial, attr))
+		for name in GI.gff3_names:
+			for chrom, tree in GI.gff3_trees[name].items():
+				self.assertEqual(sorted(map(datastructures.interval2tuple, tree.iterintervals())), \
+					sorted(map(datastructures.interval2tuple, serial.gff3_trees[name][chrom].iterintervals())))
+			self.assertEqual(GI.gff3_chains[name].chains, serial.gff3_chains[name].chains)
+			self.assertEqual(GI.gff3_chains[name].ids, serial.gff3_chains[name].ids)
+		# Chained digests only depend on the ranges
+		self.assertEqual(GI.gff3_digests['control'], digests['control'])
+		self.assertNotEqual(GI.gff3_digests['control']['Chr1'], serial.gff3_digests['control']['Chr1'])
+		self.assertEqual(GI.gff3_digests['control']['Chr2'], serial.gff3_digests['control']['Chr2'])
+	def test_malformed_range(self):
+		import tempfile
+		tmpdir = tempfile.mkdtemp()
+		bad = os.path.join(tmpdir, 'bad.gff3')
+		with open(self.gff3_1) as IF:
+			lines = IF.readlines()
+		half = len(lines)//2
+		offset = len(''.join(lines[:half]))
+		with open(bad, 'w') as OF:
+			OF.write(''.join(lines[:half])+'Chr1\ttest\tgene\tone\t10\t.\t+\t.\tID=x\n'+''.join(lines[half:]))
+		try:
+			with patch('differannotate.reader.RANGE_BYTES', 200):
+				self.assertTrue(len(reader.byte_ranges(bad)) > 2)
+				# Offsets are from the start of the file, not of the range
+				with self.assertRaises(ValueError) as cm:
+					reader.gff3_interval(bad, procs=3)
+			self.assertTrue('%s at byte %i:'%(bad, offset) in str(cm.exception))
+		finally:
+			rmtree(tmpdir)
+	def test_fetch(self):
+		GI = reader.gff3_interval(self.gff3_1)
+		GI.add_gff3(self.gff3_2, 'treat')
+		channels = GI.channel_names()
+		A = GI.fetch('Chr1', 95, 105)
+		self.assertEqual(A.shape, (10, len(channels)))
+		for elem in ('gene', 'lnc_rna', 'exon'):
+			self.assertEqual(list(A[:,channels.index('element:'+elem)]), [0]*5+[1]*5)
+		self.assertEqual(A.sum(), 15)
+		windows = [('Chr1', 230, 250), ('Chr2', 0, 20), ('Chr1', 1390, 1410), ('Chr3', 0, 20)]
+		ret = GI.fetch_batch(windows)
+		self.assertEqual(ret['control'].shape, (4, 20, len(channels)))
+		te = ret['control'][0]
+		for c in ('element:transposable_element', 'element:transposon_fragment', 'order:LTR', 'superfamily:Copia'):
+			self.assertEqual(te[:,channels.index(c)].sum(), 10)
+		self.assertEqual(ret['control'][1,:,channels.index('element:exon')].sum(), 11)
+		self.assertEqual(ret['treat'][1].sum(), 0)
+		self.assertEqual(ret['treat'][2,:,channels.index('element:gene')].sum(), 12)
+		self.assertEqual(ret['control'][3].sum(), 0)
+		# Sparse runs and uneven windows match the dense matrices
+		w, ch, s, e = GI.fetch_batch(windows, ['control'], sparse=True)['control']
+		dense = np.zeros(ret['control'].shape, dtype=np.uint8)
+		for i in range(len(w)):
+			dense[w[i], s[i]:e[i], ch[i]] = 1
+		self.assertTrue(np.array_equal(dense, ret['control']))
+		uneven = GI.fetch_batch([('Chr1', 230, 250), ('Chr1', 95, 105)], ['control'])['control']
+		self.assertTrue(np.array_equal(uneven[0], te))
+		self.assertTrue(np.array_equal(uneven[1], A))
+	def test_fetch_spanning(self):
+		import tempfile
+		tmpdir = tempfile.mkdtemp()
+		path = os.path.join(tmpdir, 'spanning.gff3')
+		n = 20000
+		with open(path, 'w') as OF:
+			OF.write('Chr1\ttest\tregion\t1\t%i\t.\t+\t.\tID=chr\n'%(n*100))
+			for i in range(n):
+				OF.write('Chr1\ttest\tgene\t%i\t%i\t.\t+\t.\tID=g%i\n'%(i*100+51, i*100+60, i))
+		GI = reader.gff3_interval(path)
+		rmtree(tmpdir)
+		channels = GI.channel_names()
+		windows = [('Chr1', i*100, i*100+100) for i in range(n)]
+		w, ch, s, e = GI.fetch_batch(windows, sparse=True)['control']
+		self.assertEqual(len(w), 2*n)
+		region, gene = channels.index('element:region'), channels.index('element:gene')
+		self.assertEqual(sorted(zip(ch[w == 7], s[w == 7], e[w == 7])), [(region, 0, 100), (gene, 50, 60)])
+		A = GI.fetch_batch(windows[:100])['control']
+		self.assertEqual((A[:,:,region].sum(), A[:,:,gene].sum()), (100*100, 100*10))
 	def test_gff3_12_get_chrom_set(self):
 		GI = reader.gff3_interval(self.gff3_1)
 		self.assertEqual(GI.get_chrom_set(), set(('Chr1','Chr2')))
@@ -289,6 +481,61 @@ class TestComparisons(unittest.TestCase):
 	def test_precision(self):
 		self.assertTrue(np.array_equal(comparisons.precision(self.A), \
 			[2.0/(2+0), 2.0/(2+2), 1.0/(1+1)]))
+	def test_overlap_kernels(self):
+		rng = np.random.RandomState(1)
+		a_s = rng.randint(0, 100, 500); a_e = a_s+rng.randint(1, 100, 500)
+		b_s = rng.randint(0, 100, 500); b_e = b_s+rng.randint(1, 100, 500)
+		for p in (1, 50, 57, 90, 100):
+			R = comparisons.overlap_r_mask(a_s, a_e, b_s, b_e, p)
+			O = comparisons.overlap_mask(a_s, a_e, b_s, b_e, p)
+			for i in range(len(a_s)):
+				A, B = (a_s[i], a_e[i]), (b_s[i], b_e[i])
+				self.assertEqual(R[i], comparisons._overlap_r_tup(A, B, p))
+				self.assertEqual(O[i], comparisons._overlap_tup(A, B, p) and comparisons._overlap_b(A, B) > 0)
+		self.assertEqual(list(comparisons.overlap_bases(*map(np.array, zip(*[(0,10,5,15), (0,10,10,15)])))), [5, 0])
+		# 57 of 100 bases is 56.99999999999999 percent with floats
+		self.assertTrue(comparisons._overlap_r_tup((0, 100), (43, 143), 57))
+		A = [(0, 10, 0, 1), (50, 60, 0, 1)]
+		B = [(55, 60, 0, 1), (1, 10, 0, 1), (0, 11, 0, 1)]
+		self.assertEqual([list(a) for a in comparisons.overlap_r_pairs(A, B, 90)], [[0, 0], [2, 1]])
+	def test_match_criterion(self):
+		rng = np.random.RandomState(2)
+		a_s = rng.randint(0, 300, 200); a_e = a_s+rng.randint(1, 40, 200)
+		b_s = rng.randint(0, 300, 200); b_e = b_s+rng.randint(1, 40, 200)
+		A, B = list(zip(a_s, a_e)), list(zip(b_s, b_e))
+		for MC in (comparisons.match_criterion(80), comparisons.match_criterion(80, 5), \
+				comparisons.match_criterion(80, 5, 'both'), comparisons.match_criterion(50, 0, 'tolerance')):
+			brute = set([(i, j) for i in range(len(A)) for j in range(len(B)) \
+				if MC.mask([A[i][0]], [A[i][1]], [B[j][0]], [B[j][1]])[0]])
+			self.assertEqual(set(zip(*comparisons.overlap_r_pairs(A, B, MC))), brute)
+		# Short features that do not overlap still match by boundaries
+		MC = comparisons.match_criterion(90, 10)
+		self.assertEqual([list(a) for a in comparisons.overlap_r_pairs([(0, 5)], [(8, 13)], MC)], [[0], [0]])
+		self.assertEqual(comparisons.match_criterion(90, 10, 'both').key(), [90, 10, 'both'])
+		for args in ((90, None, 'tolerance'), (90, -1, 'both'), (90, 10, 'either')):
+			with self.assertRaises(ValueError):
+				comparisons.match_criterion(*args)
+		GI = reader.gff3_interval(self.gff3_1, treatments=[(self.gff3_2, 'treat')])
+		exact = summaries.region_metrics(GI, 100, temd=True)
+		for MC in (comparisons.match_criterion(90, 0), comparisons.match_criterion(100, 0, 'both')):
+			ret = summaries.region_metrics(GI, MC, temd=True)
+			for k in ('tp', 'fp', 'fn'):
+				self.assertTrue(np.array_equal(ret[k], exact[k]))
+	def test_membership_histogram(self):
+		for n in (1, 3, 17, 64):
+			A = np.random.RandomState(n).randint(0, 2, (n, 500)).astype(bool)
+			A[1:,:50] = A[0,:50]
+			codes, counts = comparisons.membership_histogram(A)
+			self.assertEqual(counts.sum(), 500)
+			self.assertEqual(len(set(codes.tolist())), len(codes))
+			stats = comparisons.histogram_stats(codes, counts, n)
+			for v, func in zip(stats, (comparisons.tp, comparisons.fp, comparisons.tn, comparisons.fn)):
+				self.assertTrue(np.array_equal(v, func(A)))
+		codes, counts = comparisons.membership_histogram(self.A)
+		# (Abc, aBc, ABc, abC, AbC, aBC, ABC)
+		self.assertEqual(comparisons.venn_subsets(codes, counts, 3), (0,1,1,0,0,1,1))
+		with self.assertRaises(ValueError):
+			comparisons.membership_codes(np.zeros((65, 2)))
 	def test_overlap_b(self):
 		self.assertEqual(comparisons._overlap_b(*self.i5), 5)
 		self.assertEqual(comparisons._overlap_b(*self.i0), 0)
@@ -324,6 +571,38 @@ class TestSummaries(unittest.TestCase):
 		self.fai = os.path.join(tpath, 'test.fa.fai')
 		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
 		self.gff3_2 = os.path.join(tpath, 'test_2.gff3')
+	def test_plot_region_3_temd(self):
+		GI = reader.gff3_interval(self.gff3_1, treatments=[(self.gff3_2, 'treat1'), (self.gff3_2, 'treat2')])
+		result = summaries.region_metrics(GI, 90, temd=True)
+		elements = dict(GI.element_dict)
+		cwd = os.getcwd()
+		import tempfile
+		tmpdir = tempfile.mkdtemp()
+		os.chdir(tmpdir)
+		try:
+			with patch('differannotate.summaries.matplotlib_venn') as venn:
+				figures = summaries.plot_region(GI, result, 90, 'png')
+		finally:
+			os.chdir(cwd)
+			rmtree(tmpdir)
+		self.assertEqual(dict(GI.element_dict), elements)
+		self.assertTrue('region_Chr1_B_LTR.png' in figures)
+		subsets = [c[1]['subsets'] for c in venn.venn3.call_args_list]
+		self.assertEqual(len(subsets), len([f for f in figures if f.startswith('region_')]))
+		self.assertTrue(all([sum(s) > 0 for s in subsets]))
+		self.assertEqual(GI.calc_intersect_3('Chr1', 'control', 'treat1', 'treat2', GI.order_dict['LTR'], 2, 90)[-1], \
+			result.get(('Chr1', '+/-', 'TE_Order', 'LTR'), 'treat1', 'tp'))
+	def test_empty_filters(self):
+		for extra in (['--features', 'nosuchtype'], ['--chroms', 'ChrX']):
+			testArgs = ['differannotate', '-C', self.gff3_1, '-T', self.gff3_2, '-N', 'treat']+extra
+			with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO):
+				with self.assertRaises(ValueError):
+					differannotate.main()
+			self.assertTrue('No features shared by every annotation pass %s %s'%tuple(extra) in logStream.getvalue())
+		GI = reader.gff3_interval(self.gff3_1, features=['nosuchtype'])
+		with patch('sys.stdout', new_callable=StringIO) as out:
+			summaries.tabular_region(GI, fig_ext=False)
+		self.assertEqual(out.getvalue(), '')
 	def test_gff3_12_tabular(self):
 		GI = reader.gff3_interval(self.gff3_1)
 		GI.add_gff3(self.gff3_2, 'treat')
@@ -366,6 +645,775 @@ class TestSummaries(unittest.TestCase):
 		self.assertFalse(glob('region*png'))
 		self.assertFalse(glob('length_bp*png'))
 		self.assertFalse(glob('proportion*png'))
+class TestServer(unittest.TestCase):
+	def setUp(self):
+		tpath = os.path.dirname(__file__)
+		self.fa = os.path.join(tpath, 'test.fa')
+		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
+		self.gff3_2 = os.path.join(tpath, 'test_2.gff3')
+		self.socket = 'test_server.sock'
+	def tearDown(self):
+		logStream.truncate(0)
+		if os.path.exists(self.socket): os.remove(self.socket)
+	def _gene_record(self, records, strand, sample):
+		for rec in records:
+			if (rec['chrom'], rec['strand'], rec['feature'], rec['sample']) == ('Chr1', strand, 'gene', sample):
+				return rec
+	def test_lru_eviction(self):
+		cache = server.annotation_cache(max_resident=1)
+		first = cache.get(self.gff3_1)
+		self.assertTrue(first is cache.get(self.gff3_1))
+		cache.get(self.gff3_2)
+		self.assertEqual(cache.resident(), [os.path.abspath(self.gff3_2)])
+		self.assertFalse(first is cache.get(self.gff3_1))
+	def test_service(self):
+		service = server.comparison_service(server.annotation_cache(fasta=self.fa))
+		request = {'control':self.gff3_1, 'treat':[self.gff3_2], 'names':['treat'], 'percent':99, 'base':True}
+		for i in range(2):
+			ret = service.handle(request)
+			self.assertEqual(ret['status'], 'ok')
+			rec = self._gene_record(ret['region'], '+/-', 'treat')
+			self.assertEqual((rec['tp'], rec['fp'], rec['fn']), (1,1,1))
+			rec = self._gene_record(ret['base'], '+/-', 'treat')
+			self.assertEqual((rec['tp'], rec['fp'], rec['fn']), (198,2,2))
+		self.assertEqual(service.handle({'control':self.gff3_1, 'treat':['missing.gff3']})['status'], 'error')
+	def test_isolated_requests(self):
+		import tempfile
+		tmpdir = tempfile.mkdtemp()
+		weird = os.path.join(tmpdir, 'weird.gff3')
+		with open(weird, 'w') as OF:
+			OF.write('Chr1\ttest\tweird_thing\t1\t100\t.\t+\t.\tID=w1\n')
+		cache = server.annotation_cache()
+		service = server.comparison_service(cache)
+		request = {'control':self.gff3_1, 'treat':[self.gff3_2], 'names':['treat'], 'percent':99}
+		first = service.handle(request)
+		elements = dict(cache.get(self.gff3_1).GI.element_dict)
+		self.assertEqual(service.handle({'control':self.gff3_1, 'treat':[weird], 'names':['weird']})['status'], 'ok')
+		rmtree(tmpdir)
+		self.assertEqual(service.handle(request)['region'], first['region'])
+		self.assertEqual(dict(cache.get(self.gff3_1).GI.element_dict), elements)
+		self.assertFalse('weird_thing' in set([rec['feature'] for rec in first['region']]))
+	def test_unix_socket(self):
+		import socket, threading, json
+		service = server.comparison_service(server.annotation_cache())
+		srv = server.make_server(service, socket_path=self.socket)
+		thread = threading.Thread(target=srv.serve_forever)
+		thread.daemon = True
+		thread.start()
+		try:
+			client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			client.connect(self.socket)
+			request = {'control':self.gff3_1, 'treat':[self.gff3_2], 'names':['treat'], 'percent':99}
+			client.sendall((json.dumps(request)+'\n').encode('utf-8'))
+			ret = json.loads(client.makefile('rb').readline().decode('utf-8'))
+			client.close()
+		finally:
+			srv.shutdown()
+			srv.server_close()
+		self.assertEqual(ret['status'], 'ok')
+		rec = self._gene_record(ret['region'], '+', 'treat')
+		self.assertEqual((rec['tp'], rec['fp'], rec['fn']), (1,0,0))
+class TestAPI(unittest.TestCase):
+	def setUp(self):
+		tpath = os.path.dirname(__file__)
+		self.fa = os.path.join(tpath, 'test.fa')
+		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
+		self.gff3_2 = os.path.join(tpath, 'test_2.gff3')
+	def test_compare(self):
+		with patch('sys.stdout', new_callable=StringIO) as out:
+			ret = differannotate.compare(self.gff3_1, [self.gff3_2], ['treat'], \
+				reference=self.fa, p=99, match_sets=True)
+		self.assertEqual(out.getvalue(), '')
+		self.assertFalse(ret.figures)
+		self.assertEqual(ret.samples, ['control', 'treat'])
+		key = ('Chr1', '+/-', 'Element', 'gene')
+		i = ret.region.row(key)
+		self.assertEqual(tuple(ret.region['tp'][i]), (2,1))
+		self.assertEqual(tuple(ret.region['fn'][i]), (0,1))
+		self.assertTrue(np.array_equal(ret.region.sensitivity[i], [1.0, 0.5]))
+		self.assertEqual(list(map(len, ret.region.matches[(key, 'treat')])), [1,1,1])
+		sketch = ret.region.lengths[(key, 'treat')]
+		self.assertEqual((sketch.count, sketch.min, sketch.max), (2, 100, 100))
+		self.assertEqual(ret.region.merged_lengths('+/-', 'Element', 'gene', 'treat').count, 2)
+		self.assertEqual(ret.base.get(key, 'treat', 'tp'), 198)
+		self.assertEqual(ret.base.venn_subsets(key), (2,2,198))
+	def test_compare_gi(self):
+		GI = reader.gff3_interval(self.gff3_1)
+		ret = differannotate.compare(GI, [self.gff3_2], ['treat'], p=99, temd=True)
+		self.assertEqual(GI.gff3_names, ['control'])
+		self.assertEqual(GI.gff3_files.keys(), ['control'])
+		self.assertEqual(len(GI.element_dict), len(reader.gff3_interval(self.gff3_1).element_dict))
+		self.assertTrue(ret.base is None)
+		self.assertEqual(ret.region.get(('Chr1','+','TE_Order','LTR'), 'treat', 'tp'), 0)
+		with self.assertRaises(ValueError):
+			differannotate.compare(GI, [self.gff3_2], ['control'])
+class TestStartup(unittest.TestCase):
+	def test_lazy_imports(self):
+		import subprocess
+		code = "import sys\nsys.argv=['differannotate','--help']\nimport differannotate\n"+\
+			"try: differannotate.main()\nexcept SystemExit: pass\n"+\
+			"sys.stderr.write(str([m for m in ('matplotlib','matplotlib_venn','pysam') if m in sys.modules]))"
+		env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+		p = subprocess.Popen([sys.executable, '-c', code], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		out, err = p.communicate()
+		self.assertTrue(b'usage' in out)
+		self.assertEqual(err.decode('utf-8').strip().split('\n')[-1], '[]')
+	def test_lazy_module(self):
+		from differannotate.lazy import lazy_module
+		LM = lazy_module('json')
+		self.assertFalse(LM.loaded)
+		self.assertEqual(LM.dumps([1]), '[1]')
+		self.assertTrue(LM.loaded)
+class TestRefstore(unittest.TestCase):
+	def setUp(self):
+		import tempfile
+		tpath = os.path.dirname(__file__)
+		self.fa = os.path.join(tpath, 'test.fa')
+		self.tmpdir = tempfile.mkdtemp()
+		self.seqs = {'c1':'ACGTNNacgtnNAGGTTTCCANNNNNNNNNNNG', 'c2':'NNNTT', 'c3':'GATTACA'}
+		self.tmp_fa = os.path.join(self.tmpdir, 'tmp.fa')
+		with open(self.tmp_fa, 'w') as OF:
+			for name in sorted(self.seqs):
+				OF.write('>%s description\n'%(name))
+				seq = self.seqs[name]
+				for i in range(0, len(seq), 7):
+					OF.write(seq[i:i+7]+'\n')
+	def tearDown(self):
+		rmtree(self.tmpdir)
+	def test_build_fetch(self):
+		ref = refstore.packed_reference(refstore.build(self.tmp_fa, chunk_size=5))
+		self.assertEqual(ref.references(), ['c1','c2','c3'])
+		for name, seq in self.seqs.items():
+			seq = seq.upper()
+			self.assertEqual(ref.lengths[name], len(seq))
+			for s in range(len(seq)):
+				for e in range(s+1, len(seq)+1):
+					self.assertEqual(ref.fetch(name, s, e), seq[s:e])
+		counts = ref.base_counts('c1', [0, 4], [8, 12])
+		self.assertEqual(counts.tolist(), [[2,1,1,2,2], [1,1,1,1,4]])
+		self.assertEqual(ref.proportions('c3', [0], [4]).tolist(), [[0.25],[0.5],[0.25],[0.0]])
+	def test_open_reference(self):
+		ref = refstore.open_reference(self.tmp_fa)
+		self.assertTrue(os.path.exists(self.tmp_fa+refstore.EXT))
+		self.assertEqual(refstore.open_reference(self.tmp_fa).header, ref.header)
+		GI = reader.gff3_interval(os.path.join(os.path.dirname(__file__), 'test_1.gff3'), fasta=self.fa)
+		self.assertTrue(isinstance(GI.FA, refstore.packed_reference))
+		FA = reader.pysam.FastaFile(self.fa)
+		for chrom in ('Chr1', 'Chr2'):
+			self.assertEqual(GI.FA.fetch(chrom, 0, GI.chrom_lens[chrom]), FA.fetch(chrom).upper())
+class TestAllVsAll(unittest.TestCase):
+	def setUp(self):
+		tpath = os.path.dirname(__file__)
+		self.fa = os.path.join(tpath, 'test.fa')
+		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
+		self.gff3_2 = os.path.join(tpath, 'test_2.gff3')
+	def test_pairwise(self):
+		GI = reader.gff3_interval(self.gff3_1, fasta=self.fa)
+		GI.add_gff3(self.gff3_2, 'treat1')
+		GI.add_gff3(self.gff3_2, 'treat2')
+		serial = allvsall.pairwise(GI, p=99)
+		ret = allvsall.pairwise(GI, p=99, procs=2)
+		self.assertEqual(sorted(serial.counts), sorted(ret.counts))
+		for key in ret.counts:
+			self.assertTrue(np.array_equal(serial.counts[key], ret.counts[key]))
+		key = ('region', '+/-', 'Element', 'gene')
+		self.assertEqual(ret.counts[key][0,1].tolist(), [1,1,1])
+		self.assertEqual(ret.counts[key][1,0].tolist(), [1,1,1])
+		J = ret.jaccard(key)
+		self.assertTrue(np.array_equal(J, J.T))
+		self.assertEqual(J[1,2], 1.0)
+		self.assertEqual(J[0,0], 1.0)
+		self.assertAlmostEqual(J[0,1], 1.0/3)
+		self.assertAlmostEqual(ret.f1(key)[0,1], 0.5)
+		base = ('base', '+/-', 'Element', 'gene')
+		self.assertEqual(ret.counts[base][0,2].tolist(), [2,2,198])
+		self.assertTrue(np.array_equal(ret.sensitivity(base), ret.precision(base).T))
+	def test_cli(self):
+		testArgs = ['differannotate', '-C', self.gff3_1, '-T', self.gff3_2, self.gff3_2, \
+			'-N', 'treat1', 'treat2', '--all-vs-all', '--procs', '2', '--plot']
+		with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO) as out:
+			differannotate.main()
+		self.assertTrue('region Element gene jaccard' in out.getvalue())
+		with open('all_vs_all.tsv') as IF:
+			lines = IF.readlines()
+		keys = set([tuple(l.split('\t')[:4]) for l in lines[1:]])
+		self.assertEqual(len(lines), 1+9*len(keys))
+		os.remove('all_vs_all.tsv')
+		images = glob('allvsall_region_B_*_jaccard.png')
+		self.assertTrue('allvsall_region_B_gene_jaccard.png' in images)
+		for image in images: os.remove(image)
+class TestTranscripts(unittest.TestCase):
+	def setUp(self):
+		import tempfile
+		self.tmpdir = tempfile.mkdtemp()
+		control = [('gene',100,500,'+','ID=g1'), ('mRNA',100,500,'+','ID=t1;Parent=g1'), \
+			('exon',100,200,'+','Parent=t1'), ('exon',300,400,'+','Parent=t1'), ('exon',450,500,'+','Parent=t1'), \
+			('CDS',150,200,'+','Parent=t1'), ('CDS',300,400,'+','Parent=t1'), \
+			('mRNA',1000,1100,'-','ID=t2'), ('exon',1000,1100,'-','Parent=t2'), \
+			('mRNA',2000,2300,'+','ID=t3'), ('exon',2000,2100,'+','Parent=t3'), ('exon',2200,2300,'+','Parent=t3')]
+		treat = [('mRNA',90,520,'+','ID=x1'), ('exon',90,200,'+','Parent=x1'), \
+			('exon',300,400,'+','Parent=x1'), ('exon',450,520,'+','Parent=x1'), \
+			('CDS',150,200,'+','Parent=x1'), ('CDS',300,400,'+','Parent=x1'), \
+			('mRNA',1005,1100,'-','ID=x2'), ('exon',1005,1100,'-','Parent=x2'), \
+			('mRNA',2000,2300,'+','ID=x3'), ('exon',2000,2102,'+','Parent=x3'), ('exon',2201,2300,'+','Parent=x3'), \
+			('mRNA',5000,5100,'+','ID=x4'), ('exon',5000,5050,'+','Parent=x4'), ('exon',5080,5100,'+','Parent=x4')]
+		self.gff3_1 = os.path.join(self.tmpdir, 'control.gff3')
+		self.gff3_2 = os.path.join(self.tmpdir, 'treat.gff3')
+		for path, records in ((self.gff3_1, control), (self.gff3_2, treat)):
+			with open(path, 'w') as OF:
+				for r in records:
+					OF.write('Chr1\ttest\t%s\t%i\t%i\t.\t%s\t.\t%s\n'%r)
+	def tearDown(self):
+		rmtree(self.tmpdir)
+	def test_chains(self):
+		GI = reader.gff3_interval(self.gff3_1, chains=True)
+		TS = GI.gff3_chains['control']
+		self.assertEqual(len(TS), 3)
+		self.assertEqual(TS.ids['Chr1'], ['t1','t2','t3'])
+		self.assertEqual(TS.chains['exon']['Chr1'][0], (99,200,299,400,449,500))
+		self.assertEqual(TS.chains['intron']['Chr1'][0], (200,299,400,449))
+		self.assertEqual(TS.chains['intron']['Chr1'][1], ())
+		self.assertEqual(TS.chains['cds']['Chr1'][0], (149,200,299,400))
+		self.assertEqual(TS.lookup['intron'][('Chr1','+',(200,299,400,449))], [0])
+		self.assertEqual(reader.gff3_interval(self.gff3_1).gff3_chains, {})
+		# Chains are still built when exons are filtered from the interval trees
+		GI = reader.gff3_interval(self.gff3_1, chains=True, features=['gene'])
+		self.assertEqual(list(GI.element_dict.keys()), ['gene'])
+		self.assertEqual(GI.gff3_chains['control'].chains['exon'], TS.chains['exon'])
+	def test_match(self):
+		GI = reader.gff3_interval(self.gff3_1, chains=True)
+		GI.add_gff3(self.gff3_2, 'treat')
+		ref, query = GI.gff3_chains['control'], GI.gff3_chains['treat']
+		for level, tol, rh, qh in (('intron', 0, [1,1,0], [1,1,0,0]), ('intron', 2, [1,1,1], [1,1,1,0]), \
+				('exon', 0, [0,0,0], [0,0,0,0]), ('exon', 2, [0,0,1], [0,0,1,0]), \
+				('cds', 0, [1,0,0], [1,0,0,0])):
+			ref_hit, query_hit = transcripts.match_transcripts(ref, query, 'Chr1', level, tol, 90)
+			self.assertEqual(ref_hit.tolist(), list(map(bool, rh)))
+			self.assertEqual(query_hit.tolist(), list(map(bool, qh)))
+		ret = transcripts.transcript_metrics(GI, tol=2)
+		key = ('Chr1', '+/-', 'Transcript', 'intron')
+		self.assertEqual([ret.get(key, 'treat', n) for n in ret.count_names], [3,0,3,1])
+		self.assertEqual([ret.get(key, 'control', n) for n in ret.count_names], [3,0,3,0])
+		self.assertEqual(ret.get(('Chr1', '+/-', 'Transcript', 'cds'), 'treat', 'fp'), 0)
+	def test_cli(self):
+		testArgs = ['differannotate', '-C', self.gff3_1, '-T', self.gff3_2, '-N', 'treat', \
+			'--transcripts', '--chain-tolerance', '2']
+		with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO) as out:
+			differannotate.main()
+		lines = out.getvalue().split('\n')
+		self.assertTrue(lines.index('Chrom Chain  Sample  TP_REF     FN TP_QRY     FP   SENS   PREC') > 0)
+		self.assertTrue(any([l.split() == ['Chr1','intron','control','3','0','3','0','1.0','1.0'] for l in lines]))
+		self.assertTrue(any([l.split() == ['treat','3','0','3','1','1.0','0.75'] for l in lines]))
+class TestPlanner(unittest.TestCase):
+	def setUp(self):
+		tpath = os.path.dirname(__file__)
+		self.fa = os.path.join(tpath, 'test.fa')
+		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
+		self.gff3_2 = os.path.join(tpath, 'test_2.gff3')
+		self.GI = reader.gff3_interval(self.gff3_1, fasta=self.fa)
+		self.GI.add_gff3(self.gff3_2, 'treat')
+	def test_strategies(self):
+		dense = summaries.base_metrics(self.GI, temd=True)
+		for plan in (planner.execution_plan('tiled', tile=37), planner.execution_plan('intervals')):
+			ret = summaries.base_metrics(self.GI, temd=True, plan=plan)
+			self.assertEqual(ret.rows, dense.rows)
+			for n in ret.count_names:
+				self.assertTrue(np.array_equal(ret[n], dense[n]))
+			for key in dense.membership:
+				for a, b in zip(ret.membership[key], dense.membership[key]):
+					self.assertEqual(a.tolist(), b.tolist())
+	def test_plan(self):
+		length = max([self.GI._get_max(c) for c in self.GI.get_chrom_set()])
+		dense = planner.dense_bytes(length, 2)
+		self.assertEqual(planner.plan(self.GI).strategy, 'dense')
+		with patch('differannotate.planner.current_rss', return_value=0):
+			ret = planner.plan(self.GI, 4*dense, procs=8)
+			self.assertEqual((ret.strategy, ret.workers), ('dense', 4))
+			ret = planner.plan(self.GI, dense//2, min_tile=1)
+			self.assertEqual(ret.strategy, 'tiled')
+			self.assertEqual(ret.tile, length//2)
+			self.assertEqual(planner.plan(self.GI, dense//2).strategy, 'intervals')
+		ret = planner.plan(self.GI, 1, procs=4)
+		self.assertEqual((ret.strategy, ret.workers), ('intervals', 1))
+	def test_cli(self):
+		testArgs = ['differannotate', '-C', self.gff3_1, '-R', self.fa, '-T', self.gff3_2, '-N', 'treat', '--max-memory', '1K']
+		with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO) as out:
+			differannotate.main()
+		with patch('sys.argv', testArgs[:-2]), patch('sys.stdout', new_callable=StringIO) as dense_out:
+			differannotate.main()
+		self.assertEqual(out.getvalue(), dense_out.getvalue())
+		output = logStream.getvalue()
+		self.assertTrue('Planned execution_plan(intervals workers=1)' in output)
+		self.assertTrue('Peak RSS (MB)' in output)
+class TestStore(unittest.TestCase):
+	def setUp(self):
+		import tempfile
+		tpath = os.path.dirname(__file__)
+		self.fa = os.path.join(tpath, 'test.fa')
+		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
+		self.tmpdir = tempfile.mkdtemp()
+		self.store = os.path.join(self.tmpdir, 'store')
+		self.treat = os.path.join(self.tmpdir, 'treat.gff3')
+		with open(os.path.join(tpath, 'test_2.gff3')) as IF:
+			self.lines = IF.readlines()
+	def tearDown(self):
+		rmtree(self.tmpdir)
+	def _run(self, chr2_line, use_store=True):
+		with open(self.treat, 'w') as OF:
+			OF.writelines(self.lines+[chr2_line])
+		testArgs = ['differannotate', '-C', self.gff3_1, '-R', self.fa, '-T', self.treat, '-N', 'treat']
+		if use_store:
+			testArgs += ['--store', self.store]
+		logStream.truncate(0)
+		with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO) as out:
+			differannotate.main()
+		summary = [l for l in logStream.getvalue().split('\n') if 'stored units' in l]
+		return out.getvalue(), summary[-1] if summary else ''
+	def test_digests(self):
+		GI = reader.gff3_interval(self.gff3_1, digests=True)
+		self.assertEqual(sorted(GI.gff3_digests['control']), ['Chr1', 'Chr2'])
+		self.assertEqual(GI.view().gff3_digests, GI.gff3_digests)
+		self.assertEqual(reader.gff3_interval(self.gff3_1).gff3_digests, {})
+		self.assertRaises(ValueError, store.result_store, self.store, reader.gff3_interval(self.gff3_1))
+	def test_delta(self):
+		gene = 'Chr2\ttest\tgene\t%i\t15\t.\t+\t.\tID=g2\n'
+		out, summary = self._run(gene%(2))
+		self.assertTrue(summary.endswith('Reused 0 of 4 stored units. Recomputed chromosomes: Chr1, Chr2'))
+		rerun, summary = self._run(gene%(2))
+		self.assertEqual(rerun, out)
+		self.assertTrue(summary.endswith('Reused 4 of 4 stored units. Recomputed chromosomes: none'))
+		delta, summary = self._run(gene%(6))
+		self.assertTrue(summary.endswith('Reused 2 of 4 stored units. Recomputed chromosomes: Chr2'))
+		self.assertNotEqual(delta, out)
+		self.assertEqual(delta, self._run(gene%(6), False)[0])
+	def test_new_feature(self):
+		self._run('Chr2\ttest\tgene\t2\t15\t.\t+\t.\tID=g2\n')
+		# A feature type only on Chr2 keeps the stored Chr1 units
+		weird = 'Chr2\ttest\tweird_thing\t2\t15\t.\t+\t.\tID=w2\n'
+		out, summary = self._run(weird)
+		self.assertTrue(summary.endswith('Reused 2 of 4 stored units. Recomputed chromosomes: Chr2'))
+		self.assertTrue('weird_thing' in out)
+		self.assertEqual(out, self._run(weird, False)[0])
+	def test_checkpoint(self):
+		with open(self.treat, 'w') as OF:
+			OF.writelines(self.lines)
+		testArgs = ['differannotate', '-C', os.path.abspath(self.gff3_1), '-R', os.path.abspath(self.fa), \
+			'-T', self.treat, '-N', 'treat', '--temd', '--plot', '--checkpoint', self.store]
+		cwd = os.getcwd()
+		os.chdir(self.tmpdir)
+		try:
+			with patch('sys.argv', testArgs[:-2]), patch('sys.stdout', new_callable=StringIO) as full:
+				differannotate.main()
+			figures = sorted(glob('*.png'))
+			for f in figures:
+				os.remove(f)
+			# Interrupt the run after the first region unit
+			region_unit = summaries._region_unit
+			calls = []
+			def _interrupted(*args, **kwargs):
+				if calls:
+					raise KeyboardInterrupt
+				calls.append(args)
+				return region_unit(*args, **kwargs)
+			with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO), \
+					patch('differannotate.summaries._region_unit', side_effect=_interrupted):
+				self.assertRaises(KeyboardInterrupt, differannotate.main)
+			os.remove(figures[0])
+			logStream.truncate(0)
+			with patch('sys.argv', testArgs+['--resume']), patch('sys.stdout', new_callable=StringIO) as resumed, \
+					patch('differannotate.summaries._base_unit', side_effect=AssertionError), \
+					patch('differannotate.summaries._region_unit', side_effect=region_unit) as unit:
+				differannotate.main()
+			self.assertEqual(resumed.getvalue(), full.getvalue())
+			self.assertEqual(sorted(glob('*.png')), figures)
+			self.assertEqual(unit.call_count, 2)
+			self.assertTrue('Resumed 4 of 6 units' in logStream.getvalue())
+		finally:
+			os.chdir(cwd)
+		self.assertRaises(ValueError, self._resume_without_checkpoint)
+	def _resume_without_checkpoint(self):
+		testArgs = ['differannotate', '-C', self.gff3_1, '-T', self.treat, '-N', 'treat', '--resume']
+		with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO):
+			differannotate.main()
+class TestBatch(unittest.TestCase):
+	def setUp(self):
+		import tempfile
+		tpath = os.path.abspath(os.path.dirname(__file__))
+		self.fa = os.path.join(tpath, 'test.fa')
+		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
+		self.gff3_2 = os.path.join(tpath, 'test_2.gff3')
+		self.tmpdir = tempfile.mkdtemp()
+		self.jobs = os.path.join(self.tmpdir, 'jobs.json')
+		spec = {'reference':self.fa, 'defaults':{'percent':80}, 'jobs':[ \
+			{'name':'all', 'control':self.gff3_1, 'treat':[self.gff3_2], 'names':['treat']}, \
+			{'name':'genes', 'control':self.gff3_1, 'treat':[self.gff3_2, self.gff3_1], 'names':['t2', 't1'], \
+				'percent':50, 'features':['gene'], 'temd':True, 'output':os.path.join(self.tmpdir, 'genes')}]}
+		import json
+		with open(self.jobs, 'w') as OF:
+			json.dump(spec, OF)
+	def tearDown(self):
+		rmtree(self.tmpdir)
+	def _table(self, path):
+		with open(path) as IF:
+			return [l.rstrip('\n').split('\t') for l in IF]
+	def test_plan(self):
+		reference, jobs = batch.load_jobs(self.jobs)
+		self.assertEqual(reference, self.fa)
+		self.assertEqual([j['percent'] for j in jobs], [80, 50])
+		files, filters = batch.plan_annotations(jobs)
+		self.assertEqual(files, [self.gff3_1, self.gff3_2])
+		self.assertEqual(filters, {'features':None, 'exclude_features':None, 'chroms':None})
+		for j in jobs: j['features'] = ['gene', 'exon'] if j['features'] else ['CDS']
+		self.assertEqual(batch.plan_annotations(jobs)[1]['features'], ['CDS', 'exon', 'gene'])
+		yaml_jobs = os.path.join(self.tmpdir, 'jobs.yaml')
+		with open(yaml_jobs, 'w') as OF:
+			OF.write('- {control: a.gff3, treat: [b.gff3]}\n')
+		try:
+			import yaml
+			self.assertEqual(batch.load_jobs(yaml_jobs)[1][0]['names'], ['b'])
+		except ImportError:
+			self.assertRaises(ValueError, batch.load_jobs, yaml_jobs)
+	def test_run(self):
+		cwd = os.getcwd()
+		os.chdir(self.tmpdir)
+		try:
+			testArgs = ['differannotate', 'batch', self.jobs, '--procs', '2']
+			with patch('sys.argv', testArgs):
+				differannotate.main()
+		finally:
+			os.chdir(cwd)
+		for name in ('all', 'genes'):
+			self.assertEqual(sorted(os.listdir(os.path.join(self.tmpdir, name))), ['base.tsv', 'region.tsv'])
+		GI = reader.gff3_interval(self.gff3_1, fasta=self.fa, features=['gene'])
+		GI.add_gff3(self.gff3_2, 't2')
+		GI.add_gff3(self.gff3_1, 't1')
+		ret = api.compare(GI, p=50, temd=True)
+		region = self._table(os.path.join(self.tmpdir, 'genes', 'region.tsv'))
+		self.assertEqual(len(region), len(ret.region.rows)*3+1)
+		for row in region[1:]:
+			key, sample = tuple(row[:4]), row[4]
+			self.assertEqual([int(v) for v in row[5:8]], [ret.region.get(key, sample, n) for n in ('tp', 'fp', 'fn')])
+		self.assertEqual(set([r[3] for r in region[1:] if r[2] == 'Element']), set(['gene']))
+		base = self._table(os.path.join(self.tmpdir, 'genes', 'base.tsv'))
+		for row in base[1:]:
+			key, sample = tuple(row[:4]), row[4]
+			self.assertEqual([int(v) for v in row[5:9]], [ret.base.get(key, sample, n) for n in ('tp', 'fp', 'tn', 'fn')])
+class TestExport(unittest.TestCase):
+	def setUp(self):
+		import tempfile
+		tpath = os.path.dirname(__file__)
+		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
+		self.gff3_2 = os.path.join(tpath, 'test_2.gff3')
+		self.tmpdir = tempfile.mkdtemp()
+	def tearDown(self):
+		rmtree(self.tmpdir)
+	def test_offsets(self):
+		GI = reader.gff3_interval(self.gff3_1, offsets=True)
+		with open(self.gff3_1) as IF:
+			lines = [l for l in IF if l[0] != '#']
+		EX = export.feature_exporter(self.tmpdir, GI, 'gff3')
+		tuples = set(map(datastructures.interval2tuple, GI.gff3_trees['control']['Chr2'].iterintervals()))
+		self.assertEqual(sorted(EX.lines('control', 'Chr2', tuples)), sorted([l for l in lines if l.startswith('Chr2')]))
+		EX.close()
+		self.assertRaises(ValueError, export.feature_exporter, self.tmpdir, reader.gff3_interval(self.gff3_1))
+	def test_cli(self):
+		for fmt in export.FORMATS:
+			out_dir = os.path.join(self.tmpdir, fmt)
+			testArgs = ['differannotate', '-C', self.gff3_1, '-T', self.gff3_2, '-N', 'treat', '-p', '99', \
+				'--export-dir', out_dir, '--export-format', fmt]
+			with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO) as out:
+				differannotate.main()
+			GI = reader.gff3_interval(self.gff3_1)
+			GI.add_gff3(self.gff3_2, 'treat')
+			Ab, aB, AB = GI.calc_intersect_2('Chr1', 'control', 'treat', 'transposable_element', 1, 99)
+			records = {}
+			for cls in export.CLASSES:
+				with open(os.path.join(out_dir, 'treat', 'element_transposable_element_B_%s.%s'%(cls, fmt))) as IF:
+					records[cls] = [l.rstrip('\n').split('\t') for l in IF if l[0] != '#']
+			self.assertEqual([len(records[c]) for c in export.CLASSES], [AB, aB, Ab])
+			if fmt == 'bed':
+				self.assertEqual(records['tp'][0], ['Chr1', '550', '1050', 'AT1TE00025', '0', '+', \
+					'550', '1050', '0', '1', '500,', '0,', 'ID=AT1TE00025;Order=RC;Superfamily=Helitron;LEN=500'])
+				starts = [int(r[1]) for r in records['fn']]
+			else:
+				starts = [int(r[3]) for r in records['fn']]
+			self.assertEqual(starts, sorted(starts))
+	def test_shared_names(self):
+		# An element, TE order, and TE superfamily all named gene
+		control = os.path.join(self.tmpdir, 'control.gff3')
+		with open(self.gff3_1) as IF, open(control, 'w') as OF:
+			OF.write(IF.read()+'Chr1\ttest\ttransposable_element\t2001\t2100\t.\t+\t.\tID=te1;Order=gene;Superfamily=gene\n')
+		out_dir = os.path.join(self.tmpdir, 'out')
+		testArgs = ['differannotate', '-C', control, '-T', self.gff3_2, '-N', 'treat', '-p', '99', '--temd', \
+			'--export-dir', out_dir]
+		with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO):
+			differannotate.main()
+		records = {}
+		for category in ('element', 'order', 'sufam'):
+			with open(os.path.join(out_dir, 'treat', '%s_gene_B_fn.bed'%(category))) as IF:
+				records[category] = [l.split('\t')[3] for l in IF]
+		self.assertEqual(records['order'], ['te1'])
+		self.assertEqual(records['sufam'], ['te1'])
+		self.assertFalse('te1' in records['element'])
+		self.assertEqual(export.feature_exporter(out_dir, reader.gff3_interval(self.gff3_1, offsets=True)).path('a/b', 2, '', 'B', 'tp'), \
+			os.path.join(out_dir, 'a-b', 'order_none_B_tp.bed'))
+class TestSampling(unittest.TestCase):
+	def setUp(self):
+		tpath = os.path.dirname(__file__)
+		self.fa = os.path.join(tpath, 'test.fa')
+		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
+		self.gff3_2 = os.path.join(tpath, 'test_2.gff3')
+		self.GI = reader.gff3_interval(self.gff3_1, fasta=self.fa)
+		self.GI.add_gff3(self.gff3_2, 'treat')
+	def test_allocate(self):
+		self.assertEqual(sampling.allocate([2000, 20], 101), [100, 1])
+		self.assertEqual(sampling.allocate([2000, 20], 10**6), [2000, 20])
+		pos = sampling.stratified_positions(2000, 100, np.random.RandomState(0))
+		self.assertTrue(np.array_equal(pos//20, np.arange(100)))
+	def test_estimate(self):
+		# Sampling every base reproduces the exact counts
+		exact = summaries.base_metrics(self.GI, temd=True)
+		ret = sampling.estimate_base(self.GI, 10**6, temd=True)
+		for r, (chrom, sstr, category, elem) in enumerate(ret.rows):
+			rows = [exact.row((c, sstr, category, elem)) for c in sorted(self.GI.get_chrom_set())]
+			for n in ret.count_names:
+				self.assertEqual(ret[n][r].tolist(), exact[n][rows].sum(0).tolist())
+				self.assertEqual(ret.sampled[n][r].tolist(), ret[n][r].tolist())
+		ret = sampling.estimate_base(self.GI, 200, seed=3)
+		self.assertTrue(np.array_equal(ret['tp'], sampling.estimate_base(self.GI, 200, seed=3)['tp']))
+		r = ret.row(('All', '+/-', 'Element', 'gene'))
+		self.assertEqual(sum([ret.sampled[n][r] for n in ret.count_names]).tolist(), [200, 200])
+		lo, hi = ret.interval('sensitivity')
+		self.assertTrue(lo[r,1] <= ret.sensitivity[r,1] <= hi[r,1])
+		self.assertTrue(0 <= lo[r,1] and hi[r,1] <= 1)
+	def test_cli(self):
+		testArgs = ['differannotate', '-C', self.gff3_1, '-R', self.fa, '-T', self.gff3_2, '-N', 'treat', \
+			'--sample-bases', '500', '--seed', '1']
+		outputs = []
+		for i in range(2):
+			with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO) as out:
+				differannotate.main()
+			outputs.append(out.getvalue())
+		self.assertEqual(outputs[0], outputs[1])
+		self.assertTrue('SENS_CI' in outputs[0])
+class TestBootstrap(unittest.TestCase):
+	def setUp(self):
+		tpath = os.path.dirname(__file__)
+		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
+		self.gff3_2 = os.path.join(tpath, 'test_2.gff3')
+		self.GI = reader.gff3_interval(self.gff3_1, treatments=[(self.gff3_2, 'treat')])
+	def test_block_type(self):
+		self.assertEqual([bootstrap.block_type(x) for x in ('feature', 'chrom', '500')], [None, 'chrom', 500])
+		with self.assertRaises(argparse.ArgumentTypeError):
+			bootstrap.block_type('0')
+	def test_intervals(self):
+		exact = summaries.region_metrics(self.GI, 90, temd=True)
+		chroms = sorted(self.GI.get_chrom_set())
+		for block in (None, 'chrom', 100):
+			ret = bootstrap.region_intervals(self.GI, 500, 90, temd=True, block=block, seed=2)
+			self.assertEqual(ret.replicates['sensitivity'].shape, (len(ret.rows), 2, 500))
+			for r, (chrom, sstr, category, elem) in enumerate(ret.rows):
+				rows = [exact.row((c, sstr, category, elem)) for c in chroms]
+				for n in ret.count_names:
+					self.assertEqual(ret[n][r].tolist(), exact[n][rows].sum(0).tolist())
+			for stat in ('sensitivity', 'precision'):
+				lo, hi = ret.interval(stat)
+				est = getattr(ret, stat)
+				ok = ~np.isnan(est)
+				self.assertTrue(np.all(lo[ok] <= est[ok]+1e-6) and np.all(est[ok] <= hi[ok]+1e-6))
+		# Matched pairs share the weight of their control feature in every treatment
+		GI = reader.gff3_interval(self.gff3_1, treatments=[(self.gff3_2, 'treat'), (self.gff3_2, 'copy')])
+		ret = bootstrap.region_intervals(GI, 200, 90, seed=3)
+		for stat in ('sensitivity', 'precision'):
+			A, B = ret.replicates[stat][:,1], ret.replicates[stat][:,2]
+			self.assertTrue(np.array_equal(np.isnan(A), np.isnan(B)))
+			self.assertTrue(np.array_equal(np.nan_to_num(A), np.nan_to_num(B)))
+		self.assertTrue(np.nanstd(ret.replicates['sensitivity'][:,1]) > 0)
+		# Replicates only depend on the seed
+		A = bootstrap.region_intervals(self.GI, 2500, 90, block=100, seed=5, procs=2)
+		B = bootstrap.region_intervals(self.GI, 2500, 90, block=100, seed=5)
+		self.assertTrue(np.array_equal(np.isnan(A.replicates['precision']), np.isnan(B.replicates['precision'])))
+		self.assertTrue(np.array_equal(np.nan_to_num(A.replicates['precision']), np.nan_to_num(B.replicates['precision'])))
+	def _feature_parts(self, n, fp):
+		# Both strands and each strand of n matched or missed control features and fp false positives
+		rng = np.random.RandomState(0)
+		tp = rng.rand(n) < 0.8
+		C = np.zeros((n+fp, 2, 3), dtype=np.int64)
+		C[:n,0,0] = 1
+		C[:n,1,0] = tp
+		C[:n,1,1] = ~tp
+		C[n:,1,2] = 1
+		ids, strand = np.arange(n+fp), rng.randint(0, 2, n+fp)
+		return [(ids, C)]+[(ids[strand == s], C[strand == s]) for s in (0, 1)]
+	def test_collapse(self):
+		parts = self._feature_parts(2000, 400)
+		groups, sizes = bootstrap.collapse_units(parts)
+		self.assertEqual(len(sizes), 6)
+		self.assertEqual(sizes.sum(), 2400)
+		for (ids, C), (gids, G) in zip(parts, groups):
+			self.assertEqual(C.sum(axis=0).tolist(), G.sum(axis=0).tolist())
+		# Grouped weights have the distribution of per-feature weights
+		grouped = bootstrap.draw_replicates(parts, 4000, 2, seed=1, collapse=True)
+		single = bootstrap.draw_replicates(parts, 4000, 2, seed=2)
+		for A, B in zip(grouped, single):
+			self.assertTrue(np.allclose(np.nanmean(A[:,1], 1), np.nanmean(B[:,1], 1), atol=0.002))
+			self.assertTrue(np.allclose(np.nanstd(A[:,1], 1), np.nanstd(B[:,1], 1), rtol=0.1))
+	def test_feature_scale(self):
+		# 10,000 feature-level replicates of a million features
+		parts = self._feature_parts(10**6, 2*10**5)
+		start = time()
+		sen, pre = bootstrap.draw_replicates(parts, 10000, 2, seed=1, collapse=True)
+		self.assertTrue(time()-start < 60)
+		self.assertEqual(sen.shape, (3, 2, 10000))
+		self.assertTrue(0 < np.std(sen[0,1]) < 0.01)
+	def test_cli(self):
+		testArgs = ['differannotate', '-C', self.gff3_1, '-T', self.gff3_2, '-N', 'treat', \
+			'--bootstrap', '200', '--seed', '1', '--bootstrap-block', 'chrom']
+		outputs = []
+		for i in range(2):
+			with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO) as out:
+				differannotate.main()
+			outputs.append(out.getvalue())
+		self.assertEqual(outputs[0], outputs[1])
+		self.assertTrue('PREC_CI' in outputs[0])
+class TestMatching(unittest.TestCase):
+	def setUp(self):
+		import tempfile
+		self.tmpdir = tempfile.mkdtemp()
+		# Greedy matching gives q1 its first candidate h1, the only match of q2
+		control = [(1,100,'ID=q1'), (11,40,'ID=q2')]
+		treat = [(1,40,'ID=h1'), (51,100,'ID=h2')]
+		self.gff3_1 = os.path.join(self.tmpdir, 'control.gff3')
+		self.gff3_2 = os.path.join(self.tmpdir, 'treat.gff3')
+		for path, records in ((self.gff3_1, control), (self.gff3_2, treat)):
+			with open(path, 'w') as OF:
+				for r in records:
+					OF.write('Chr1\ttest\tgene\t%i\t%i\t.\t+\t.\t%s\n'%r)
+	def tearDown(self):
+		rmtree(self.tmpdir)
+	def _brute(self, edges, weights):
+		for k in range(len(edges), 0, -1):
+			best = None
+			for sub in itertools.combinations(range(len(edges)), k):
+				if len(set([edges[i][0] for i in sub])) == k and len(set([edges[i][1] for i in sub])) == k:
+					best = max(best, sum([weights[i] for i in sub]))
+			if best is not None:
+				return k, best
+		return 0, 0
+	def test_maximum_matching(self):
+		rng = np.random.RandomState(0)
+		for t in range(100):
+			edges = sorted(set(zip(rng.randint(0, 5, 8), rng.randint(0, 5, 8))))
+			weights = rng.randint(0, 20, len(edges))
+			L, R = [e[0] for e in edges], [e[1] for e in edges]
+			k, best = self._brute(edges, weights)
+			for W in (None, weights):
+				a, b = matching.maximum_matching(L, R, W)
+				self.assertEqual(len(set(a)), len(a))
+				self.assertEqual(len(set(b)), len(b))
+				self.assertTrue(set(zip(a, b)) <= set(edges))
+				self.assertEqual(len(a), k)
+			chosen = dict(zip(edges, weights))
+			self.assertEqual(sum([chosen[e] for e in zip(a, b)]), best)
+		self.assertEqual(list(matching.components([0, 1, 2], [0, 0, 1])), [0, 0, 2])
+		self.assertEqual(list(matching.assignment(np.array([[3, 2, 0], [2, 0, 0]]))), [1, 0])
+	def test_region(self):
+		GI = reader.gff3_interval(self.gff3_1, treatments=[(self.gff3_2, 'treat')])
+		self.assertEqual(GI.calc_intersect_2('Chr1', 'control', 'treat', 'gene', 1, 30), (1, 1, 1))
+		for mode in ('optimal', 'optimal-overlap'):
+			MC = comparisons.match_criterion(30, matching=mode)
+			self.assertEqual(GI.calc_intersect_2('Chr1', 'control', 'treat', 'gene', 1, MC), (0, 0, 2))
+		self.assertEqual(MC.key(), [30, None, 'percent', 'optimal-overlap'])
+		with self.assertRaises(ValueError):
+			comparisons.match_criterion(30, matching='best')
+class TestShared(unittest.TestCase):
+	def setUp(self):
+		tpath = os.path.dirname(__file__)
+		self.fa = os.path.join(tpath, 'test.fa')
+		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
+		self.gff3_2 = os.path.join(tpath, 'test_2.gff3')
+		self.GI = reader.gff3_interval(self.gff3_1, fasta=self.fa)
+		self.GI.add_gff3(self.gff3_2, 'treat')
+	def _segments(self):
+		return set(glob(os.path.join(shared.SHM_DIR, 'differannotate_%i_*'%(os.getpid()))))
+	def test_workers(self):
+		before = self._segments()
+		for strategy in ('dense', 'intervals'):
+			serial = summaries.base_metrics(self.GI, temd=True, plan=planner.execution_plan(strategy))
+			ret = summaries.base_metrics(self.GI, temd=True, plan=planner.execution_plan(strategy, workers=2))
+			self.assertEqual(ret.rows, serial.rows)
+			for n in ret.count_names:
+				self.assertTrue(np.array_equal(ret[n], serial[n]))
+			for key in serial.membership:
+				for a, b in zip(ret.membership[key], serial.membership[key]):
+					self.assertEqual(a.tolist(), b.tolist())
+		self.assertEqual(self._segments(), before)
+	def test_cleanup(self):
+		before = self._segments()
+		with self.assertRaises(ValueError):
+			with shared.shared_arrays() as SA:
+				desc, view = SA.empty((2, 10))
+				view[1,3:5] = 1
+				self.assertEqual(shared.attach(desc).sum(), 2)
+				self.assertFalse(shared.attach(desc).flags.writeable)
+				raise ValueError
+		self.assertEqual(self._segments(), before)
+	def test_exit_handlers(self):
+		import atexit, gc
+		before = self._segments()
+		handlers = len(atexit._exithandlers)
+		for i in range(10):
+			shared.shared_arrays().put(np.arange(4))
+		gc.collect()
+		# One module handler, and collected owners unlink their segments
+		self.assertEqual(len(atexit._exithandlers), handlers)
+		self.assertEqual(len(shared._LIVE), 0)
+		self.assertEqual(self._segments(), before)
+		SA = shared.shared_arrays()
+		SA.put(np.arange(4))
+		self.assertEqual(len(self._segments()), len(before)+1)
+		shared._close_all()
+		self.assertEqual(self._segments(), before)
+class TestWindows(unittest.TestCase):
+	def setUp(self):
+		tpath = os.path.dirname(__file__)
+		self.fa = os.path.join(tpath, 'test.fa')
+		self.gff3_1 = os.path.join(tpath, 'test_1.gff3')
+		self.gff3_2 = os.path.join(tpath, 'test_2.gff3')
+		self.GI = reader.gff3_interval(self.gff3_1, fasta=self.fa)
+		self.GI.add_gff3(self.gff3_2, 'treat')
+	def test_prefix_counts(self):
+		starts, ends = windows.window_edges(2000, 300, 125)
+		for elem in self.GI.element_dict:
+			eid = self.GI.element_dict[elem]
+			A, _ = self.GI.elem_array('Chr1', eid, 1, False)
+			PC = windows.prefix_counts(self.GI.elem_intervals('Chr1', eid, 1), 2000)
+			counts = PC.window_counts(starts, ends)
+			for w, (s, e) in enumerate(zip(starts, ends)):
+				c, t = A[0,s:e], A[1,s:e]
+				expected = [(c&t).sum(), (~c&t).sum(), (~c&~t).sum(), (c&~t).sum()]
+				self.assertEqual(counts[:,w,1].tolist(), expected)
+			self.assertEqual(PC.at([2000])[:,0,0].sum(), 2000)
+	def test_cli(self):
+		testArgs = ['differannotate', '-C', self.gff3_1, '-R', self.fa, '-T', self.gff3_2, '-N', 'treat', \
+			'--window', '500', '--step', '250']
+		with patch('sys.argv', testArgs), patch('sys.stdout', new_callable=StringIO) as out:
+			differannotate.main()
+		with open('window_element_gene_treat.tsv') as IF:
+			lines = [l.rstrip('\n').split('\t') for l in IF]
+		self.assertEqual(lines[0][:6], ['chrom', 'start', 'end', 'tp', 'fp', 'tn'])
+		self.assertEqual([l[:3] for l in lines[1:4]], [['Chr1','0','500'], ['Chr1','250','750'], ['Chr1','500','1000']])
+		self.assertEqual(lines[1][3:7], ['100', '0', '400', '0'])
+		with open('window_element_gene_treat.bedgraph') as IF:
+			bedgraph = IF.readlines()
+		self.assertEqual(bedgraph[1], 'Chr1\t0\t250\t1.0000\n')
+		# Orders and superfamilies with the same name get their own tracks
+		files = windows.tracks(self.GI, 500, temd=True)
+		self.assertEqual(len(files), len(set(files)))
+		self.assertTrue('window_order_LTR_treat.tsv' in files)
+		self.assertEqual(windows.track_name('a b/c'), 'a-b-c')
+		for f in glob('window_*.tsv')+glob('window_*.bedgraph'):
+			os.remove(f)
 #	def test_train_cli_01(self):
 #		if not self.test_model: return
 #		testArgs = ['teamRNN', \